@@ -3,7 +3,6 @@ import functools
 import json
 import logging
 import os
-import re
 import shutil
 import subprocess
 import sys
@@ -17,20 +16,24 @@ import click
 
 # imports - module imports
 import chair
-from chair.exceptions import NotInChairDirectoryError
+from chair.exceptions import CommandFailedError, NotInChairDirectoryError, ValidationError
 from chair.utils import (
+	exec_cmds,
 	fetch_details_from_tag,
 	get_available_folder_name,
 	is_chair_directory,
 	is_git_url,
+	is_offline,
 	is_valid_vmraid_branch,
 	log,
+	run_in_parallel,
 	run_vmraid_cmd,
 )
 from chair.utils.chair import (
 	build_assets,
 	install_python_dev_dependencies,
 )
+from chair.utils.git_cache import add_git_cache_dependent, sync_git_cache, update_git_cache
 from chair.utils.render import step
 
 if typing.TYPE_CHECKING:
@@ -38,6 +41,12 @@ if typing.TYPE_CHECKING:
 
 
 logger = logging.getLogger(chair.PROJECT_NAME)
+# number of apps pulled concurrently, unless set by pull_jobs in common_site_config
+DEFAULT_PULL_JOBS = 4
+# number of dependency manifests fetched concurrently while resolving an app
+DEFAULT_RESOLVE_JOBS = 8
+# number of apps' node dependencies installed concurrently, unless set by node_jobs in common_site_config
+DEFAULT_NODE_JOBS = 4
 
 
 class AppMeta:
@@ -151,6 +160,7 @@ class App(AppMeta):
 		self.chair = chair
 		self.required_by = None
 		self.local_resolution = []
+		self._dependencies = None
 		super().__init__(name, branch, *args, **kwargs)
 
 	@step(title="Fetching App {repo}", success="App {repo} Fetched")
@@ -162,10 +172,35 @@ class App(AppMeta):
 		click.secho(fetch_txt, fg="yellow")
 		logger.log(fetch_txt)
 
+		if is_offline():
+			return self._get_from_git_cache(branch)
+
+		# borrow objects from the host's mirror of the repo instead of fetching &
+		# storing them again for every chair
+		mirror = update_git_cache(self.url) if self.chair.conf.get("use_git_cache") else None
+		reference = f"--reference-if-able {mirror}" if mirror else ""
+
+		self.chair.run(
+			f"git clone {self.url} {branch} {shallow} {reference} --origin upstream",
+			cwd=os.path.join(self.chair.name, "apps"),
+		)
+
+		if mirror:
+			add_git_cache_dependent(mirror, os.path.join(self.chair.name, "apps", self.repo))
+
+	def _get_from_git_cache(self, branch):
+		from chair.utils.git_cache import get_git_cache_path
+
+		mirror = get_git_cache_path(self.url)
+		if not (mirror and os.path.exists(mirror)):
+			raise FileNotFoundError(f"{self.url} isn't in the git cache, it can't be fetched offline")
+
 		self.chair.run(
-			f"git clone {self.url} {branch} {shallow} --origin upstream",
+			f"git clone {mirror} {self.repo} {branch} --origin upstream",
 			cwd=os.path.join(self.chair.name, "apps"),
 		)
+		app_path = os.path.join(self.chair.name, "apps", self.repo)
+		self.chair.run(f"git remote set-url upstream {self.url}", cwd=app_path)
 
 	@step(title="Archiving App {repo}", success="App {repo} Archived")
 	def remove(self):
@@ -216,6 +251,11 @@ class App(AppMeta):
 		self.chair.run(f"{self.chair.python} -m pip uninstall -y {self.repo}")
 
 	def _get_dependencies(self):
+		if self._dependencies is None:
+			self._dependencies = self._read_dependencies()
+		return self._dependencies
+
+	def _read_dependencies(self):
 		from chair.utils.app import get_required_deps, required_apps_from_hooks
 
 		if self.on_disk:
@@ -227,7 +267,11 @@ class App(AppMeta):
 		try:
 			required_deps = get_required_deps(self.org, self.repo, self.tag or self.branch)
 			return required_apps_from_hooks(required_deps)
-		except Exception:
+		except Exception as e:
+			# resolving offline without an app's dependencies would silently skip them
+			if is_offline():
+				raise
+			click.secho(f"Couldn't get dependencies of {self.name}, skipping them: {e}", fg="yellow")
 			return []
 
 	def update_app_state(self):
@@ -236,10 +280,47 @@ class App(AppMeta):
 		chair.apps.sync(self.name, self.tag, self.local_resolution)
 
 
+def fetch_dependencies(app: App, chair: "Chair"):
+	"""Gets the dependencies of the app & its dependencies, recursively, a level of
+	the graph at a time. The manifests of a level are fetched concurrently, then its
+	dependencies are looked up & their branches validated concurrently, so that
+	make_resolution_plan only reads cached results."""
+	level, seen = [app], {app.repo}
+
+	while level:
+		app_names = []
+
+		for _, dependencies in run_in_parallel(
+			lambda _app: _app._get_dependencies(), level, jobs=DEFAULT_RESOLVE_JOBS
+		):
+			app_names.extend(app_name for app_name in dependencies if app_name not in app_names)
+
+		level = []
+
+		for _, dep_app in run_in_parallel(
+			lambda app_name: get_dependency_app(app_name, chair), app_names, jobs=DEFAULT_RESOLVE_JOBS
+		):
+			if dep_app.repo not in seen:
+				seen.add(dep_app.repo)
+				level.append(dep_app)
+
+
+def get_dependency_app(app_name: str, chair: "Chair") -> App:
+	"""Looks up the dependency's repo & validates its branch, both cached for the
+	rest of the resolution"""
+	dep_app = App(app_name, chair=chair)
+	is_valid_vmraid_branch(dep_app.url, dep_app.branch)
+	return dep_app
+
+
 def make_resolution_plan(app: App, chair: "Chair"):
 	"""
 	decide what apps and versions to install and in what order
 	"""
+	if not app.required_by:
+		# the plan is made depth first, prefetch the whole graph breadth first
+		fetch_dependencies(app, chair)
+
 	resolution = OrderedDict()
 	resolution[app.repo] = app
 
@@ -321,6 +402,7 @@ def get_app(
 	overwrite=False,
 	init_chair=False,
 	resolve_deps=False,
+	locked=False,
 ):
 	"""chair get-app clones a VMRaid App from remote (GitHub or any other git server),
 	and installs it on the current chair. This also resolves dependencies based on the
@@ -328,6 +410,9 @@ def get_app(
 
 	If the chair_path is not a chair directory, a new chair is created named using the
 	git_url parameter.
+
+	If locked is set, the app and its dependencies are installed at the commits pinned
+	in the chair's chair.lock instead.
 	"""
 	import chair as _chair
 	import chair.cli as chair_cli
@@ -335,6 +420,10 @@ def get_app(
 	from chair.utils.app import check_existing_dir
 
 	chair = Chair(chair_path)
+
+	if locked:
+		return get_locked_app(git_url, chair, skip_assets=skip_assets, verbose=verbose)
+
 	app = App(git_url, branch=branch, chair=chair)
 	git_url = app.url
 	repo_name = app.repo
@@ -417,6 +506,117 @@ def get_app(
 		app.install(verbose=verbose, skip_assets=skip_assets, restart_chair=restart_chair)
 
 
+def get_locked_app(name, chair: "Chair", skip_assets=False, verbose=False):
+	"""Installs the app, matched by name or url, along with the dependencies it was
+	resolved with, at the commits pinned in the chair's chair.lock"""
+	lock_path = chair.apps.lock_path
+	strip_url = lambda url: (url or "").rstrip("/").rsplit(".git", 1)[0]
+
+	for locked_app in read_lock(lock_path):
+		if name == locked_app["name"] or strip_url(name) == strip_url(locked_app["url"]):
+			break
+	else:
+		raise ValidationError(f"{name} not found in {lock_path}")
+
+	apps = set(locked_app["required"]) | {locked_app["name"]}
+	install_apps_from_lock(
+		lock_path, apps=apps, chair_path=chair.name, skip_assets=skip_assets, verbose=verbose
+	)
+	chair.reload()
+
+
+def read_lock(lock_path) -> typing.List[typing.Dict]:
+	with open(lock_path) as f:
+		return json.load(f)["apps"]
+
+
+def install_apps_from_lock(
+	lock_path, apps=None, chair_path=".", skip_assets=False, verbose=False
+):
+	"""Clones the apps (all by default) at the commits pinned in the lock file, in
+	parallel & shallow if the chair clones shallow, and installs them in the locked
+	order. Nothing is resolved against remotes."""
+	from chair.chair import Chair
+	from chair.utils.app import get_app_name
+
+	chair = Chair(chair_path)
+	locked_apps = [
+		locked_app for locked_app in read_lock(lock_path) if not apps or locked_app["name"] in apps
+	]
+
+	if apps:
+		missing = set(apps) - {locked_app["name"] for locked_app in locked_apps}
+		if missing:
+			raise ValidationError(f"{', '.join(missing)} not found in {lock_path}")
+
+	depth = "--depth 1" if chair.shallow_clone else ""
+	clone_cmds = OrderedDict()
+
+	for locked_app in locked_apps:
+		app, url, commit = locked_app["name"], locked_app["url"], locked_app["commit"]
+
+		if os.path.exists(get_repo_dir(app, chair_path=chair_path)):
+			click.secho(f"{app} already exists in chair, skipping", fg="yellow")
+			continue
+
+		if not (url and commit):
+			raise ValidationError(f"{app} isn't pinned to a remote commit in {lock_path}")
+
+		source = url
+		if is_offline():
+			from chair.utils.git_cache import get_git_cache_path
+
+			source = get_git_cache_path(url)
+			if not (source and os.path.exists(source)):
+				raise ValidationError(f"{app} ({url}) isn't in the git cache, it can't be fetched offline")
+
+		branch = locked_app["branch"] or "locked"
+		clone_cmds[app] = [
+			f"git init --quiet {app}",
+			f"git -C {app} remote add upstream {url}",
+			f"git -C {app} fetch --quiet {depth} {source} {commit}",
+			f"git -C {app} checkout --quiet -B {branch} {commit}",
+			f"git -C {app} config branch.{branch}.remote upstream",
+			f"git -C {app} config branch.{branch}.merge refs/heads/{branch}",
+		]
+
+	apps_dir = os.path.join(chair_path, "apps")
+	os.makedirs(apps_dir, exist_ok=True)
+	jobs = chair.conf.get("pull_jobs") or DEFAULT_PULL_JOBS
+	failed = []
+
+	for app, (results, failed_cmd) in run_in_parallel(
+		lambda app: exec_cmds(clone_cmds[app], cwd=apps_dir), list(clone_cmds), jobs=jobs
+	):
+		click.secho(f"Fetched {app}" if not failed_cmd else f"Couldn't fetch {app}", fg="yellow")
+		for cmd, output in results:
+			if output:
+				click.secho(f"$ {cmd}", fg="bright_black")
+				click.echo(output, nl=False)
+		if failed_cmd:
+			failed.append(app)
+
+	if failed:
+		raise CommandFailedError(f"Failed to fetch {', '.join(failed)} from {lock_path}")
+
+	for locked_app in locked_apps:
+		if locked_app["name"] not in clone_cmds:
+			continue
+
+		install_app(
+			app=get_app_name(chair_path, locked_app["name"]),
+			tag=locked_app["branch"],
+			chair_path=chair_path,
+			verbose=verbose,
+			skip_assets=True,
+			restart_chair=False,
+			resolution=locked_app["required"],
+		)
+
+	if not skip_assets:
+		build_assets(chair_path=chair_path)
+
+
 def install_resolved_deps(
 	chair,
 	resolution,
@@ -513,6 +713,8 @@ def install_app(
 ):
 	import chair.cli as chair_cli
 	from chair.chair import Chair
+	from chair.utils.chair import get_requirements_hash, update_yarn_packages
+	from chair.utils.wheels import build_wheels, get_wheelhouse_flags
 
 	install_text = f"Installing {app}"
 	click.secho(install_text, fg="yellow")
@@ -527,13 +729,21 @@ def install_app(
 
 	app_path = os.path.realpath(os.path.join(chair_path, "apps", app))
 
-	chair.run(f"{chair.python} -m pip install {quiet_flag} --upgrade -e {app_path} {cache_flag}")
+	build_wheels(chair.python, [app_path], chair_path=chair_path, verbose=verbose)
+	wheelhouse_flags = get_wheelhouse_flags(chair_path)
+	chair.run(
+		f"{chair.python} -m pip install {quiet_flag} --upgrade {wheelhouse_flags} -e {app_path} {cache_flag}"
+	)
 
 	if conf.get("developer_mode"):
 		install_python_dev_dependencies(apps=app, chair_path=chair_path, verbose=verbose)
 
+	chair.index.set_requirements_hashes(
+		{app: get_requirements_hash(app_path, dev=bool(conf.get("developer_mode")))}
+	)
+
 	if os.path.exists(os.path.join(app_path, "package.json")):
-		chair.run("yarn install", cwd=app_path)
+		update_yarn_packages(chair_path=chair_path, apps=[app])
 
 	chair.apps.sync(app, required=resolution, branch=tag)
 
@@ -559,26 +769,29 @@ def pull_apps(apps=None, chair_path=".", reset=False):
 		for app in apps:
 			if app in excluded_apps:
 				print(f"Skipping reset for app {app}")
-				continue
-			app_dir = get_repo_dir(app, chair_path=chair_path)
-			if os.path.exists(os.path.join(app_dir, ".git")):
-				out = subprocess.check_output("git status", shell=True, cwd=app_dir)
-				out = out.decode("utf-8")
-				if not re.search(r"nothing to commit, working (directory|tree) clean", out):
-					print(
-						f"""
 
-Cannot proceed with update: You have local changes in app "{app}" that are not committed.
+		dirty_apps = get_dirty_apps(
+			[app for app in apps if app not in excluded_apps], chair_path=chair_path
+		)
+
+		if dirty_apps:
+			print_dirty_apps(dirty_apps)
+			print(
+				"""
+Cannot proceed with update: You have local changes that are not committed.
 
 Here are your choices:
 
-1. Merge the {app} app manually with "git pull" / "git pull --rebase" and fix conflicts.
+1. Merge the apps manually with "git pull" / "git pull --rebase" and fix conflicts.
 1. Temporarily remove your changes with "git stash" or discard them completely
 	with "chair update --reset" or for individual repositries "git reset --hard"
 2. If your changes are helpful for others, send in a pull request via GitHub and
 	wait for them to be merged in the core."""
-					)
-					sys.exit(1)
+			)
+			sys.exit(1)
+
+	pull_cmds = OrderedDict()
+	remotes = {}
 
 	for app in apps:
 		if app in excluded_apps:
@@ -586,7 +799,7 @@ Here are your choices:
 			continue
 		app_dir = get_repo_dir(app, chair_path=chair_path)
 		if os.path.exists(os.path.join(app_dir, ".git")):
-			remote = get_remote(app)
+			remote = get_remote(app, chair_path=chair_path)
 			if not remote:
 				# remote is False, i.e. remote doesn't exist, add the app to excluded_apps.txt
 				add_to_excluded_apps_txt(app, chair_path=chair_path)
@@ -596,28 +809,111 @@ Here are your choices:
 				)
 				continue
 
+			cmds = pull_cmds[app] = []
+			remotes[app] = remote
+
 			if not chair.conf.get("shallow_clone") or not reset:
 				is_shallow = os.path.exists(os.path.join(app_dir, ".git", "shallow"))
 				if is_shallow:
 					s = " to safely pull remote changes." if not reset else ""
 					print(f"Unshallowing {app}{s}")
-					chair.run(f"git fetch {remote} --unshallow", cwd=app_dir)
+					cmds.append(f"git fetch {remote} --unshallow")
 
 			branch = get_current_branch(app, chair_path=chair_path)
-			logger.log(f"pulling {app}")
 			if reset:
 				reset_cmd = f"git reset --hard {remote}/{branch}"
 				if chair.conf.get("shallow_clone"):
-					chair.run(f"git fetch --depth=1 --no-tags {remote} {branch}", cwd=app_dir)
-					chair.run(reset_cmd, cwd=app_dir)
-					chair.run("git reflog expire --all", cwd=app_dir)
-					chair.run("git gc --prune=all", cwd=app_dir)
+					cmds.extend(
+						[
+							f"git fetch --depth=1 --no-tags {remote} {branch}",
+							reset_cmd,
+							"git reflog expire --all",
+							"git gc --prune=all",
+						]
+					)
 				else:
-					chair.run("git fetch --all", cwd=app_dir)
-					chair.run(reset_cmd, cwd=app_dir)
+					cmds.extend(["git fetch --all", reset_cmd])
 			else:
-				chair.run(f"git pull {rebase} {remote} {branch}", cwd=app_dir)
-			chair.run('find . -name "*.pyc" -delete', cwd=app_dir)
+				cmds.append(f"git pull {rebase} {remote} {branch}")
+			cmds.append('find . -name "*.pyc" -delete')
+
+	# network bound, so apps are pulled concurrently with their output buffered
+	# and printed in the order of apps
+	jobs = chair.conf.get("pull_jobs") or DEFAULT_PULL_JOBS
+	failed = OrderedDict()
+
+	use_git_cache = chair.conf.get("use_git_cache")
+
+	def _pull(app):
+		app_dir = get_repo_dir(app, chair_path=chair_path)
+		if use_git_cache:
+			sync_git_cache(app_dir, remote=remotes[app])
+		return exec_cmds(pull_cmds[app], cwd=app_dir)
+
+	for app, (results, failed_cmd) in run_in_parallel(_pull, list(pull_cmds), jobs=jobs):
+		logger.log(f"pulling {app}")
+		for cmd, output in results:
+			click.secho(f"$ {cmd}", fg="bright_black")
+			click.echo(output, nl=False)
+		if failed_cmd:
+			failed[app] = failed_cmd
+
+	if failed:
+		click.secho(f"\nFailed to pull {len(failed)} of {len(pull_cmds)} apps:", fg="red")
+		for app, cmd in failed.items():
+			click.secho(f"  {app}: {cmd}", fg="red")
+		raise CommandFailedError(f"Failed to pull {', '.join(failed)}")
+
+
+def get_dirty_files(app, chair_path=".") -> typing.List[str]:
+	"""Returns the uncommitted changes in the app's repo as `git status --porcelain`
+	entries"""
+	app_dir = get_repo_dir(app, chair_path=chair_path)
+
+	if not os.path.exists(os.path.join(app_dir, ".git")):
+		return []
+
+	# porcelain output skips the ahead/behind & hint computations of the human
+	# readable status, the untracked cache saves re-walking untracked directories
+	out = subprocess.check_output(
+		[
+			"git",
+			"-c",
+			"core.untrackedCache=true",
+			"status",
+			"--porcelain",
+			"-z",
+			"--no-renames",
+			"--ignore-submodules=dirty",
+		],
+		cwd=app_dir,
+	)
+
+	return [entry for entry in out.decode("utf-8").split("\0") if entry]
+
+
+def get_dirty_apps(apps, chair_path=".", jobs=None) -> "OrderedDict[str, typing.List[str]]":
+	"""Checks the apps for local changes in parallel, returns the dirty files of the
+	apps that have any"""
+	from chair.chair import Chair
+
+	jobs = jobs or Chair(chair_path).conf.get("pull_jobs") or DEFAULT_PULL_JOBS
+	dirty_apps = OrderedDict()
+
+	for app, files in run_in_parallel(
+		lambda app: get_dirty_files(app, chair_path=chair_path), list(apps), jobs=jobs
+	):
+		if files:
+			dirty_apps[app] = files
+
+	return dirty_apps
+
+
+def print_dirty_apps(dirty_apps):
+	for app, files in dirty_apps.items():
+		click.secho(f"{app} has {len(files)} uncommitted change(s):", fg="yellow")
+		for entry in files:
+			click.echo(f"  {entry}")
 
 
 def use_rq(chair_path):
@@ -1,12 +1,14 @@
 # imports - standard imports
 import subprocess
+import fcntl
 import functools
+import threading
 import os
 import shutil
 import json
-import sys
 import logging
-from typing import List, MutableSequence, TYPE_CHECKING, Union
+from contextlib import contextmanager
+from typing import Callable, List, MutableSequence, TYPE_CHECKING, Union
 
 # imports - module imports
 import chair
@@ -17,7 +19,6 @@ from chair.utils import (
 	exec_cmd,
 	is_chair_directory,
 	is_vmraid_app,
-	get_cmd_output,
 	get_git_version,
 	log,
 	run_vmraid_cmd,
@@ -30,6 +31,8 @@ from chair.utils.chair import (
 	remove_backups_crontab,
 	get_venv_path,
 	get_env_cmd,
+	get_installed_packages,
+	normalize_package_name,
 )
 from chair.utils.render import job, step
 from chair.utils.app import get_current_version
@@ -39,6 +42,8 @@ if TYPE_CHECKING:
 	from chair.app import App
 
 logger = logging.getLogger(chair.PROJECT_NAME)
+# key of the chair-wide entries of the ChairIndex in apps.json, next to the apps'
+INDEX_KEY = "__index__"
 
 
 class Base:
@@ -62,6 +67,7 @@ class Chair(Base, Validator):
 
 		self.setup = ChairSetup(self)
 		self.teardown = ChairTearDown(self)
+		self.index = ChairIndex(self)
 		self.apps = ChairApps(self)
 
 		self.apps_txt = os.path.join(self.name, "sites", "apps.txt")
@@ -83,19 +89,11 @@ class Chair(Base, Validator):
 
 	@property
 	def excluded_apps(self) -> List:
-		try:
-			with open(self.excluded_apps_txt) as f:
-				return f.read().strip().split("\n")
-		except Exception:
-			return []
+		return self.index.excluded_apps
 
 	@property
 	def sites(self) -> List:
-		return [
-			path
-			for path in os.listdir(os.path.join(self.name, "sites"))
-			if os.path.exists(os.path.join("sites", path, "site_config.json"))
-		]
+		return self.index.sites
 
 	@property
 	def conf(self):
@@ -129,9 +127,39 @@ class Chair(Base, Validator):
 		self.reload()
 
 	@step(title="Building Chair Assets", success="Chair Assets Built")
-	def build(self):
-		# build assets & stuff
-		run_vmraid_cmd("build", chair_path=self.name)
+	def build(self, apps: List = None, force=False):
+		"""Builds assets of all apps, or only of the given apps. Apps whose build
+		inputs didn't change since their last build are skipped, unless forced."""
+		from chair.utils.assets import (
+			cache_built_assets,
+			compress_assets,
+			plan_asset_build,
+			record_asset_build,
+			restore_cached_assets,
+		)
+		from chair.utils.forkserver import vmraid_forkserver
+
+		apps, skipped, records = plan_asset_build(self, apps, force=force)
+
+		if skipped:
+			print(f"Assets of {', '.join(skipped)} are up to date, skipping their build")
+
+		# commits & dirty states of apps are looked up once for restoring & caching
+		revisions = {}
+		apps = restore_cached_assets(self, apps, revisions)
+
+		if apps is None:
+			run_vmraid_cmd("build", chair_path=self.name)
+
+		elif apps:
+			with vmraid_forkserver(self.name):
+				for app in apps:
+					run_vmraid_cmd("build", "--app", app, chair_path=self.name)
+
+		built = list(self.apps) if apps is None else apps
+		compress_assets(self, built)
+		cache_built_assets(self, built, revisions)
+		record_asset_build(self, records)
 
 	@step(title="Reloading Chair Processes", success="Chair Processes Reloaded")
 	def reload(self, web=False, supervisor=True, systemd=True):
@@ -159,7 +187,11 @@ class ChairApps(MutableSequence):
 	def __init__(self, chair: Chair):
 		self.chair = chair
 		self.states_path = os.path.join(self.chair.name, "sites", "apps.json")
+		self.lock_path = os.path.join(self.chair.name, "sites", "chair.lock")
 		self.apps_path = os.path.join(self.chair.name, "apps")
+		# held while states are changed or written, they're saved from thread pools too
+		self.states_lock = threading.RLock()
+		self._states_lock_file = None
 		self.initialize_apps()
 		self.set_states()
 
@@ -182,27 +214,26 @@ class ChairApps(MutableSequence):
 
 			print("Found existing apps updating states...")
 			for idx, app in enumerate(self.apps, start=1):
-				self.states[app] = {
+				self.states.setdefault(app, {}).update({
 					"resolution": {
 					"commit_hash": None,
 					"branch": None
 				},
 				"required": required,
 				"idx": idx,
-				"version": get_current_version(app, self.chair.name),
-				}
+				})
+				self.chair.index.update_app(app)
 
 		apps_to_remove = []
 		for app in self.states:
-			if app not in self.apps:
+			if app not in self.apps and app != INDEX_KEY:
 				apps_to_remove.append(app)
 
 		for app in apps_to_remove:
 			del self.states[app]
 
-		if app_name and app_name not in self.states:
-			version = get_current_version(app_name, self.chair.name)
-
+		# entries may only hold requirements hashes recorded while the app was installed
+		if app_name and "idx" not in self.states.get(app_name, {}):
 			app_dir = os.path.join(self.apps_path, app_name)
 			if not branch:
 				branch = (
@@ -214,33 +245,146 @@ class ChairApps(MutableSequence):
 
 			commit_hash = subprocess.check_output(f"git rev-parse {branch}", shell=True, cwd=app_dir).decode("utf-8").rstrip()
 
-			self.states[app_name] = {
+			self.states.setdefault(app_name, {}).update({
 				"resolution": {
 					"commit_hash":commit_hash,
 					"branch": branch
 				},
 				"required":required,
-				"idx":len(self.states) + 1,
-				"version": version,
-			}
+				"idx":len([app for app in self.states if "idx" in self.states[app]]) + 1,
+			})
+			self.chair.index.update_app(app_name)
+
+		self.write_states()
+
+	@contextmanager
+	def lock_states(self):
+		"""Held while apps.json is written, by threads of this process & by other chair
+		processes"""
+		with self.states_lock:
+			if self._states_lock_file:
+				yield
+				return
+
+			lock_path = os.path.join(os.path.dirname(self.states_path), ".apps.json.lock")
+
+			with open(lock_path, "w") as lock_file:
+				fcntl.flock(lock_file, fcntl.LOCK_EX)
+				self._states_lock_file = lock_file
+				try:
+					yield
+				finally:
+					self._states_lock_file = None
+					fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+	def write_states(self):
+		with self.lock_states():
+			self._write_states(self.states)
+
+	def update_states(self, update: Callable[[dict], None]):
+		"""Applies update to the states & to apps.json, which is read again under the
+		lock so that what other chair processes wrote since it was read here is kept.
+		Used to save what reads recompute, so apps.json isn't created by it."""
+		with self.states_lock:
+			update(self.states)
+
+			if not os.path.exists(self.states_path):
+				return
+
+			with self.lock_states():
+				try:
+					with open(self.states_path) as f:
+						states = json.loads(f.read() or "{}")
+				except (FileNotFoundError, ValueError):
+					return
+
+				update(states)
+				self._write_states(states)
+
+	def _write_states(self, states: dict):
+		import tempfile
+
+		# write & rename so that other chair processes never read a partial file
+		fd, tmp_path = tempfile.mkstemp(
+			prefix=".apps.json.", dir=os.path.dirname(self.states_path)
+		)
+		with os.fdopen(fd, "w") as f:
+			f.write(json.dumps(states, indent=4))
+		# mkstemp creates files only readable by the owner
+		os.chmod(tmp_path, get_mode(self.states_path, default=0o644))
+		os.replace(tmp_path, self.states_path)
+
+	def write_lock(self):
+		"""Pins the url, branch & commit of every app in sites/chair.lock, in the order
+		they were installed, so that the chair can be recreated elsewhere with
+		`chair init --from-lock`. Written when apps are installed, removed or updated,
+		and only if the pins changed."""
+		from chair.utils.app import get_remote_url
+
+		lock = {"apps": []}
+
+		apps = [app for app in self.states if "idx" in self.states[app]]
+
+		for app in sorted(apps, key=lambda app: self.states[app]["idx"]):
+			meta = self.chair.index.get_app(app)
+			lock["apps"].append(
+				{
+					"name": app,
+					"url": get_remote_url(app, chair_path=self.chair.name),
+					"branch": meta["branch"],
+					"commit": meta["commit_hash"],
+					"required": self.states[app].get("required", []),
+				}
+			)
 
-		with open(self.states_path, "w") as f:
-			f.write(json.dumps(self.states, indent=4))
+		contents = json.dumps(lock, indent=4)
+
+		try:
+			with open(self.lock_path) as f:
+				if f.read() == contents:
+					return
+		except FileNotFoundError:
+			pass
+
+		tmp_path = f"{self.lock_path}.{os.getpid()}.tmp"
+		with open(tmp_path, "w") as f:
+			f.write(contents)
+		os.replace(tmp_path, self.lock_path)
+
+	def get_changed_apps(self, apps: List = None) -> List:
+		"""Returns apps whose checked out commit differs from the commit_hash recorded
+		when they were last set up, or that don't have one recorded"""
+		apps = self.chair.get_installed_apps() if apps is None else apps
+		changed_apps = []
+
+		for app in apps:
+			commit_hash = self.states.get(app, {}).get("resolution", {}).get("commit_hash")
+			if not commit_hash or commit_hash != self.chair.index.get_app(app)["commit_hash"]:
+				changed_apps.append(app)
+
+		return changed_apps
+
+	def record_commit_hashes(self, apps: List = None):
+		"""Records the checked out commits of apps as set up, see get_changed_apps"""
+		apps = self.chair.get_installed_apps() if apps is None else apps
+
+		for app in apps:
+			if app in self.states:
+				resolution = self.states[app].setdefault("resolution", {})
+				resolution["commit_hash"] = self.chair.index.get_app(app)["commit_hash"]
+
+		self.write_states()
 
 	def sync(self,app_name: Union[str, None] = None, branch: Union[str, None] = None, required:List = []):
 		self.initialize_apps()
 		with open(self.chair.apps_txt, "w") as f:
 			f.write("\n".join(self.apps))
 		self.update_apps_states(app_name, branch, required)
+		self.write_lock()
 
 	def initialize_apps(self):
-		is_installed = lambda app: app in installed_packages
-
-		try:
-			installed_packages = get_cmd_output(f"{self.chair.python} -m pip freeze", cwd=self.chair.name)
-		except Exception:
-			self.apps = []
-			return
+		installed_packages = get_installed_packages(chair_path=self.chair.name)
+		is_installed = lambda app: normalize_package_name(app) in installed_packages
 
 		try:
 			self.apps = [
@@ -298,6 +442,196 @@ class ChairApps(MutableSequence):
 		return str([x for x in self.apps])
 
 
+class ChairIndex:
+	"""Metadata of the chair that is otherwise recomputed from the filesystem or
+	subprocesses on every access: each app's version, checked out branch & commit
+	hash, the hashes of its requirements when they were last installed, the chair's
+	sites & its excluded apps.
+
+	The index is kept in apps.json. App metadata is kept in the app's entry, where the
+	checked out branch & commit are stored under "checkout", apart from the commit
+	the app was last set up at under "resolution". Sites & excluded apps are kept
+	under INDEX_KEY. Entries are validated on read against the mtimes of the files
+	they were computed from (& the app's checked out commit), and stale entries are
+	recomputed & written back under the lock of apps.json, so the next process reads
+	them as they are. Reads don't create apps.json.
+	"""
+
+	def __init__(self, chair: Chair):
+		self.chair = chair
+		self.sites_path = os.path.join(self.chair.name, "sites")
+
+	@property
+	def states(self) -> dict:
+		return self.chair.apps.states
+
+	def save(self):
+		if os.path.isdir(self.sites_path):
+			self.chair.apps.write_states()
+
+	@property
+	def sites(self) -> List:
+		cached = self.states.get(INDEX_KEY, {}).get("sites")
+
+		if cached and self._is_valid_sites(cached):
+			return cached["sites"]
+
+		mtime = get_mtime(self.sites_path)
+		sites, others = [], []
+
+		for entry in os.scandir(self.sites_path):
+			if self._is_site(entry.name):
+				sites.append(entry.name)
+			elif entry.is_dir():
+				others.append(entry.name)
+
+		self._set_index("sites", {"mtime": mtime, "sites": sites, "others": others})
+
+		return sites
+
+	def _is_valid_sites(self, cached: dict) -> bool:
+		# a site's folder may be created before its site_config.json, so folders that
+		# weren't sites when indexed are re-checked along with the mtime of sites
+		if any(self._is_site(path) for path in cached["others"]):
+			return False
+
+		if cached["mtime"] == get_mtime(self.sites_path):
+			return True
+
+		# writing apps.json & other files in sites changes its mtime too, the sites are
+		# the same as long as the same folders are there
+		folders = {entry.name for entry in os.scandir(self.sites_path) if entry.is_dir()}
+		return folders == set(cached["sites"]) | set(cached["others"])
+
+	def _is_site(self, path: str) -> bool:
+		return os.path.exists(os.path.join(self.sites_path, path, "site_config.json"))
+
+	@property
+	def excluded_apps(self) -> List:
+		cached = self.states.get(INDEX_KEY, {}).get("excluded_apps")
+		mtime = get_mtime(self.chair.excluded_apps_txt)
+
+		if cached and cached["mtime"] == mtime:
+			return cached["apps"]
+
+		try:
+			with open(self.chair.excluded_apps_txt) as f:
+				apps = f.read().strip().split("\n")
+		except Exception:
+			apps = []
+
+		self._set_index("excluded_apps", {"mtime": mtime, "apps": apps})
+
+		return apps
+
+	def _set_index(self, key: str, entry: dict):
+		def update(states):
+			states.setdefault(INDEX_KEY, {})[key] = entry
+
+		self.chair.apps.update_states(update)
+
+	def get_app(self, app: str) -> dict:
+		"""Returns the version, branch & commit_hash of app, recomputing them only if the
+		app's checked out commit or version files changed since they were indexed"""
+		state = self.states.get(app, {})
+		checkout = state.get("checkout")
+
+		if checkout and checkout.get("key") == self._get_app_key(app):
+			return dict(checkout, version=state.get("version"))
+
+		meta = self._compute_app(app)
+
+		if app in self.states:
+
+			def update(states):
+				if app in states:
+					self._set_app(app, meta, states)
+
+			self.chair.apps.update_states(update)
+
+		return meta
+
+	def update_app(self, app: str) -> dict:
+		"""Recomputes the app's metadata & stores it in the app's entry, if it has one.
+		Returns the metadata, the caller saves."""
+		meta = self._compute_app(app)
+
+		if app in self.states:
+			self._set_app(app, meta)
+
+		return meta
+
+	def _set_app(self, app: str, meta: dict, states: dict = None):
+		states = self.states if states is None else states
+		states[app]["version"] = meta["version"]
+		states[app]["checkout"] = {
+			key: meta[key] for key in ("key", "branch", "commit_hash")
+		}
+
+	def _compute_app(self, app: str) -> dict:
+		from chair.utils.app import get_current_branch
+
+		key = self._get_app_key(app)
+		commit_hash = key[0]
+		branch = get_current_branch(app, self.chair.name) if commit_hash else None
+
+		return {
+			"key": key,
+			"version": get_current_version(app, self.chair.name),
+			# a detached HEAD isn't on any branch
+			"branch": branch if branch != "HEAD" else None,
+			"commit_hash": commit_hash or None,
+		}
+
+	def get_requirements_hash(self, app: str, node: bool = False) -> Union[str, None]:
+		"""Returns the hash of the app's python (or node) requirements when they were
+		last installed"""
+		return self.states.get(app, {}).get(
+			"node_requirements_hash" if node else "requirements_hash"
+		)
+
+	def set_requirements_hashes(self, requirements_hashes: dict, node: bool = False):
+		with self.chair.apps.states_lock:
+			for app, requirements_hash in requirements_hashes.items():
+				self.states.setdefault(app, {})[
+					"node_requirements_hash" if node else "requirements_hash"
+				] = requirements_hash
+			self.save()
+
+	def refresh(self, apps: List = None):
+		"""Re-validates indexed entries of apps (or all installed apps), get_app
+		writes back the ones that were stale"""
+		for app in apps or self.chair.apps:
+			self.get_app(app)
+
+	def _get_app_key(self, app: str) -> List:
+		from chair.utils import read_git_head
+
+		app_path = os.path.join(self.chair.name, "apps", app)
+		version_files = (
+			os.path.join(app_path, "setup.cfg"),
+			os.path.join(app_path, "setup.py"),
+			os.path.join(app_path, app, "__init__.py"),
+			os.path.join(app_path, ".git", "HEAD"),
+		)
+
+		return [read_git_head(app_path)] + [get_mtime(path) for path in version_files]
+
+
+def get_mtime(path: str) -> Union[int, None]:
+	try:
+		return os.stat(path).st_mtime_ns
+	except FileNotFoundError:
+		return None
+
+
+def get_mode(path: str, default: int) -> int:
+	try:
+		return os.stat(path).st_mode & 0o777
+	except FileNotFoundError:
+		return default
+
+
 class ChairSetup(Base):
 	def __init__(self, chair: Chair):
 		self.chair = chair
@@ -332,7 +666,11 @@ class ChairSetup(Base):
 		self.pip()
 
 		if os.path.exists(vmraid):
-			self.run(f"{self.chair.python} -m pip install {quiet_flag} --upgrade -e {vmraid}")
+			from chair.utils.wheels import build_wheels, get_wheelhouse_flags
+
+			build_wheels(self.chair.python, [vmraid], chair_path=self.chair.name, verbose=chair.cli.verbose)
+			wheelhouse_flags = get_wheelhouse_flags(self.chair.name)
+			self.run(f"{self.chair.python} -m pip install {quiet_flag} --upgrade {wheelhouse_flags} -e {vmraid}")
 
 	@step(title="Setting Up Chair Config", success="Chair Config Set Up")
 	def config(self, redis=True, procfile=True):
@@ -381,64 +719,109 @@ class ChairSetup(Base):
 		logger.log("setting up backups")
 
 		from crontab import CronTab
+		from chair.utils.chair import get_backup_job_commands, get_backup_job_minute
 
 		chair_dir = os.path.abspath(self.chair.name)
 		user = self.chair.conf.get("vmraid_user")
-		logfile = os.path.join(chair_dir, "logs", "backup.log")
 		system_crontab = CronTab(user=user)
-		backup_command = f"cd {chair_dir} && {sys.argv[0]} --verbose --site all backup"
-		job_command = f"{backup_command} >> {logfile} 2>&1"
+		job_command, *legacy_job_commands = get_backup_job_commands(chair_dir)
+
+		for legacy_job_command in legacy_job_commands:
+			system_crontab.remove_all(command=legacy_job_command)
 
 		if job_command not in str(system_crontab):
 			job = system_crontab.new(
 				command=job_command, comment="chair auto backups set for every 6 hours"
 			)
 			job.every(6).hours()
-			system_crontab.write()
+			job.minute.on(get_backup_job_minute(chair_dir))
+
+		system_crontab.write()
 
 		logger.log("backups were set up")
 
 	@job(title="Setting Up Chair Dependencies", success="Chair Dependencies Set Up")
-	def requirements(self, apps=None):
+	def requirements(self, apps=None, force=False):
 		"""Install and upgrade specified / all installed apps on given Chair
 		"""
-		from chair.app import App
-
 		if not apps:
 			apps = self.chair.get_installed_apps()
 
-		self.pip()
-
 		print(f"Installing {len(apps)} applications...")
 
-		for app in apps:
-			App(app, chair=self.chair, to_clone=False).install(
-				skip_assets=True, restart_chair=False, ignore_resolution=True
-			)
+		self.python(apps=apps, force=force)
+		self.node(apps=apps, force=force)
+		self.chair.apps.sync()
 
-	def python(self, apps=None):
+	def python(self, apps=None, force=False):
 		"""Install and upgrade Python dependencies for specified / all installed apps on given Chair
+
+		All apps are installed by a single pip run, so that requirements are resolved
+		once. Apps whose requirements haven't changed since they were last installed
+		are skipped, unless force is set.
 		"""
 		import chair.cli
+		from chair.utils.chair import get_requirements_hash
+		from chair.utils.wheels import build_wheels, get_wheelhouse_flags
 
 		if not apps:
 			apps = self.chair.get_installed_apps()
 
 		quiet_flag = "" if chair.cli.verbose else "--quiet"
+		dev = bool(self.chair.conf.get("developer_mode"))
+		installed_packages = get_installed_packages(chair_path=self.chair.name)
+		requirements_hashes = {}
+
+		for app in apps:
+			app_path = os.path.join(self.chair.name, "apps", app)
+			requirements_hash = get_requirements_hash(app_path, dev=dev)
+
+			if (
+				not force
+				and normalize_package_name(app) in installed_packages
+				and self.chair.index.get_requirements_hash(app) == requirements_hash
+			):
+				continue
+
+			requirements_hashes[app] = requirements_hash
+
+		if not requirements_hashes:
+			log("Python dependencies of all apps are up to date", level=3, no_log=True)
+			return
 
 		self.pip()
 
-		for app in apps:
+		packages, wheel_packages = [], []
+		for app in requirements_hashes:
 			app_path = os.path.join(self.chair.name, "apps", app)
-			log(f"\nInstalling python dependencies for {app}", level=3, no_log=True)
-			self.run(f"{self.chair.python} -m pip install {quiet_flag} --upgrade -e {app_path}")
+			packages.append(f"-e {app_path}")
+			wheel_packages.append(app_path)
+
+			dev_requirements_path = os.path.join(app_path, "dev-requirements.txt")
+			if dev and os.path.exists(dev_requirements_path):
+				packages.append(f"-r {dev_requirements_path}")
+				wheel_packages.extend(["-r", dev_requirements_path])
+
+		log(
+			f"\nInstalling python dependencies for {', '.join(requirements_hashes)}",
+			level=3,
+			no_log=True,
+		)
+		build_wheels(
+			self.chair.python, wheel_packages, chair_path=self.chair.name, verbose=chair.cli.verbose
+		)
+		wheelhouse_flags = get_wheelhouse_flags(self.chair.name)
+		self.run(
+			f"{self.chair.python} -m pip install {quiet_flag} --upgrade {wheelhouse_flags} {' '.join(packages)}"
+		)
+		self.chair.index.set_requirements_hashes(requirements_hashes)
 
-	def node(self, apps=None):
+	def node(self, apps=None, force=False):
 		"""Install and upgrade Node dependencies for specified / all apps on given Chair
 		"""
 		from chair.utils.chair import update_node_packages
 
-		return update_node_packages(chair_path=self.chair.name, apps=apps)
+		return update_node_packages(chair_path=self.chair.name, apps=apps, force=force)
 
 
 class ChairTearDown:
@@ -1,6 +1,5 @@
 # imports - standard imports
 import atexit
-import json
 import os
 import pwd
 import sys
@@ -10,21 +9,21 @@ import click
 
 # imports - module imports
 import chair
-from chair.chair import Chair
 from chair.commands import chair_command
 from chair.config.common_site_config import get_config
 from chair.utils import (
-	chair_cache_file,
 	check_latest_version,
 	drop_privileges,
 	find_parent_chair,
 	generate_command_cache,
+	get_cached_commands,
 	get_cmd_output,
 	is_chair_directory,
 	is_dist_editable,
 	is_root,
 	log,
 	setup_logging,
+	parse_fanout_argv,
 	parse_sys_argv,
 )
 from chair.utils.chair import get_env_cmd
@@ -95,13 +94,33 @@ def cli():
 			print(get_vmraid_help())
 			return
 
-		if (
-			sys_argv.commands.intersection(get_cached_vmraid_commands())
-			or sys_argv.commands.intersection(get_vmraid_commands())
-		):
+		fanout = parse_fanout_argv(sys.argv[1:])
+
+		if fanout:
+			from chair.utils.system import run_on_sites
+
+			jobs, args = fanout
+			sys.exit(run_on_sites(args, jobs=jobs))
+
+		from chair.daemon import is_chair_handled, query_daemon
+
+		route = query_daemon("route", argv=sys.argv[1:])
+
+		if route:
+			is_vmraid_cmd, is_app_cmd = route["vmraid_cmd"], route["app_cmd"]
+		else:
+			# chaird isn't running for this chair, resolve the route in this process
+			from chair.chair import Chair
+
+			is_vmraid_cmd = not is_chair_handled(sys.argv[1:]) and bool(
+				sys_argv.commands.intersection(get_vmraid_commands())
+			)
+			is_app_cmd = not is_vmraid_cmd and sys.argv[1] in Chair(".").apps
+
+		if is_vmraid_cmd:
 			vmraid_cmd()
 
-		if sys.argv[1] in Chair(".").apps:
+		if is_app_cmd:
 			app_cmd()
 
 	if not is_cli_command:
@@ -185,17 +204,17 @@ def vmraid_cmd(chair_path="."):
 	os.execv(f, [f] + ["-m", "vmraid.utils.chair_helper", "vmraid"] + sys.argv[1:])
 
 
-def get_cached_vmraid_commands():
-	if os.path.exists(chair_cache_file):
-		command_dump = open(chair_cache_file, "r").read() or "[]"
-		return set(json.loads(command_dump))
-	return set()
-
-
 def get_vmraid_commands():
+	"""Returns framework commands from the command cache, rebuilding it only if the
+	installed apps' fingerprint has changed since it was generated"""
 	if not is_chair_directory():
 		return set()
 
+	cached_commands = get_cached_commands()
+
+	if cached_commands is not None:
+		return cached_commands
+
 	return set(generate_command_cache())
 
 
@@ -227,6 +246,8 @@ def setup_clear_cache():
 	f = copy(os.chdir)
 
 	def _chdir(*args, **kwargs):
+		from chair.chair import Chair
+
 		Chair.cache_clear()
 		return f(*args, **kwargs)
 
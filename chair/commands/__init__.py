@@ -30,103 +30,63 @@ def chair_command(chair_path="."):
 	chair.set_vmraid_version(chair_path=chair_path)
 
 
-from chair.commands.make import (
-	drop,
-	exclude_app_for_update,
-	get_app,
-	include_app_for_update,
-	init,
-	new_app,
-	pip,
-	remove_app,
-)
-
-chair_command.add_command(init)
-chair_command.add_command(drop)
-chair_command.add_command(get_app)
-chair_command.add_command(new_app)
-chair_command.add_command(remove_app)
-chair_command.add_command(exclude_app_for_update)
-chair_command.add_command(include_app_for_update)
-chair_command.add_command(pip)
-
-
-from chair.commands.update import (
-	retry_upgrade,
-	switch_to_branch,
-	switch_to_develop,
-	update,
-)
-
-chair_command.add_command(update)
-chair_command.add_command(retry_upgrade)
-chair_command.add_command(switch_to_branch)
-chair_command.add_command(switch_to_develop)
-
-
-from chair.commands.utils import (
-	backup_all_sites,
-	backup_site,
-	chair_src,
-	clear_command_cache,
-	disable_production,
-	download_translations,
-	find_chaires,
-	generate_command_cache,
-	migrate_env,
-	prepare_beta_release,
-	release,
-	renew_lets_encrypt,
-	restart,
-	set_mariadb_host,
-	set_nginx_port,
-	set_redis_cache_host,
-	set_redis_queue_host,
-	set_redis_socketio_host,
-	set_ssl_certificate,
-	set_ssl_certificate_key,
-	set_url_root,
-	start,
-)
-
-chair_command.add_command(start)
-chair_command.add_command(restart)
-chair_command.add_command(set_nginx_port)
-chair_command.add_command(set_ssl_certificate)
-chair_command.add_command(set_ssl_certificate_key)
-chair_command.add_command(set_url_root)
-chair_command.add_command(set_mariadb_host)
-chair_command.add_command(set_redis_cache_host)
-chair_command.add_command(set_redis_queue_host)
-chair_command.add_command(set_redis_socketio_host)
-chair_command.add_command(download_translations)
-chair_command.add_command(backup_site)
-chair_command.add_command(backup_all_sites)
-chair_command.add_command(release)
-chair_command.add_command(renew_lets_encrypt)
-chair_command.add_command(disable_production)
-chair_command.add_command(chair_src)
-chair_command.add_command(prepare_beta_release)
-chair_command.add_command(find_chaires)
-chair_command.add_command(migrate_env)
-chair_command.add_command(generate_command_cache)
-chair_command.add_command(clear_command_cache)
-
-from chair.commands.setup import setup
-
-chair_command.add_command(setup)
-
-
-from chair.commands.config import config
-
-chair_command.add_command(config)
-
-from chair.commands.git import remote_reset_url, remote_set_url, remote_urls
-
-chair_command.add_command(remote_set_url)
-chair_command.add_command(remote_reset_url)
-chair_command.add_command(remote_urls)
-
-from chair.commands.install import install
-
-chair_command.add_command(install)
+# commands are registered by import path and only imported when invoked, so that
+# `chair --version` and shell completions don't pay for the whole command tree
+chair_command.add_lazy_command("chair.commands.make:init", "init")
+chair_command.add_lazy_command("chair.commands.make:drop", "drop")
+chair_command.add_lazy_command("chair.commands.make:get_app", ["get", "get-app"])
+chair_command.add_lazy_command("chair.commands.make:new_app", "new-app")
+chair_command.add_lazy_command("chair.commands.make:remove_app", ["remove", "rm", "remove-app"])
+chair_command.add_lazy_command("chair.commands.make:exclude_app_for_update", "exclude-app")
+chair_command.add_lazy_command("chair.commands.make:include_app_for_update", "include-app")
+chair_command.add_lazy_command("chair.commands.make:pip", "pip")
+
+
+chair_command.add_lazy_command("chair.commands.update:update", "update")
+chair_command.add_lazy_command("chair.commands.update:retry_upgrade", "retry-upgrade")
+chair_command.add_lazy_command("chair.commands.update:switch_to_branch", "switch-to-branch")
+chair_command.add_lazy_command("chair.commands.update:switch_to_develop", "switch-to-develop")
+
+
+chair_command.add_lazy_command("chair.commands.utils:start", "start")
+chair_command.add_lazy_command("chair.commands.utils:restart", "restart")
+chair_command.add_lazy_command("chair.commands.utils:set_nginx_port", "set-nginx-port")
+chair_command.add_lazy_command("chair.commands.utils:set_ssl_certificate", "set-ssl-certificate")
+chair_command.add_lazy_command("chair.commands.utils:set_ssl_certificate_key", "set-ssl-key")
+chair_command.add_lazy_command("chair.commands.utils:set_url_root", "set-url-root")
+chair_command.add_lazy_command("chair.commands.utils:set_mariadb_host", "set-mariadb-host")
+chair_command.add_lazy_command("chair.commands.utils:set_redis_cache_host", "set-redis-cache-host")
+chair_command.add_lazy_command("chair.commands.utils:set_redis_queue_host", "set-redis-queue-host")
+chair_command.add_lazy_command("chair.commands.utils:set_redis_socketio_host", "set-redis-socketio-host")
+chair_command.add_lazy_command("chair.commands.utils:download_translations", "download-translations")
+chair_command.add_lazy_command("chair.commands.utils:backup_site", "backup")
+chair_command.add_lazy_command("chair.commands.utils:backup_all_sites", "backup-all-sites")
+chair_command.add_lazy_command("chair.commands.utils:migrate_sites", "migrate", handles_option="--sites")
+chair_command.add_lazy_command("chair.commands.utils:release", "release")
+chair_command.add_lazy_command("chair.commands.utils:renew_lets_encrypt", "renew-lets-encrypt")
+chair_command.add_lazy_command("chair.commands.utils:disable_production", "disable-production")
+chair_command.add_lazy_command("chair.commands.utils:chair_src", "src")
+chair_command.add_lazy_command("chair.commands.utils:prepare_beta_release", "prepare-beta-release")
+chair_command.add_lazy_command("chair.commands.utils:find_chaires", "find")
+chair_command.add_lazy_command("chair.commands.utils:migrate_env", "migrate-env")
+chair_command.add_lazy_command("chair.commands.utils:generate_command_cache", "generate-command-cache")
+chair_command.add_lazy_command("chair.commands.utils:clear_command_cache", "clear-command-cache")
+chair_command.add_lazy_command("chair.commands.utils:wheels", "wheels")
+
+
+chair_command.add_lazy_command("chair.commands.setup:setup", "setup")
+
+
+chair_command.add_lazy_command("chair.commands.config:config", "config")
+
+
+chair_command.add_lazy_command("chair.commands.git:remote_set_url", "remote-set-url")
+chair_command.add_lazy_command("chair.commands.git:remote_reset_url", "remote-reset-url")
+chair_command.add_lazy_command("chair.commands.git:remote_urls", "remote-urls")
+chair_command.add_lazy_command("chair.commands.git:git_cache", "git-cache")
+
+
+chair_command.add_lazy_command("chair.commands.install:install", "install")
+
+
+chair_command.add_lazy_command("chair.commands.daemon:daemon", "daemon")
@@ -0,0 +1,67 @@
+# imports - standard imports
+import json
+import sys
+
+# imports - third party imports
+import click
+
+
+@click.group(help="Manage chaird, the optional daemon that keeps chair state warm for the CLI")
+def daemon():
+	pass
+
+
+@click.command("start", help="Run chaird for the current chair in the foreground")
+def start_daemon():
+	from chair.daemon import ChairDaemon
+
+	ChairDaemon(".").serve()
+
+
+@click.command("stop", help="Stop the chaird of the current chair")
+def stop_daemon():
+	from chair.daemon import query_daemon
+
+	if not query_daemon("shutdown"):
+		print("chaird is not running for this chair")
+		sys.exit(1)
+
+
+@click.command("status", help="Check if chaird is running for the current chair")
+def daemon_status():
+	from chair.daemon import query_daemon
+
+	response = query_daemon("ping")
+
+	if not response:
+		print("chaird is not running")
+		sys.exit(1)
+
+	print(f"chaird is running with pid {response['pid']}")
+
+
+@click.command("query", help="Print chair state as JSON, served by chaird when it is running")
+@click.argument("key", type=click.Choice(["apps", "sites", "excluded_apps", "config"]))
+def query_state(key):
+	from chair.daemon import query_daemon
+
+	response = query_daemon(key)
+
+	if response is None:
+		from chair.chair import Chair
+
+		chair = Chair(".")
+		response = {
+			"apps": list(chair.apps),
+			"sites": chair.sites,
+			"excluded_apps": chair.excluded_apps,
+			"config": chair.conf,
+		}
+
+	print(json.dumps(response[key], indent=1))
+
+
+daemon.add_command(start_daemon)
+daemon.add_command(stop_daemon)
+daemon.add_command(daemon_status)
+daemon.add_command(query_state)
@@ -35,3 +35,23 @@ def remote_urls():
 			remote_url = subprocess.check_output(['git', 'config', '--get', f'remote.{remote}.url'], cwd=repo_dir).strip()
 			print(f"{app}\t{remote_url}")
 
+
+@click.group('git-cache', help="Manage the host's shared mirrors of app repos, used when use_git_cache is set")
+def git_cache():
+	pass
+
+
+@click.command('refresh', help="Fetch updates into all mirrors")
+def refresh_git_cache():
+	from chair.utils.git_cache import refresh_git_cache
+	refresh_git_cache()
+
+
+@click.command('prune', help="Remove mirrors that no app repo borrows objects from anymore")
+def prune_git_cache():
+	from chair.utils.git_cache import prune_git_cache
+	prune_git_cache()
+
+
+git_cache.add_command(refresh_git_cache)
+git_cache.add_command(prune_git_cache)
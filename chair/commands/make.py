@@ -40,6 +40,12 @@ import click
 @click.option(
 	"--install-app", help="Install particular app after initialization"
 )
+@click.option(
+	"--from-lock",
+	type=click.Path(exists=True, dir_okay=False),
+	default=None,
+	help="Install the apps at the commits pinned in a chair.lock",
+)
 @click.option("--verbose", is_flag=True, help="Verbose output during install")
 def init(
 	path,
@@ -56,6 +62,7 @@ def init(
 	skip_assets=False,
 	python="python3",
 	install_app=None,
+	from_lock=None,
 ):
 	import os
 
@@ -81,6 +88,7 @@ def init(
 			skip_assets=skip_assets,
 			python=python,
 			verbose=verbose,
+			from_lock=os.path.abspath(from_lock) if from_lock else None,
 		)
 		log(f"Chair {path} initialized", level=1)
 	except SystemExit:
@@ -139,6 +147,19 @@ def drop(path):
 	default=False,
 	help="Resolve dependencies before installing app",
 )
+@click.option(
+	"--offline",
+	is_flag=True,
+	default=False,
+	envvar="CHAIR_OFFLINE",
+	help="Resolve and clone apps from the host's dependency & git caches only",
+)
+@click.option(
+	"--locked",
+	is_flag=True,
+	default=False,
+	help="Install the app and its dependencies at the commits pinned in sites/chair.lock",
+)
 def get_app(
 	git_url,
 	branch,
@@ -147,10 +168,17 @@ def get_app(
 	skip_assets=False,
 	init_chair=False,
 	resolve_deps=False,
+	offline=False,
+	locked=False,
 ):
 	"clone an app from the internet and set it up in your chair"
+	import os
 	from chair.app import get_app
 
+	if offline:
+		# inherited by the chair commands run while setting the app up
+		os.environ["CHAIR_OFFLINE"] = "1"
+
 	get_app(
 		git_url,
 		branch=branch,
@@ -158,6 +186,7 @@ def get_app(
 		overwrite=overwrite,
 		init_chair=init_chair,
 		resolve_deps=resolve_deps,
+		locked=locked,
 	)
 
 @click.command("new-app", help="Create a new VMRaid application under apps folder")
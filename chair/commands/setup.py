@@ -140,8 +140,9 @@ def setup_socketio():
 @click.option("--node", help="Update only Node packages", default=False, is_flag=True)
 @click.option("--python", help="Update only Python packages", default=False, is_flag=True)
 @click.option("--dev", help="Install optional python development dependencies", default=False, is_flag=True)
+@click.option("--force", help="Reinstall dependencies of apps whose requirements haven't changed", default=False, is_flag=True)
 @click.argument("apps", nargs=-1)
-def setup_requirements(node=False, python=False, dev=False, apps=None):
+def setup_requirements(node=False, python=False, dev=False, force=False, apps=None):
 	"""
 	Setup Python and Node dependencies.
 
@@ -152,13 +153,13 @@ def setup_requirements(node=False, python=False, dev=False, apps=None):
 	chair = Chair(".")
 
 	if not (node or python or dev):
-		chair.setup.requirements(apps=apps)
+		chair.setup.requirements(apps=apps, force=force)
 
 	elif not node and not dev:
-		chair.setup.python(apps=apps)
+		chair.setup.python(apps=apps, force=force)
 
 	elif not python and not dev:
-		chair.setup.node(apps=apps)
+		chair.setup.node(apps=apps, force=force)
 
 	else:
 		from chair.utils.chair import install_python_dev_dependencies
@@ -18,9 +18,16 @@ from chair.utils.chair import post_upgrade, patch_sites, build_assets
 @click.option('--no-compile', is_flag=True, help="If set, Python bytecode won't be compiled before restarting the processes")
 @click.option('--force', is_flag=True, help="Forces major version upgrades")
 @click.option('--reset', is_flag=True, help="Hard resets git branch's to their new states overriding any changes and overriding rebase on pull")
-def update(pull, apps, patch, build, requirements, restart_supervisor, restart_systemd, no_backup, no_compile, force, reset):
+@click.option('--check', is_flag=True, help="Only check apps for uncommitted changes that would block pulling updates. Exits with 1 if any are found")
+@click.option('--full', is_flag=True, help="Set up requirements, build assets and compile Python files for all apps, not only the ones that changed since their last update")
+def update(pull, apps, patch, build, requirements, restart_supervisor, restart_systemd, no_backup, no_compile, force, reset, check, full):
+	if check:
+		from chair.utils.chair import check_for_local_changes
+		check_for_local_changes(apps=apps)
+		return
+
 	from chair.utils.chair import update
-	update(pull=pull, apps=apps, patch=patch, build=build, requirements=requirements, restart_supervisor=restart_supervisor, restart_systemd=restart_systemd, backup=not no_backup, compile=not no_compile, force=force, reset=reset)
+	update(pull=pull, apps=apps, patch=patch, build=build, requirements=requirements, restart_supervisor=restart_supervisor, restart_systemd=restart_systemd, backup=not no_backup, compile=not no_compile, force=force, reset=reset, full=full)
 
 
 @click.command('retry-upgrade', help="Retry a failed upgrade")
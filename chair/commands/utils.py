@@ -123,9 +123,30 @@ def backup_site(site):
 
 
 @click.command('backup-all-sites', help="Backup all sites in current chair")
-def backup_all_sites():
+@click.option('--jobs', type=int, help="Number of sites backed up concurrently, defaults to backup_jobs in common_site_config or 2")
+@click.option('--stagger', type=int, help="Seconds over which the starts of site backups are spread, defaults to backup_stagger in common_site_config or 0")
+def backup_all_sites(jobs=None, stagger=None):
 	from chair.utils.system import backup_all_sites
-	backup_all_sites(chair_path='.')
+	backup_all_sites(chair_path='.', jobs=jobs, stagger=stagger)
+
+
+@click.command('migrate', help="Migrate sites in long running framework processes that load the framework once for a batch of sites")
+@click.option('--sites', required=True, help="Sites to migrate, separated by commas or spaces, or 'all'")
+@click.option('--jobs', type=int, help="Number of sites migrated concurrently, defaults to migrate_jobs in common_site_config or 4")
+@click.option('--wave-size', type=int, help="Number of sites migrated in a wave, defaults to migrate_wave_size in common_site_config or all sites")
+def migrate_sites(sites, jobs=None, wave_size=None):
+	import re
+	from chair.chair import Chair
+	from chair.utils.system import migrate_sites
+
+	sites = [site for site in re.split(",| ", sites) if site]
+	if sites == ["all"]:
+		sites = Chair('.').sites
+
+	summary = migrate_sites(chair_path='.', sites=sites, jobs=jobs, wave_size=wave_size)
+
+	if summary["failed"] or summary["skipped"]:
+		sys.exit(1)
 
 
 @click.command('release', help="Release a VMRaid app (internal to the VMRaid team)")
@@ -171,9 +192,17 @@ def find_chaires(location):
 
 
 @click.command('migrate-env', help="Migrate Virtual Environment to desired Python Version")
-@click.argument('python', type=str)
-@click.option('--no-backup', 'backup', is_flag=True, default=True)
-def migrate_env(python, backup=True):
+@click.argument('python', type=str, required=False)
+@click.option('--no-backup', 'backup', is_flag=True, default=True, help="Don't keep the previous environment for rolling back")
+@click.option('--rollback', is_flag=True, default=False, help="Switch back to the environment replaced by the last migration")
+def migrate_env(python=None, backup=True, rollback=False):
+	if rollback:
+		from chair.utils.chair import rollback_env
+		return rollback_env()
+
+	if not python:
+		raise click.UsageError("Missing argument 'PYTHON'")
+
 	from chair.utils.chair import migrate_env
 	migrate_env(python=python, backup=backup)
 
@@ -188,3 +217,17 @@ def generate_command_cache(chair_path='.'):
 def clear_command_cache(chair_path='.'):
 	from chair.utils import clear_command_cache
 	return clear_command_cache(chair_path=chair_path)
+
+
+@click.group('wheels', help="Manage the host's shared wheelhouse, used by all chairs unless use_wheelhouse is turned off")
+def wheels():
+	pass
+
+
+@click.command('prune', help="Remove wheels that aren't installed in any chair's env")
+def prune_wheelhouse():
+	from chair.utils.wheels import prune_wheelhouse
+	prune_wheelhouse()
+
+
+wheels.add_command(prune_wheelhouse)
@@ -39,6 +39,8 @@ def make_nginx_conf(chair_path, yes=False):
 		"chair_name": chair_name,
 		"error_pages": get_error_pages(),
 		"allow_rate_limiting": allow_rate_limiting,
+		# needs nginx built with the ngx_brotli module
+		"brotli_static": config.get("brotli_static", False),
 		# for nginx map variable
 		"random_string": "".join(random.choice(string.ascii_lowercase) for i in range(7))
 	}
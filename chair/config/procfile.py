@@ -24,6 +24,7 @@ def setup_procfile(chair_path, yes=False, skip_redis=False):
 		webserver_port=config.get('webserver_port'),
 		CI=os.environ.get('CI'),
 		skip_redis=skip_redis,
+		use_chaird=config.get("use_chaird"),
 		workers=config.get("workers", {}))
 
 	with open(procfile_path, 'w') as f:
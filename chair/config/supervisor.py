@@ -43,6 +43,7 @@ def generate_supervisor_config(chair_path, user=None, yes=False, skip_redis=Fals
 		"background_workers": config.get('background_workers') or 1,
 		"chair_cmd": which('chair'),
 		"skip_redis": skip_redis,
+		"use_chaird": config.get("use_chaird"),
 		"workers": config.get("workers", {}),
 	})
 
@@ -0,0 +1,193 @@
+# imports - standard imports
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Dict, List, Union
+
+# imports - module imports
+import chair
+from chair.utils import get_cached_commands, get_command_cache_fingerprint
+
+
+logger = logging.getLogger(chair.PROJECT_NAME)
+
+# seconds the CLI waits on chaird before falling back to resolving state itself
+CLIENT_TIMEOUT = 0.5
+
+
+def get_socket_path(chair_path=".") -> str:
+	# kept relative to the chair since unix socket paths are limited to ~100 chars
+	return os.path.join(chair_path, "config", "pids", "chaird.sock")
+
+
+def query_daemon(query: str, chair_path=".", **kwargs) -> Union[Dict, None]:
+	"""Sends query to the chaird daemon of the chair and returns its response.
+	Returns None if the daemon isn't running or doesn't respond in time, in which
+	case the caller is expected to resolve the query itself."""
+	socket_path = get_socket_path(chair_path)
+
+	if not os.path.exists(socket_path):
+		return None
+
+	request = json.dumps(dict(kwargs, query=query)).encode() + b"\n"
+
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+			client.settimeout(CLIENT_TIMEOUT)
+			client.connect(socket_path)
+			client.sendall(request)
+			response = b""
+			while not response.endswith(b"\n"):
+				data = client.recv(65536)
+				if not data:
+					break
+				response += data
+		response = json.loads(response)
+	except (OSError, ValueError):
+		return None
+
+	if "error" in response:
+		logger.warning(f"chaird failed to answer {query}: {response['error']}")
+		return None
+
+	return response
+
+
+def is_chair_handled(argv: List) -> bool:
+	"""Framework commands that chair runs itself, eg: `chair migrate --sites ...`"""
+	from chair.commands import chair_command
+
+	return chair_command.is_chair_handled(argv)
+
+
+def get_route(argv: List, apps: List, vmraid_commands: List) -> Dict:
+	"""Decides if the CLI arguments are meant for the framework or an app's CLI"""
+	commands = {arg for arg in argv if not arg.startswith("-")}
+	is_vmraid_cmd = not is_chair_handled(argv) and bool(commands.intersection(vmraid_commands))
+
+	return {
+		"vmraid_cmd": is_vmraid_cmd,
+		"app_cmd": bool(argv) and not is_vmraid_cmd and argv[0] in apps,
+	}
+
+
+class ChairDaemon:
+	"""Keeps a chair's state (apps, sites, config & framework commands) warm in a long
+	running process and answers queries for it over a unix socket.
+
+	State is rebuilt when the files it is derived from change, so answers are never
+	staler than what a fresh `Chair` would compute.
+	"""
+
+	def __init__(self, chair_path="."):
+		self.chair_path = chair_path
+		self.socket_path = get_socket_path(chair_path)
+		self.lock = threading.Lock()
+		self.server = None
+		self._chair = None
+		self._state = None
+		self._state_key = None
+
+	@property
+	def state(self) -> Dict:
+		with self.lock:
+			state_key = self._get_state_key()
+
+			if state_key != self._state_key:
+				self._state = self._build_state()
+				self._state_key = state_key
+
+			# the index validates sites itself, including sites created in two steps
+			return dict(self._state, sites=self._chair.index.sites)
+
+	def handle(self, request: Dict) -> Dict:
+		query = request.get("query")
+
+		if query == "ping":
+			return {"pid": os.getpid()}
+
+		if query == "shutdown":
+			threading.Thread(target=self.server.shutdown).start()
+			return {"pid": os.getpid()}
+
+		state = self.state
+
+		if query == "route":
+			return get_route(request.get("argv", []), state["apps"], state["vmraid_commands"])
+
+		if query in state:
+			return {query: state[query]}
+
+		return {"error": f"Unknown query {query}"}
+
+	def serve(self):
+		if query_daemon("ping", chair_path=self.chair_path):
+			raise RuntimeError(f"chaird is already running for {os.path.abspath(self.chair_path)}")
+
+		if os.path.exists(self.socket_path):
+			# left behind by a daemon that didn't shut down cleanly
+			os.remove(self.socket_path)
+
+		daemon = self
+
+		class RequestHandler(socketserver.StreamRequestHandler):
+			def handle(self):
+				try:
+					response = daemon.handle(json.loads(self.rfile.readline()))
+				except Exception as e:
+					logger.exception("chaird failed to handle request")
+					response = {"error": str(e)}
+				self.wfile.write(json.dumps(response).encode() + b"\n")
+
+		# only the chair's user may talk to the daemon
+		umask = os.umask(0o077)
+		try:
+			self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, RequestHandler)
+		finally:
+			os.umask(umask)
+
+		self.server.daemon_threads = True
+		# warm up before accepting connections
+		self.state
+
+		try:
+			self.server.serve_forever()
+		finally:
+			self.server.server_close()
+			if os.path.exists(self.socket_path):
+				os.remove(self.socket_path)
+
+	def _build_state(self) -> Dict:
+		from chair.chair import Chair
+		from chair.utils import generate_command_cache
+
+		Chair.cache_clear()
+		self._chair = Chair(self.chair_path)
+		vmraid_commands = get_cached_commands(self.chair_path)
+
+		if vmraid_commands is None:
+			vmraid_commands = generate_command_cache(self.chair_path)
+
+		return {
+			"apps": list(self._chair.apps),
+			"excluded_apps": self._chair.excluded_apps,
+			"config": self._chair.conf,
+			"vmraid_commands": sorted(vmraid_commands),
+		}
+
+	def _get_state_key(self) -> List:
+		from chair.chair import get_mtime
+		from chair.utils.chair import get_env_site_packages
+
+		paths = [
+			os.path.join(self.chair_path, "apps"),
+			os.path.join(self.chair_path, "sites", "apps.txt"),
+			os.path.join(self.chair_path, "sites", "excluded_apps.txt"),
+			os.path.join(self.chair_path, "sites", "common_site_config.json"),
+			*get_env_site_packages(self.chair_path),
+		]
+
+		return [get_command_cache_fingerprint(self.chair_path)] + [get_mtime(path) for path in paths]
@@ -1,16 +1,49 @@
+import json
 import os
 import shutil
 import subprocess
+import sys
+import tempfile
+import time
 import unittest
 from tabnanny import check
 
 from chair.app import App
 from chair.chair import Chair
-from chair.exceptions import InvalidRemoteException
+from chair.exceptions import CommandFailedError, InvalidRemoteException, ValidationError
 from chair.utils import is_valid_vmraid_branch
 
 
 class TestUtils(unittest.TestCase):
+	def make_tmp_dir(self):
+		"""Creates a temporary directory that's removed after the test"""
+		tmp_dir = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp_dir.cleanup)
+		return tmp_dir.name
+
+	def make_chair(self, helper=None):
+		"""Creates a chair in a temporary directory that's removed after the test.
+		Given a helper's source, the chair also gets an env python & a fake
+		framework whose `vmraid.utils.chair_helper` runs it."""
+		self.addCleanup(Chair.cache_clear)
+
+		chair_dir = os.path.join(self.make_tmp_dir(), "chair")
+		os.makedirs(os.path.join(chair_dir, "sites"))
+
+		if helper is not None:
+			helper_dir = os.path.join(chair_dir, "sites", "vmraid", "utils")
+			os.makedirs(helper_dir)
+			os.makedirs(os.path.join(chair_dir, "env", "bin"))
+			os.symlink(sys.executable, os.path.join(chair_dir, "env", "bin", "python"))
+			for path in ("vmraid/__init__.py", "vmraid/utils/__init__.py"):
+				open(os.path.join(chair_dir, "sites", path), "w").close()
+
+			with open(os.path.join(helper_dir, "chair_helper.py"), "w") as f:
+				f.write(helper)
+
+		Chair.cache_clear()
+		return chair_dir
+
 	def test_app_utils(self):
 		git_url = "https://github.com/vmraid/vmraid"
 		branch = "develop"
@@ -82,3 +115,916 @@ class TestUtils(unittest.TestCase):
 		git_url = git_url.replace("healthcare", "erpadda")
 		fake_app = App(git_url)
 		self.assertTrue(len(fake_app._get_dependencies()) == 0)
+
+	def test_lazy_command_registry(self):
+		from chair.commands import chair_command
+		from click import Context
+
+		ctx = Context(chair_command)
+		commands = chair_command.list_commands(ctx)
+
+		for name in ("init", "get", "get-app", "update", "setup", "config", "install"):
+			self.assertIn(name, commands)
+
+		self.assertIs(
+			chair_command.get_command(ctx, "get"), chair_command.get_command(ctx, "get-app")
+		)
+		self.assertIsNone(chair_command.get_command(ctx, "not-a-chair-command"))
+
+	def test_cli_imports(self):
+		"""Importing the CLI must not import the command tree or heavy dependencies"""
+		script = "import sys; import chair.cli; print(' '.join(sys.modules))"
+		modules = set(subprocess.check_output([sys.executable, "-c", script], encoding="utf-8").split())
+
+		for module in (
+			"chair.chair",
+			"chair.commands.make",
+			"chair.commands.setup",
+			"git",
+			"requests",
+			"setuptools",
+		):
+			self.assertNotIn(module, modules)
+
+	def test_command_cache_fingerprint(self):
+		from chair.utils import chair_cache_file, get_cached_commands, get_command_cache_fingerprint
+
+		chair_dir = self.make_chair()
+		app_dir = os.path.join(chair_dir, "apps", "vmraid")
+		hooks_path = os.path.join(app_dir, "vmraid", "hooks.py")
+		os.makedirs(os.path.join(app_dir, "vmraid"))
+
+		with open(os.path.join(chair_dir, "sites", "apps.txt"), "w") as f:
+			f.write("vmraid")
+
+		with open(hooks_path, "w") as f:
+			f.write("app_name = 'vmraid'")
+
+		fingerprint = get_command_cache_fingerprint(chair_dir)
+		self.assertIsNone(get_cached_commands(chair_dir))
+
+		with open(os.path.join(chair_dir, chair_cache_file), "w") as f:
+			json.dump({"fingerprint": fingerprint, "commands": ["migrate"]}, f)
+
+		self.assertEqual(get_cached_commands(chair_dir), {"migrate"})
+
+		os.utime(hooks_path, ns=(0, 0))
+		self.assertNotEqual(get_command_cache_fingerprint(chair_dir), fingerprint)
+		self.assertIsNone(get_cached_commands(chair_dir))
+
+	def test_get_installed_packages(self):
+		from chair.utils.chair import get_installed_packages
+
+		chair_dir = self.make_chair()
+		site_packages = os.path.join(chair_dir, "env", "lib", "python3.8", "site-packages")
+		os.makedirs(os.path.join(site_packages, "vmraid-14.0.0.dev0.dist-info"))
+		os.makedirs(os.path.join(site_packages, "Click-7.0.egg-info"))
+
+		with open(os.path.join(site_packages, "chair_manager.egg-link"), "w") as f:
+			f.write(os.path.abspath(chair_dir))
+
+		self.assertEqual(get_installed_packages(chair_dir), {"vmraid", "click", "chair-manager"})
+
+		# installs change the mtime of site-packages which invalidates the cache
+		os.makedirs(os.path.join(site_packages, "erpadda-14.0.0.dist-info"))
+		os.utime(site_packages, ns=(0, 0))
+		self.assertIn("erpadda", get_installed_packages(chair_dir))
+
+	def test_is_vmraid_app(self):
+		from chair.utils import is_vmraid_app, paths_in_app
+
+		app_dir = os.path.join(self.make_tmp_dir(), "apps", "healthcare")
+		os.makedirs(os.path.join(app_dir, "node_modules", "pkg"))
+		os.makedirs(os.path.join(app_dir, "healthcare"))
+
+		self.assertFalse(is_vmraid_app(app_dir))
+
+		for path in paths_in_app:
+			with open(os.path.join(app_dir, "healthcare", path), "w") as f:
+				f.write("")
+
+		self.assertTrue(is_vmraid_app(app_dir))
+
+		# packages not named after the app directory are found by scanning it
+		os.rename(os.path.join(app_dir, "healthcare"), os.path.join(app_dir, "health"))
+		self.assertTrue(is_vmraid_app(app_dir))
+
+	def test_chair_index(self):
+		from unittest.mock import patch
+
+		from chair.chair import INDEX_KEY
+
+		chair_dir = self.make_chair()
+		sites_dir = os.path.join(chair_dir, "sites")
+		app_dir = os.path.join(chair_dir, "apps", "vmraid", "vmraid")
+		os.makedirs(os.path.join(sites_dir, "site1"))
+		os.makedirs(os.path.join(sites_dir, "site2"))
+		os.makedirs(app_dir)
+
+		with open(os.path.join(sites_dir, "site1", "site_config.json"), "w") as f:
+			f.write("{}")
+
+		with open(os.path.join(app_dir, "__init__.py"), "w") as f:
+			f.write("__version__ = '13.0.0'")
+
+		index = Chair(chair_dir).index
+
+		self.assertEqual(index.sites, ["site1"])
+		self.assertEqual(index.get_app("vmraid")["version"], "13.0.0")
+		# reads don't create the index
+		self.assertFalse(os.path.exists(Chair(chair_dir).apps.states_path))
+
+		# folders get site_config.json after they're created
+		with open(os.path.join(sites_dir, "site2", "site_config.json"), "w") as f:
+			f.write("{}")
+
+		self.assertEqual(sorted(index.sites), ["site1", "site2"])
+
+		# once there's an apps.json, what reads recompute is written back to it
+		chair = Chair(chair_dir)
+		chair.apps.states["vmraid"] = {"idx": 1}
+		chair.apps.write_states()
+
+		with open(os.path.join(sites_dir, "excluded_apps.txt"), "w") as f:
+			f.write("healthcare")
+		with open(os.path.join(app_dir, "__init__.py"), "w") as f:
+			f.write("__version__ = '14.0.0'")
+		os.utime(os.path.join(app_dir, "__init__.py"), ns=(0, 0))
+
+		self.assertEqual(index.get_app("vmraid")["version"], "14.0.0")
+		self.assertEqual(chair.excluded_apps, ["healthcare"])
+		self.assertEqual(sorted(index.sites), ["site1", "site2"])
+
+		with open(chair.apps.states_path) as f:
+			states = json.load(f)
+		self.assertEqual(states["vmraid"]["version"], "14.0.0")
+		self.assertEqual(states[INDEX_KEY]["excluded_apps"]["apps"], ["healthcare"])
+		self.assertEqual(sorted(states[INDEX_KEY]["sites"]["sites"]), ["site1", "site2"])
+
+		# other processes answer from apps.json, even after it changed the mtime of sites
+		Chair.cache_clear()
+		with patch("chair.chair.get_current_version") as get_current_version:
+			index = Chair(chair_dir).index
+			self.assertEqual(sorted(index.sites), ["site1", "site2"])
+			self.assertEqual(index.get_app("vmraid")["version"], "14.0.0")
+			self.assertFalse(get_current_version.called)
+
+	def test_chair_daemon(self):
+		import threading
+		from chair.daemon import ChairDaemon, query_daemon
+		from chair.utils import chair_cache_file, get_command_cache_fingerprint
+
+		chair_dir = self.make_chair()
+		os.makedirs(os.path.join(chair_dir, "sites", "site1"))
+		os.makedirs(os.path.join(chair_dir, "config", "pids"))
+		os.makedirs(os.path.join(chair_dir, "apps"))
+
+		with open(os.path.join(chair_dir, "sites", "site1", "site_config.json"), "w") as f:
+			f.write("{}")
+
+		with open(os.path.join(chair_dir, chair_cache_file), "w") as f:
+			json.dump({"fingerprint": get_command_cache_fingerprint(chair_dir), "commands": ["migrate"]}, f)
+
+		self.assertIsNone(query_daemon("ping", chair_path=chair_dir))
+
+		Chair.cache_clear()
+		daemon = ChairDaemon(chair_dir)
+		thread = threading.Thread(target=daemon.serve)
+		thread.start()
+
+		try:
+			for _ in range(50):
+				if query_daemon("ping", chair_path=chair_dir):
+					break
+				thread.join(0.1)
+
+			self.assertEqual(query_daemon("ping", chair_path=chair_dir)["pid"], os.getpid())
+			self.assertEqual(query_daemon("sites", chair_path=chair_dir)["sites"], ["site1"])
+			self.assertEqual(
+				query_daemon("route", chair_path=chair_dir, argv=["--site", "site1", "migrate"]),
+				{"vmraid_cmd": True, "app_cmd": False},
+			)
+			self.assertIsNone(query_daemon("unknown", chair_path=chair_dir))
+		finally:
+			query_daemon("shutdown", chair_path=chair_dir)
+			thread.join(5)
+
+		self.assertFalse(os.path.exists(daemon.socket_path))
+
+	def test_vmraid_forkserver(self):
+		from chair.utils.forkserver import get_forkserver, vmraid_forkserver
+
+		chair_dir = self.make_chair()
+		helper_dir = os.path.join(chair_dir, "sites", "vmraid", "utils")
+		os.makedirs(helper_dir)
+		os.makedirs(os.path.join(chair_dir, "env", "bin"))
+
+		with vmraid_forkserver(chair_dir) as server:
+			# no framework to preload, commands are spawned as before
+			self.assertIsNone(server)
+
+		os.symlink(sys.executable, os.path.join(chair_dir, "env", "bin", "python"))
+		for path in ("vmraid/__init__.py", "vmraid/utils/__init__.py"):
+			open(os.path.join(chair_dir, "sites", path), "w").close()
+
+		with open(os.path.join(helper_dir, "chair_helper.py"), "w") as f:
+			f.write(
+				"import os, sys\n"
+				"if __name__ == '__main__':\n"
+				"\tprint(os.getcwd(), *sys.argv[1:])\n"
+				"\tsys.exit(len(sys.argv))\n"
+			)
+
+		with vmraid_forkserver(chair_dir) as server:
+			self.assertIs(get_forkserver(chair_dir), server)
+
+			for site in ("site1", "site2"):
+				p = server.run(["--site", site, "migrate"], stdout=subprocess.PIPE)
+				self.assertEqual(
+					p.stdout.read().decode().split(),
+					[os.path.abspath(os.path.join(chair_dir, "sites")), "vmraid", "--site", site, "migrate"],
+				)
+				self.assertEqual(p.wait(), 5)
+
+		self.assertIsNone(get_forkserver(chair_dir))
+
+	def test_pull_apps(self):
+		from chair.app import pull_apps
+		from chair.exceptions import CommandFailedError
+		from chair.utils import setup_logging
+
+		chair_dir = self.make_chair()
+		origin_dir = os.path.join(chair_dir, "origin")
+		os.makedirs(origin_dir)
+		setup_logging(chair_dir)
+
+		def git(*args, cwd=origin_dir):
+			return subprocess.run(["git", *args], cwd=cwd, capture_output=True, check=True).stdout
+
+		git("init", "-b", "release/v1")
+		git("commit", "--allow-empty", "-m", "init")
+
+		for app in ("app1", "app2", "app3"):
+			git("clone", origin_dir, os.path.join(chair_dir, "apps", app))
+
+		git("commit", "--allow-empty", "-m", "update")
+		head = git("rev-parse", "HEAD")
+		git("remote", "set-url", "origin", "/nonexistent", cwd=os.path.join(chair_dir, "apps", "app2"))
+
+		with self.assertRaises(CommandFailedError):
+			pull_apps(apps=["app1", "app2", "app3"], chair_path=chair_dir)
+
+		# a failing app doesn't stop the others from being pulled
+		for app in ("app1", "app3"):
+			self.assertEqual(git("rev-parse", "HEAD", cwd=os.path.join(chair_dir, "apps", app)), head)
+
+	def test_get_dirty_apps(self):
+		from chair.app import get_dirty_apps
+
+		chair_dir = self.make_chair()
+
+		for app in ("app1", "app2"):
+			app_dir = os.path.join(chair_dir, "apps", app)
+			os.makedirs(app_dir)
+			subprocess.run(["git", "init"], cwd=app_dir, capture_output=True, check=True)
+			with open(os.path.join(app_dir, "setup.py"), "w") as f:
+				f.write("")
+			subprocess.run(["git", "add", "."], cwd=app_dir, capture_output=True, check=True)
+			subprocess.run(["git", "commit", "-m", "init"], cwd=app_dir, capture_output=True, check=True)
+
+		self.assertEqual(get_dirty_apps(["app1", "app2"], chair_path=chair_dir), {})
+
+		with open(os.path.join(chair_dir, "apps", "app2", "setup.py"), "w") as f:
+			f.write("# changed")
+		open(os.path.join(chair_dir, "apps", "app2", "new.py"), "w").close()
+
+		self.assertEqual(
+			get_dirty_apps(["app1", "app2"], chair_path=chair_dir),
+			{"app2": [" M setup.py", "?? new.py"]},
+		)
+
+	def test_git_cache(self):
+		from unittest.mock import patch
+
+		from chair.utils.git_cache import (
+			add_git_cache_dependent,
+			get_git_cache_path,
+			prune_git_cache,
+		)
+
+		sandbox = self.make_tmp_dir()
+		origin_dir = os.path.join(sandbox, "origin")
+		app_dir = os.path.join(sandbox, "apps", "app1")
+		os.makedirs(origin_dir)
+
+		with patch.dict(os.environ, {"XDG_CACHE_HOME": os.path.join(sandbox, "cache")}):
+			mirror = get_git_cache_path("https://github.com/vmraid/vmraid.git")
+			self.assertEqual(mirror, get_git_cache_path("git@github.com:vmraid/vmraid.git"))
+			self.assertEqual(mirror, os.path.join(sandbox, "cache", "chair", "git", "github.com", "vmraid", "vmraid.git"))
+			self.assertIsNone(get_git_cache_path(origin_dir))
+
+			subprocess.run(["git", "init"], cwd=origin_dir, capture_output=True, check=True)
+			subprocess.run(["git", "commit", "--allow-empty", "-m", "init"], cwd=origin_dir, capture_output=True, check=True)
+			subprocess.run(["git", "clone", "--mirror", origin_dir, mirror], capture_output=True, check=True)
+			subprocess.run(["git", "clone", origin_dir, app_dir, "--reference", mirror], capture_output=True, check=True)
+			add_git_cache_dependent(mirror, app_dir)
+
+			prune_git_cache()
+			self.assertTrue(os.path.exists(mirror))
+
+			shutil.rmtree(app_dir)
+			prune_git_cache()
+			self.assertFalse(os.path.exists(mirror))
+
+	def test_get_changed_apps(self):
+		chair_dir = self.make_chair()
+		app_dir = os.path.join(chair_dir, "apps", "vmraid")
+		os.makedirs(os.path.join(app_dir, "vmraid"))
+
+		with open(os.path.join(app_dir, "vmraid", "__init__.py"), "w") as f:
+			f.write("__version__ = '14.0.0'")
+
+		subprocess.run(["git", "init"], cwd=app_dir, capture_output=True, check=True)
+		subprocess.run(["git", "add", "."], cwd=app_dir, capture_output=True, check=True)
+		subprocess.run(["git", "commit", "-m", "init"], cwd=app_dir, capture_output=True, check=True)
+
+		apps = Chair(chair_dir).apps
+		apps.states = {"vmraid": {"resolution": {"commit_hash": None, "branch": None}, "idx": 1}}
+
+		# nothing recorded yet
+		self.assertEqual(apps.get_changed_apps(["vmraid"]), ["vmraid"])
+
+		apps.record_commit_hashes(["vmraid"])
+		self.assertEqual(apps.get_changed_apps(["vmraid"]), [])
+
+		with open(apps.states_path) as f:
+			self.assertIsNotNone(json.load(f)["vmraid"]["resolution"]["commit_hash"])
+
+		subprocess.run(["git", "commit", "--allow-empty", "-m", "update"], cwd=app_dir, capture_output=True, check=True)
+		self.assertEqual(apps.get_changed_apps(["vmraid"]), ["vmraid"])
+
+	def test_required_deps_cache(self):
+		from unittest.mock import patch
+
+		from chair.utils import app as app_utils
+
+		sandbox = self.make_tmp_dir()
+		hooks = "required_apps = ['erpadda']"
+		self.addCleanup(app_utils.get_required_deps.cache_clear)
+
+		with patch.dict(os.environ, {"XDG_CACHE_HOME": sandbox}), patch.object(
+			app_utils, "fetch_required_deps", return_value=hooks
+		) as fetch:
+			app_utils.get_required_deps.cache_clear()
+			self.assertEqual(app_utils.get_required_deps("vmraid", "healthcare", "develop"), hooks)
+			self.assertEqual(app_utils.required_apps_from_hooks(hooks), ["erpadda"])
+
+			# served from disk by another process within the TTL
+			app_utils.get_required_deps.cache_clear()
+			app_utils.get_required_deps("vmraid", "healthcare", "develop")
+			self.assertEqual(fetch.call_count, 1)
+
+			with patch.object(app_utils, "DEPS_CACHE_TTL", 0):
+				app_utils.get_required_deps.cache_clear()
+				app_utils.get_required_deps("vmraid", "healthcare", "develop")
+				self.assertEqual(fetch.call_count, 2)
+
+				with patch.dict(os.environ, {"CHAIR_OFFLINE": "1"}):
+					# stale entries are good enough offline, missing ones aren't
+					app_utils.get_required_deps.cache_clear()
+					self.assertEqual(app_utils.get_required_deps("vmraid", "healthcare", "develop"), hooks)
+					self.assertEqual(fetch.call_count, 2)
+
+					with self.assertRaises(FileNotFoundError):
+						app_utils.get_required_deps("vmraid", "healthcare", "version-13")
+
+		# branches are validated once per resolution, however many apps need them
+		from chair.utils import _is_valid_vmraid_branch
+
+		_is_valid_vmraid_branch.cache_clear()
+		self.addCleanup(_is_valid_vmraid_branch.cache_clear)
+		with patch("requests.get") as get:
+			get.return_value.json.return_value = [{"name": "develop"}]
+			for _ in range(2):
+				is_valid_vmraid_branch("https://github.com/vmraid/erpadda", "develop")
+			self.assertEqual(get.call_count, 1)
+
+	def test_chair_lock(self):
+		from unittest.mock import patch
+
+		from chair.app import install_apps_from_lock
+
+		sandbox = self.make_tmp_dir()
+		origin_dir = os.path.join(sandbox, "origin")
+		chair_dir = os.path.join(sandbox, "chair1")
+		os.makedirs(os.path.join(origin_dir, "app1"))
+		os.makedirs(os.path.join(chair_dir, "sites"))
+
+		def git(*args, cwd=origin_dir):
+			return subprocess.run(["git", *args], cwd=cwd, capture_output=True, check=True).stdout.decode().strip()
+
+		git("init", "-b", "release/v1")
+		with open(os.path.join(origin_dir, "app1", "__init__.py"), "w") as f:
+			f.write("__version__ = '1.0.0'")
+		with open(os.path.join(origin_dir, "setup.cfg"), "w") as f:
+			f.write("[metadata]\nname = app1\n")
+		git("add", ".")
+		git("commit", "-m", "init")
+		commit = git("rev-parse", "HEAD")
+		git("clone", "--origin", "upstream", origin_dir, os.path.join(chair_dir, "apps", "app1"))
+		git("commit", "--allow-empty", "-m", "not locked")
+
+		apps = Chair(chair_dir).apps
+		apps.states = {"app1": {"resolution": {"commit_hash": commit, "branch": "release/v1"}, "required": [], "idx": 1}}
+		apps.write_lock()
+		lock_mtime = os.stat(apps.lock_path).st_mtime_ns
+
+		with open(apps.lock_path) as f:
+			self.assertEqual(
+				json.load(f)["apps"],
+				[{"name": "app1", "url": origin_dir, "branch": "release/v1", "commit": commit, "required": []}],
+			)
+
+		# unchanged pins aren't written again
+		time.sleep(0.01)
+		apps.write_lock()
+		self.assertEqual(os.stat(apps.lock_path).st_mtime_ns, lock_mtime)
+
+		other_chair_dir = os.path.join(sandbox, "chair2")
+		os.makedirs(os.path.join(other_chair_dir, "sites"))
+
+		with patch.dict(os.environ, {"CHAIR_OFFLINE": "1", "XDG_CACHE_HOME": sandbox}), self.assertRaises(ValidationError):
+			# a remote that isn't in the git cache can't be fetched offline
+			install_apps_from_lock(apps.lock_path, chair_path=other_chair_dir, skip_assets=True)
+
+		with patch("chair.app.install_app") as install_app:
+			install_apps_from_lock(apps.lock_path, chair_path=other_chair_dir, skip_assets=True)
+
+		self.assertEqual(install_app.call_args[1]["tag"], "release/v1")
+		app_dir = os.path.join(other_chair_dir, "apps", "app1")
+		self.assertEqual(git("rev-parse", "HEAD", cwd=app_dir), commit)
+		self.assertEqual(git("rev-parse", "--abbrev-ref", "HEAD", cwd=app_dir), "release/v1")
+		self.assertEqual(git("remote", "get-url", "upstream", cwd=app_dir), origin_dir)
+
+	def test_requirements_hash(self):
+		from unittest.mock import patch
+
+		from chair.chair import ChairSetup
+		from chair.utils.chair import get_requirements_hash
+
+		chair_dir = self.make_chair()
+		app_dirs = [os.path.join(chair_dir, "apps", app) for app in ("app1", "app2")]
+
+		for app_dir in app_dirs:
+			os.makedirs(app_dir)
+			with open(os.path.join(app_dir, "requirements.txt"), "w") as f:
+				f.write("requests\n")
+
+		chair = Chair(chair_dir)
+
+		with patch.object(ChairSetup, "run") as run, patch(
+			"chair.chair.get_installed_packages", return_value={"app1", "app2"}
+		), patch("chair.utils.wheels.build_wheels"):
+			# both apps are installed by a single pip run
+			chair.setup.python(apps=["app1", "app2"])
+			self.assertEqual(run.call_count, 2)
+			self.assertIn(f"-e {app_dirs[0]} -e {app_dirs[1]}", run.call_args[0][0])
+
+			run.reset_mock()
+			chair.setup.python(apps=["app1", "app2"])
+			run.assert_not_called()
+
+			with open(os.path.join(app_dirs[1], "requirements.txt"), "a") as f:
+				f.write("redis\n")
+			chair.setup.python(apps=["app1", "app2"])
+			self.assertNotIn(f"-e {app_dirs[0]}", run.call_args[0][0])
+			self.assertIn(f"-e {app_dirs[1]}", run.call_args[0][0])
+
+		self.assertEqual(chair.index.get_requirements_hash("app2"), get_requirements_hash(app_dirs[1]))
+
+	def test_wheelhouse(self):
+		from unittest.mock import patch
+
+		from chair.utils import wheels
+
+		sandbox = self.make_tmp_dir()
+		chair_dir = os.path.join(sandbox, "chair1")
+		site_packages = os.path.join(chair_dir, "env", "lib", "python3.8", "site-packages")
+		os.makedirs(os.path.join(site_packages, "PyMySQL-1.0.2.dist-info"))
+		os.makedirs(os.path.join(chair_dir, "sites"))
+
+		with patch.dict(os.environ, {"XDG_CACHE_HOME": sandbox}):
+			wheelhouse = wheels.get_wheelhouse_dir()
+			self.assertIn(f"--find-links {wheelhouse}", wheels.get_wheelhouse_flags(chair_dir))
+
+			wheels.add_wheelhouse_dependent(chair_dir)
+			wheels.add_wheelhouse_dependent(os.path.join(sandbox, "removed-chair"))
+			for wheel in ("pymysql-1.0.2-py3-none-any.whl", "PyMySQL-0.9.3-py2.py3-none-any.whl"):
+				open(os.path.join(wheelhouse, wheel), "w").close()
+
+			wheels.prune_wheelhouse()
+
+			self.assertEqual(
+				[wheel for wheel in os.listdir(wheelhouse) if wheel.endswith(".whl")],
+				["pymysql-1.0.2-py3-none-any.whl"],
+			)
+			self.assertEqual(wheels.get_wheelhouse_dependents(), [chair_dir])
+
+			# only dependencies pip would build from sdists are built into the wheelhouse
+			report = {"install": [
+				{"download_info": {"url": "file:///apps/vmraid", "dir_info": {"editable": True}}, "metadata": {"name": "vmraid", "version": "14.0.0"}},
+				{"download_info": {"url": "https://files/PyMySQL-1.0.2-py3-none-any.whl", "archive_info": {}}, "metadata": {"name": "PyMySQL", "version": "1.0.2"}},
+				{"download_info": {"url": "https://files/pycups-2.0.1.tar.gz", "archive_info": {}}, "metadata": {"name": "pycups", "version": "2.0.1"}},
+			]}
+			self.assertEqual(wheels.get_sdist_requirements(report), ["pycups==2.0.1"])
+
+			# requirements are only resolved again once they change
+			requirements_path = os.path.join(chair_dir, "requirements.txt")
+			with open(requirements_path, "w") as f:
+				f.write("pycups\n")
+			with patch("subprocess.run", return_value=subprocess.CompletedProcess([], 1)) as run:
+				wheels.add_resolved_requirements(wheels.get_requirements_key(sys.executable, ["-r", requirements_path]))
+				wheels.build_wheels(sys.executable, ["-r", requirements_path], chair_path=chair_dir)
+				self.assertFalse(run.called)
+
+				with open(requirements_path, "a") as f:
+					f.write("pymysql\n")
+				wheels.build_wheels(sys.executable, ["-r", requirements_path], chair_path=chair_dir)
+				self.assertEqual(run.call_args[0][0][3:5], ["install", "--quiet"])
+
+			with open(os.path.join(chair_dir, "sites", "common_site_config.json"), "w") as f:
+				json.dump({"use_wheelhouse": False}, f)
+			self.assertEqual(wheels.get_wheelhouse_flags(chair_dir), "")
+
+	def test_swap_env(self):
+		from chair.utils.chair import relocate_env, swap_paths
+
+		sandbox = self.make_tmp_dir()
+		env_path, next_env_path = os.path.join(sandbox, "env"), os.path.join(sandbox, "env.next")
+
+		for path in (env_path, next_env_path):
+			os.makedirs(os.path.join(path, "bin"))
+			with open(os.path.join(path, "bin", "gunicorn"), "w") as f:
+				f.write(f"#!{path}/bin/python\n# {os.path.basename(path)}\n")
+
+		relocate_env(next_env_path, env_path)
+		swap_paths(next_env_path, env_path)
+
+		with open(os.path.join(env_path, "bin", "gunicorn")) as f:
+			self.assertEqual(f.read(), f"#!{env_path}/bin/python\n# env.next\n")
+		with open(os.path.join(next_env_path, "bin", "gunicorn")) as f:
+			self.assertEqual(f.read(), f"#!{env_path}/bin/python\n# env\n")
+
+	def test_clone_tree(self):
+		from chair.utils.chair import clone_tree, is_immutable_path
+
+		sandbox = self.make_tmp_dir()
+		source = os.path.join(sandbox, "chair1", "apps")
+		target = os.path.join(sandbox, "chair2", "apps")
+		app_dir = os.path.join(source, "app1")
+		os.makedirs(os.path.join(app_dir, "node_modules", "left-pad"))
+		os.makedirs(target)
+
+		with open(os.path.join(app_dir, "node_modules", "left-pad", "index.js"), "w") as f:
+			f.write("module.exports = {}")
+		subprocess.run(["git", "init"], cwd=app_dir, capture_output=True, check=True)
+		subprocess.run(["git", "add", "."], cwd=app_dir, capture_output=True, check=True)
+		subprocess.run(["git", "commit", "-m", "init"], cwd=app_dir, capture_output=True, check=True)
+
+		self.assertFalse(is_immutable_path(os.path.join(app_dir, "node_modules", "left-pad", "index.js")))
+		self.assertTrue(is_immutable_path(os.path.join(app_dir, ".git", "objects", "ab", "cdef")))
+		self.assertFalse(is_immutable_path(os.path.join(app_dir, ".git", "objects", "info", "alternates")))
+		self.assertFalse(is_immutable_path(os.path.join(app_dir, ".git", "index")))
+
+		clone_tree(source, target)
+
+		cloned_app_dir = os.path.join(target, "app1")
+		self.assertEqual(
+			subprocess.check_output(["git", "status", "--porcelain"], cwd=cloned_app_dir), b""
+		)
+		with open(os.path.join(cloned_app_dir, ".git", "index"), "ab") as f:
+			f.write(b"\0")
+		self.assertNotEqual(
+			os.path.getsize(os.path.join(cloned_app_dir, ".git", "index")),
+			os.path.getsize(os.path.join(app_dir, ".git", "index")),
+		)
+
+		# packages rewritten in the new chair don't change the source chair's
+		with open(os.path.join(cloned_app_dir, "node_modules", "left-pad", "index.js"), "w") as f:
+			f.write("patched")
+		with open(os.path.join(app_dir, "node_modules", "left-pad", "index.js")) as f:
+			self.assertEqual(f.read(), "module.exports = {}")
+
+	def test_node_requirements_hash(self):
+		from unittest.mock import patch
+
+		from chair.utils.chair import update_yarn_packages
+
+		chair_dir = self.make_chair()
+
+		for app in ("app1", "app2"):
+			os.makedirs(os.path.join(chair_dir, "apps", app, "node_modules"))
+			with open(os.path.join(chair_dir, "apps", app, "package.json"), "w") as f:
+				f.write("{}")
+
+		with patch("chair.utils.chair.which", return_value="/usr/bin/yarn"), patch(
+			"chair.utils.exec_cmds", return_value=([], None)
+		) as exec_cmds:
+			update_yarn_packages(chair_dir, apps=["app1", "app2"])
+			self.assertEqual(exec_cmds.call_count, 2)
+
+			exec_cmds.reset_mock()
+			update_yarn_packages(chair_dir, apps=["app1", "app2"])
+			exec_cmds.assert_not_called()
+
+			with open(os.path.join(chair_dir, "apps", "app2", "yarn.lock"), "w") as f:
+				f.write("# yarn lockfile v1\n")
+			update_yarn_packages(chair_dir, apps=["app1", "app2"])
+			self.assertEqual(exec_cmds.call_count, 1)
+			self.assertTrue(exec_cmds.call_args[1]["cwd"].endswith("app2"))
+
+	def test_plan_asset_build(self):
+		from chair.utils.assets import plan_asset_build, record_asset_build
+
+		chair_dir = self.make_chair()
+
+		for app in ("vmraid", "app1", "app2"):
+			os.makedirs(os.path.join(chair_dir, "apps", app, app, "public", "js"))
+			os.makedirs(os.path.join(chair_dir, "sites", "assets", app))
+			with open(os.path.join(chair_dir, "apps", app, app, "public", "js", "index.js"), "w") as f:
+				f.write(f"// {app}")
+
+		chair = Chair(chair_dir)
+		chair.apps.apps = ["vmraid", "app1", "app2"]
+		chair.apps.states = {"app2": {"required": ["app1"]}}
+
+		to_build, skipped, records = plan_asset_build(chair)
+		self.assertIsNone(to_build)
+		record_asset_build(chair, records)
+
+		self.assertEqual(plan_asset_build(chair), ([], ["vmraid", "app1", "app2"], {}))
+
+		# build outputs don't count as inputs
+		os.makedirs(os.path.join(chair_dir, "apps", "app1", "app1", "public", "dist"))
+		with open(os.path.join(chair_dir, "apps", "app1", "app1", "public", "dist", "app1.bundle.js"), "w") as f:
+			f.write("")
+		self.assertEqual(plan_asset_build(chair)[0], [])
+
+		# app2 requires app1, so it's rebuilt too
+		with open(os.path.join(chair_dir, "apps", "app1", "app1", "public", "js", "index.js"), "a") as f:
+			f.write("\nconsole.log('changed')")
+		self.assertEqual(plan_asset_build(chair)[:2], (["app1", "app2"], ["vmraid"]))
+		self.assertEqual(plan_asset_build(chair, ["app2"])[:2], (["app2"], []))
+
+	def test_assets_cache(self):
+		from unittest.mock import patch
+
+		from chair.app import get_dirty_files
+		from chair.utils.assets import cache_built_assets, read_assets_json, restore_cached_assets
+
+		sandbox = self.make_tmp_dir()
+		chair_dir = os.path.join(sandbox, "chair1")
+		os.makedirs(os.path.join(chair_dir, "sites", "assets"))
+
+		for app in ("vmraid", "app1"):
+			app_dir = os.path.join(chair_dir, "apps", app)
+			os.makedirs(os.path.join(app_dir, app, "public", "dist", "js"))
+			with open(os.path.join(app_dir, ".gitignore"), "w") as f:
+				f.write("dist\n")
+			with open(os.path.join(app_dir, app, "public", "dist", "js", f"{app}.bundle.js"), "w") as f:
+				f.write(f"// {app}")
+			subprocess.run(["git", "init"], cwd=app_dir, capture_output=True, check=True)
+			subprocess.run(["git", "add", "."], cwd=app_dir, capture_output=True, check=True)
+			subprocess.run(["git", "commit", "-m", "init"], cwd=app_dir, capture_output=True, check=True)
+
+		with open(os.path.join(chair_dir, "sites", "assets", "assets.json"), "w") as f:
+			json.dump({"app1.bundle.js": "/assets/app1/dist/js/app1.bundle.js", "vmraid.bundle.js": "/assets/vmraid/dist/js/vmraid.bundle.js"}, f)
+		with open(os.path.join(chair_dir, "sites", "common_site_config.json"), "w") as f:
+			json.dump({"assets_cache": os.path.join(sandbox, "assets-cache")}, f)
+
+		chair = Chair(chair_dir)
+		cache_built_assets(chair, ["app1"])
+
+		shutil.rmtree(os.path.join(chair_dir, "apps", "app1", "app1", "public", "dist"))
+		with open(os.path.join(chair_dir, "sites", "assets", "assets.json"), "w") as f:
+			json.dump({"vmraid.bundle.js": "/assets/vmraid/dist/js/vmraid.bundle.js"}, f)
+
+		revisions = {}
+		with patch("chair.app.get_dirty_files", wraps=get_dirty_files) as dirty_files:
+			self.assertEqual(restore_cached_assets(chair, ["app1", "vmraid"], revisions), ["vmraid"])
+			cache_built_assets(chair, ["vmraid"], revisions)
+		# the framework's tree is checked once per build, not once per app
+		self.assertEqual(dirty_files.call_count, 2)
+		self.assertTrue(os.path.exists(os.path.join(chair_dir, "apps", "app1", "app1", "public", "dist", "js", "app1.bundle.js")))
+		self.assertEqual(len(read_assets_json(chair, "assets.json")), 2)
+
+		# uncommitted changes aren't described by the commit
+		with open(os.path.join(chair_dir, "apps", "app1", "app1", "hooks.py"), "w") as f:
+			f.write("")
+		self.assertEqual(restore_cached_assets(chair, ["app1"]), ["app1"])
+
+	def test_compress_assets(self):
+		import gzip
+
+		from chair.utils.assets import compress_assets
+
+		chair_dir = self.make_chair()
+		dist_dir = os.path.join(chair_dir, "apps", "app1", "app1", "public", "dist", "js")
+		os.makedirs(dist_dir)
+
+		bundle = os.path.join(dist_dir, "app1.bundle.ABCD1234.js")
+		with open(bundle, "w") as f:
+			f.write("console.log('app1');\n" * 100)
+		with open(os.path.join(dist_dir, "tiny.ABCD1234.js"), "w") as f:
+			f.write("1")
+		with open(os.path.join(dist_dir, "vendor.js"), "w") as f:
+			f.write("console.log('vendor');\n" * 100)
+
+		chair = Chair(chair_dir)
+		compress_assets(chair, ["app1"])
+
+		with gzip.open(f"{bundle}.gz") as f, open(bundle, "rb") as original:
+			self.assertEqual(f.read(), original.read())
+		self.assertFalse(os.path.exists(os.path.join(dist_dir, "tiny.ABCD1234.js.gz")))
+		# files that aren't fingerprinted may be rebuilt without chair compressing them
+		self.assertFalse(os.path.exists(os.path.join(dist_dir, "vendor.js.gz")))
+
+		# up to date siblings aren't compressed again
+		inode = os.stat(f"{bundle}.gz").st_ino
+		compress_assets(chair, ["app1"])
+		self.assertEqual(os.stat(f"{bundle}.gz").st_ino, inode)
+
+	def test_backup_all_sites(self):
+		from unittest.mock import patch
+
+		from chair.utils import system
+		from chair.utils.chair import get_backup_job_commands
+		from chair.utils.forkserver import ForkServer
+
+		chair_dir = self.make_chair()
+		sites = ["site1", "site2", "site3"]
+		started = {}
+
+		def backup_site_throttled(site, chair_path=".", server=None):
+			started[site] = time.monotonic()
+			stats = {"site": site, "started_at": 0, "duration": 0, "size": 1, "returncode": int(site == "site2")}
+			return stats, ""
+
+		chair = Chair(chair_dir)
+
+		with patch.object(type(chair), "sites", sites), patch.object(
+			system, "backup_site_throttled", side_effect=backup_site_throttled
+		):
+			with self.assertRaises(CommandFailedError):
+				system.backup_all_sites(chair_dir, jobs=3, stagger=0.3)
+
+		# starts are spread over the stagger window
+		self.assertGreaterEqual(started["site3"] - started["site1"], 0.19)
+
+		with open(os.path.join(chair_dir, "logs", "backups.jsonl")) as f:
+			self.assertEqual([json.loads(line)["site"] for line in f], sites)
+
+		# backups are only spread out when run by the cronjob
+		self.assertIn("backup-all-sites --stagger 900", get_backup_job_commands(chair_dir)[0])
+
+		# backups forked by a server run with its priority
+		chair_dir = self.make_chair(
+			helper="import os, sys\nif __name__ == '__main__':\n\tprint(os.nice(0), *sys.argv[1:])\n"
+		)
+		server = ForkServer(chair_dir, prefix=system.get_low_priority_prefix())
+		self.assertTrue(server.start())
+		self.addCleanup(server.close)
+
+		stats, output = system.backup_site_throttled("site1", chair_path=chair_dir, server=server)
+		self.assertEqual(stats["returncode"], 0)
+		self.assertEqual(
+			output.split(),
+			[str(os.nice(0) + (10 if shutil.which("nice") else 0)), "vmraid", "--site", "site1", "backup"],
+		)
+
+	def test_migrate_sites(self):
+		from io import BytesIO
+		from unittest.mock import MagicMock, patch
+
+		from chair.config.site_config import get_site_config, put_site_config
+		from chair.exceptions import PatchError
+		from chair.utils import system
+		from chair.utils.chair import patch_sites
+
+		chair_dir = self.make_chair()
+		sites = ["site1", "site2", "site3", "site4"]
+		for site in sites:
+			os.makedirs(os.path.join(chair_dir, "sites", site))
+			put_site_config(site, {"db_name": site}, chair_path=chair_dir)
+
+		in_maintenance = {}
+
+		def popen(cmd, **kwargs):
+			if "--site" not in cmd:
+				# the fork-servers, sites are migrated in processes of their own without them
+				raise OSError
+			site = cmd[cmd.index("--site") + 1]
+			in_maintenance[site] = get_site_config(site, chair_path=chair_dir).get("maintenance_mode")
+			p = MagicMock(stdout=BytesIO())
+			p.wait.return_value = int(site == "site2")
+			return p
+
+		with patch("subprocess.Popen", side_effect=popen):
+			summary = system.migrate_sites(chair_dir, sites=sites, jobs=2, wave_size=2)
+
+		self.assertEqual(summary, {"migrated": ["site1"], "failed": ["site2"], "skipped": ["site3", "site4"]})
+		self.assertEqual(in_maintenance, {"site1": 1, "site2": 1})
+
+		# maintenance is lifted only for sites that were migrated
+		self.assertEqual(get_site_config("site1", chair_path=chair_dir), {"db_name": "site1"})
+		self.assertEqual(get_site_config("site2", chair_path=chair_dir).get("maintenance_mode"), 1)
+		self.assertNotIn("maintenance_mode", get_site_config("site3", chair_path=chair_dir))
+
+		with patch.object(system, "migrate_sites", return_value=summary):
+			with self.assertRaisesRegex(PatchError, "site2.*weren't started: site3, site4"):
+				patch_sites(chair_dir)
+
+	def test_migrate_runner(self):
+		from chair.daemon import get_route
+		from chair.utils.forkserver import ForkServer
+		from chair.utils.system import migrate_sites
+
+		chair_dir = self.make_chair(
+			helper=(
+				"import os, sys\n"
+				"if __name__ == '__main__':\n"
+				"\tprint(os.getpid(), *sys.argv[1:])\n"
+				"\tif sys.argv[3] == 'site4':\n"
+				"\t\tos._exit(3)\n"
+				"\tsys.exit(sys.argv[3] == 'site2')\n"
+			)
+		)
+
+		server = ForkServer(chair_dir)
+		self.assertTrue(server.start())
+		self.addCleanup(server.close)
+		pid = str(server.process.pid)
+
+		results = []
+		for site in ("site1", "site2", "site3", "site4", "site1"):
+			p = server.run(["--site", site, "migrate"], stdout=subprocess.PIPE, inline=True)
+			results.append((p.stdout.read().decode().split(), p.wait()))
+
+		self.assertEqual([returncode for _, returncode in results], [0, 1, 0, 1, 0])
+		# sites are migrated in the server itself, each with its own output
+		outputs = [output for output, _ in results]
+		self.assertEqual({output[0] for output in outputs[:4]}, {pid})
+		self.assertEqual(outputs[2][1:], ["vmraid", "--site", "site3", "migrate"])
+		# a server taken down by a site is started again for the next
+		self.assertNotEqual(outputs[4][0], pid)
+
+		for site in ("site1", "site2"):
+			os.makedirs(os.path.join(chair_dir, "sites", site))
+
+		summary = migrate_sites(chair_dir, sites=["site1", "site2"], jobs=2)
+		self.assertEqual(summary, {"migrated": ["site1"], "failed": ["site2"], "skipped": []})
+
+		# chair migrates sites itself when given --sites
+		self.assertFalse(get_route(["migrate", "--sites", "all"], [], ["migrate"])["vmraid_cmd"])
+		self.assertTrue(get_route(["--site", "site1", "migrate"], [], ["migrate"])["vmraid_cmd"])
+		self.assertFalse(get_route(["--verbose", "migrate", "--sites", "all"], [], ["migrate"])["vmraid_cmd"])
+		self.assertFalse(get_route(["--site", "site1", "migrate", "--sites=all"], [], ["migrate"])["vmraid_cmd"])
+		self.assertTrue(get_route(["--site", "site1", "backup", "--sites"], [], ["backup"])["vmraid_cmd"])
+
+	def test_run_on_sites(self):
+		from contextlib import redirect_stdout
+		from io import StringIO
+
+		from chair.utils import parse_fanout_argv
+		from chair.utils.system import run_on_sites
+
+		self.assertEqual(parse_fanout_argv(["--site", "all", "--jobs=4", "clear-cache"]), (4, ["clear-cache"]))
+		self.assertEqual(parse_fanout_argv(["--jobs", "2", "--site=all", "execute", "--args", "x"]), (2, ["execute", "--args", "x"]))
+		self.assertIsNone(parse_fanout_argv(["--site", "all", "clear-cache"]))
+		self.assertIsNone(parse_fanout_argv(["--site", "site1", "--jobs", "4", "clear-cache"]))
+		self.assertIsNone(parse_fanout_argv(["--site", "all", "--verbose", "--jobs", "4", "clear-cache"]))
+
+		chair_dir = self.make_chair(
+			helper=(
+				"import sys\n"
+				"if __name__ == '__main__':\n"
+				"\tprint('cleared', sys.argv[3])\n"
+				"\tprint('error', file=sys.stderr)\n"
+				"\tsys.exit(3 if sys.argv[3] == 'site2' else 0)\n"
+			)
+		)
+
+		sites = ["site1", "site2", "site3"]
+		for site in sites:
+			os.makedirs(os.path.join(chair_dir, "sites", site))
+			open(os.path.join(chair_dir, "sites", site, "site_config.json"), "w").write("{}")
+
+		output = StringIO()
+		with redirect_stdout(output):
+			self.assertEqual(run_on_sites(["clear-cache"], jobs=2, chair_path=chair_dir), 3)
+
+		lines = output.getvalue().splitlines()
+		for site in sites:
+			self.assertIn(f"{site} | cleared {site}", lines)
+			self.assertIn(f"{site} | error", lines)
+		self.assertTrue(any(line.startswith("site2") and "exited with 3" in line for line in lines))
@@ -5,14 +5,12 @@ import os
 import subprocess
 import re
 import sys
-from glob import glob
 from shlex import split
-from typing import List, Tuple
+from typing import List, Tuple, Union
 from functools import lru_cache
 
 # imports - third party imports
 import click
-import requests
 
 # imports - module imports
 from chair import PROJECT_NAME, VERSION
@@ -37,17 +35,69 @@ def is_chair_directory(directory=os.path.curdir):
 	return is_chair
 
 
+# {app directory: (mtimes, is vmraid app)}
+_vmraid_app_cache = {}
+
+
 def is_vmraid_app(directory: str) -> bool:
-	is_vmraid_app = True
+	"""Checks if directory contains hooks.py, modules.txt & patches.txt in one of its
+	packages. The conventional layout <directory>/<app>/ is checked first, falling back
+	to a scan of its immediate sub directories. Results are cached per directory until
+	its mtime or that of its conventional package changes."""
+	directory = os.path.abspath(directory)
+	package_path = os.path.join(directory, os.path.basename(directory))
+
+	try:
+		mtimes = (os.stat(directory).st_mtime_ns, os.stat(package_path).st_mtime_ns)
+	except FileNotFoundError:
+		mtimes = None
+
+	cached = _vmraid_app_cache.get(directory)
+	if mtimes and cached and cached[0] == mtimes:
+		return cached[1]
+
+	is_vmraid_app = all(
+		os.path.isfile(os.path.join(package_path, path)) for path in paths_in_app
+	) or _scan_for_app_paths(directory)
+
+	if mtimes:
+		_vmraid_app_cache[directory] = (mtimes, is_vmraid_app)
+
+	return is_vmraid_app
+
+
+def _scan_for_app_paths(directory: str) -> bool:
+	"""Checks if each of paths_in_app exists in some immediate sub directory of directory"""
+	missing = set(paths_in_app)
+
+	try:
+		with os.scandir(directory) as entries:
+			for entry in entries:
+				if entry.name.startswith(".") or entry.name == "node_modules":
+					continue
+				if not entry.is_dir():
+					continue
+				missing = {
+					path for path in missing if not os.path.isfile(os.path.join(entry.path, path))
+				}
+				if not missing:
+					return True
+	except (FileNotFoundError, NotADirectoryError):
+		pass
+
+	return False
 
-	for folder in paths_in_app:
-		if not is_vmraid_app:
-			break
 
-		path = glob(os.path.join(directory, "**", folder))
-		is_vmraid_app = is_vmraid_app and path
+def get_chair_cache_dir(*paths) -> str:
+	"""Returns the path to the host-level cache shared by all chairs of the user"""
+	cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+	return os.path.join(cache_home, "chair", *paths)
 
-	return bool(is_vmraid_app)
+
+def is_offline() -> bool:
+	"""Set via CHAIR_OFFLINE (or get-app's --offline) for air-gapped setups, where
+	apps are resolved & cloned from the host's caches instead of remotes"""
+	return bool(os.environ.get("CHAIR_OFFLINE"))
 
 
 def is_valid_vmraid_branch(vmraid_path:str, vmraid_branch:str):
@@ -62,6 +112,17 @@ def is_valid_vmraid_branch(vmraid_path:str, vmraid_branch:str):
 	:type vmraid_branch: str
 	:raises InvalidRemoteException: branch for this repo doesn't exist
 	"""
+	if is_offline():
+		return
+
+	_is_valid_vmraid_branch(vmraid_path, vmraid_branch)
+
+
+@lru_cache(maxsize=None)
+def _is_valid_vmraid_branch(vmraid_path:str, vmraid_branch:str):
+	"""Only branches that exist are cached, a missing one raises every time"""
+	import requests
+
 	if "http" in vmraid_path and vmraid_branch:
 		vmraid_path = vmraid_path.replace(".git", "")
 		try:
@@ -158,6 +219,49 @@ def exec_cmd(cmd, cwd=".", env=None, _raise=True):
 	return return_code
 
 
+def exec_cmds(cmds: List[str], cwd=".") -> Tuple[List[Tuple[str, str]], Union[str, None]]:
+	"""Runs commands one after the other, capturing their output instead of printing
+	it, so it's safe to call from multiple threads. Stops at the first failing command.
+
+	Returns the (command, output) pairs of the commands that ran and the failed
+	command, if any.
+	"""
+	results = []
+
+	for cmd in cmds:
+		cwd_info = f"cd {cwd} && " if cwd != "." else ""
+		cmd_log = f"{cwd_info}{cmd}"
+		logger.debug(cmd_log)
+		p = subprocess.run(
+			split(cmd),
+			cwd=cwd,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT,
+			universal_newlines=True,
+		)
+		results.append((cmd, p.stdout))
+
+		if p.returncode:
+			logger.warning(f"{cmd_log} executed with exit code {p.returncode}")
+			return results, cmd
+
+	return results, None
+
+
+def run_in_parallel(func, items: List, jobs: int = None):
+	"""Calls func for every item in a pool of `jobs` threads. Yields (item, result)
+	pairs in the order of items, each as soon as it and the ones before it are done."""
+	from concurrent.futures import ThreadPoolExecutor
+
+	jobs = max(1, min(jobs or len(items), len(items)))
+
+	with ThreadPoolExecutor(max_workers=jobs) as executor:
+		futures = [executor.submit(func, item) for item in items]
+
+		for item, future in zip(items, futures):
+			yield item, future.result()
+
+
 def which(executable: str, raise_err: bool = False) -> str:
 	from shutil import which
 
@@ -226,13 +330,38 @@ def is_root():
 	return os.getuid() == 0
 
 
+def get_vmraid_cmd(*args, chair_path=".") -> List[str]:
+	"""Returns the command that runs the framework's CLI with args in the chair's env"""
+	from chair.utils.chair import get_env_cmd
+
+	python = get_env_cmd("python", chair_path=chair_path)
+	return [python, "-m", "vmraid.utils.chair_helper", "vmraid", *args]
+
+
+def popen_vmraid_cmd(*args, chair_path=".", server=None, stdout=None, stderr=None, inline=False, prefix=None):
+	"""Runs the framework command in the given ForkServer, or in a process of its
+	own (run with `prefix`, eg: nice) if there's none or it can't be started again.
+	Returns a Popen-like handle."""
+	if server:
+		try:
+			return server.run(args, stdout=stdout, stderr=stderr, inline=inline)
+		except OSError:
+			# the server went away with an earlier command & couldn't be started again
+			pass
+
+	return subprocess.Popen(
+		[*(prefix or []), *get_vmraid_cmd(*args, chair_path=chair_path)],
+		cwd=os.path.join(chair_path, "sites"),
+		stdout=stdout,
+		stderr=stderr,
+	)
+
+
 def run_vmraid_cmd(*args, **kwargs):
 	from chair.cli import from_command_line
-	from chair.utils.chair import get_env_cmd
+	from chair.utils.forkserver import get_forkserver
 
 	chair_path = kwargs.get("chair_path", ".")
-	f = get_env_cmd("python", chair_path=chair_path)
-	sites_dir = os.path.join(chair_path, "sites")
 
 	is_async = False if from_command_line else True
 	if is_async:
@@ -240,9 +369,10 @@ def run_vmraid_cmd(*args, **kwargs):
 	else:
 		stderr = stdout = None
 
-	p = subprocess.Popen(
-		(f, "-m", "vmraid.utils.chair_helper", "vmraid") + args,
-		cwd=sites_dir,
+	p = popen_vmraid_cmd(
+		*args,
+		chair_path=chair_path,
+		server=get_forkserver(chair_path),
 		stdout=stdout,
 		stderr=stderr,
 	)
@@ -384,25 +514,123 @@ def find_parent_chair(path: str) -> str:
 		return find_parent_chair(parent_dir)
 
 
+def read_git_head(repo_dir: str) -> str:
+	"""Returns the commit hash checked out in repo_dir by reading .git directly,
+	without spawning git. Returns an empty string if it can't be determined."""
+	git_dir = os.path.join(repo_dir, ".git")
+
+	try:
+		with open(os.path.join(git_dir, "HEAD")) as f:
+			head = f.read().strip()
+	except (FileNotFoundError, NotADirectoryError):
+		return ""
+
+	if not head.startswith("ref:"):
+		# detached HEAD
+		return head
+
+	ref = head.split(":", 1)[1].strip()
+
+	try:
+		with open(os.path.join(git_dir, ref)) as f:
+			return f.read().strip()
+	except FileNotFoundError:
+		pass
+
+	try:
+		with open(os.path.join(git_dir, "packed-refs")) as f:
+			for line in f:
+				if line.rstrip().endswith(f" {ref}"):
+					return line.split()[0]
+	except FileNotFoundError:
+		pass
+
+	return ""
+
+
+def get_command_cache_fingerprint(chair_path=".") -> str:
+	"""Fingerprints the sources that can change the available framework commands:
+	the apps listed in apps.txt, their checked out commits and the mtimes of
+	their hooks.py & commands modules"""
+	from hashlib import sha256
+
+	try:
+		with open(os.path.join(chair_path, "sites", "apps.txt")) as f:
+			apps = f.read().split()
+	except FileNotFoundError:
+		apps = []
+
+	fingerprint = sha256()
+
+	for app in apps:
+		app_path = os.path.join(chair_path, "apps", app)
+		module_path = os.path.join(app_path, app)
+		paths = [
+			os.path.join(module_path, "hooks.py"),
+			os.path.join(module_path, "commands.py"),
+		]
+
+		try:
+			with os.scandir(os.path.join(module_path, "commands")) as entries:
+				paths.extend(entry.path for entry in entries if entry.name.endswith(".py"))
+		except (FileNotFoundError, NotADirectoryError):
+			pass
+
+		fingerprint.update(f"{app}:{read_git_head(app_path)}".encode())
+
+		for path in sorted(paths):
+			try:
+				fingerprint.update(f"{path}:{os.stat(path).st_mtime_ns}".encode())
+			except FileNotFoundError:
+				continue
+
+	return fingerprint.hexdigest()
+
+
+def get_cached_commands(chair_path=".") -> Union[set, None]:
+	"""Returns the cached framework commands, or None if the cache doesn't exist or
+	its fingerprint doesn't match the apps currently installed on the chair"""
+	cache_path = os.path.join(chair_path, chair_cache_file)
+
+	try:
+		with open(cache_path) as f:
+			cache = json.loads(f.read() or "{}")
+	except (FileNotFoundError, json.JSONDecodeError):
+		return None
+
+	# caches from older versions of chair are plain lists without a fingerprint
+	if not isinstance(cache, dict):
+		return None
+
+	if cache.get("fingerprint") != get_command_cache_fingerprint(chair_path):
+		return None
+
+	return set(cache.get("commands", []))
+
+
 def generate_command_cache(chair_path=".") -> List:
 	"""Caches all available commands (even custom apps) via VMRaid
 	Default caching behaviour: generated the first time any command (for a specific chair directory)
+	and rebuilt whenever the fingerprint of the installed apps changes
 	"""
 	from chair.utils.chair import get_env_cmd
 
 	python = get_env_cmd("python", chair_path=chair_path)
 	sites_path = os.path.join(chair_path, "sites")
+	cache_path = os.path.join(chair_path, chair_cache_file)
 
-	if os.path.exists(chair_cache_file):
-		os.remove(chair_cache_file)
+	if os.path.exists(cache_path):
+		os.remove(cache_path)
 
 	try:
+		fingerprint = get_command_cache_fingerprint(chair_path)
 		output = get_cmd_output(
 			f"{python} -m vmraid.utils.chair_helper get-vmraid-commands", cwd=sites_path
 		)
-		with open(chair_cache_file, "w") as f:
-			json.dump(eval(output), f)
-		return json.loads(output)
+		commands = json.loads(output)
+		with open(cache_path, "w") as f:
+			json.dump({"fingerprint": fingerprint, "commands": commands}, f)
+		return commands
 
 	except subprocess.CalledProcessError as e:
 		if hasattr(e, "stderr"):
@@ -413,21 +641,33 @@ def generate_command_cache(chair_path=".") -> List:
 
 def clear_command_cache(chair_path="."):
 	"""Clears commands cached
-	Default invalidation behaviour: destroyed on each run of `chair update`
+	Default invalidation behaviour: rebuilt when the installed apps' fingerprint changes
 	"""
+	cache_path = os.path.join(chair_path, chair_cache_file)
 
-	if os.path.exists(chair_cache_file):
-		os.remove(chair_cache_file)
+	if os.path.exists(cache_path):
+		os.remove(cache_path)
 	else:
 		print("Chair command cache doesn't exist in this folder!")
 
 
 def find_org(org_repo):
-	import requests
+	return _find_org(org_repo[0])
 
-	org_repo = org_repo[0]
+
+@lru_cache(maxsize=None)
+def _find_org(org_repo):
+	import requests
 
 	for org in ["vmraid", "erpadda"]:
+		if is_offline():
+			# known if the host has fetched it before
+			if os.path.exists(get_chair_cache_dir("git", "github.com", org, f"{org_repo}.git")) or (
+				os.path.exists(get_chair_cache_dir("deps", org, org_repo))
+			):
+				return org, org_repo
+			continue
+
 		res = requests.head(f"https://api.github.com/repos/{org}/{org_repo}")
 		if res.status_code in (400, 403):
 			res = requests.head(f"https://github.com/{org}/{org_repo}")
@@ -533,6 +773,33 @@ class _dict(dict):
 		return _dict(dict(self).copy())
 
 
+def parse_fanout_argv(argv: List[str]) -> Union[Tuple[int, List[str]], None]:
+	"""Returns the number of jobs & the framework command of a `--site all --jobs N
+	command...` invocation, or None if argv isn't one"""
+	site = jobs = None
+	args = list(argv)
+
+	while args and args[0].startswith("-"):
+		option, _, value = args.pop(0).partition("=")
+
+		if option not in ("--site", "--jobs"):
+			return None
+		if not value:
+			if not args:
+				return None
+			value = args.pop(0)
+
+		if option == "--site":
+			site = value
+		else:
+			jobs = value
+
+	if site != "all" or not (jobs and jobs.isdigit() and int(jobs) > 0) or not args:
+		return None
+
+	return int(jobs), args
+
+
 def parse_sys_argv():
 	sys_argv = _dict(options=set(), commands=set())
 
@@ -1,6 +1,5 @@
 import os
 import re
-from setuptools.config import read_configuration
 import sys
 import subprocess
 from chair.exceptions import (
@@ -11,6 +10,10 @@ from chair.exceptions import (
 )
 from chair.app import get_repo_dir
 from functools import lru_cache
+import click
+
+# seconds for which fetched dependency manifests are used without asking the remote again
+DEPS_CACHE_TTL = 60 * 60
 
 
 def is_version_upgrade(app="vmraid", chair_path=".", branch=None):
@@ -39,6 +42,7 @@ def switch_branch(branch, apps=None, chair_path=".", upgrade=False, check_upgrad
 		patch_sites,
 		post_upgrade,
 	)
+	from chair.utils.git_cache import sync_git_cache
 	from chair.utils.system import backup_all_sites
 
 	apps_dir = os.path.join(chair_path, "apps")
@@ -61,6 +65,9 @@ def switch_branch(branch, apps=None, chair_path=".", upgrade=False, check_upgrad
 		unshallow_flag = os.path.exists(os.path.join(app_dir, ".git", "shallow"))
 		log(f"Fetching upstream {'unshallow ' if unshallow_flag else ''}for {app}")
 
+		if Chair(chair_path).conf.get("use_git_cache"):
+			sync_git_cache(app_dir)
+
 		exec_cmd("git remote set-branches upstream  '*'", cwd=app_dir)
 		exec_cmd(
 			f"git fetch --all{' --unshallow' if unshallow_flag else ''} --quiet", cwd=app_dir
@@ -166,30 +173,103 @@ def get_current_branch(app, chair_path="."):
 	from chair.utils import get_cmd_output
 
 	repo_dir = get_repo_dir(app, chair_path=chair_path)
-	return get_cmd_output("basename $(git symbolic-ref -q HEAD)", cwd=repo_dir)
+	return get_cmd_output("git rev-parse --abbrev-ref HEAD", cwd=repo_dir)
 
 
-@lru_cache(maxsize=5)
+@lru_cache(maxsize=None)
 def get_required_deps(org, name, branch, deps="hooks.py"):
+	"""Returns the contents of the app's `deps` file at branch. Fetched contents are
+	cached on disk & reused for DEPS_CACHE_TTL seconds, or indefinitely when offline,
+	where the host's git mirror of the app is used if it isn't cached."""
+	import json
+	import time
+	from chair.utils import is_offline
+
+	branch = branch or "develop"
+	cache_path = get_deps_cache_path(org, name, branch, deps)
+
+	try:
+		with open(cache_path) as f:
+			cached = json.load(f)
+	except (OSError, ValueError):
+		cached = None
+
+	if cached and (is_offline() or time.time() - cached["fetched_at"] < DEPS_CACHE_TTL):
+		return cached["content"]
+
+	if is_offline():
+		content = get_deps_from_git_cache(org, name, branch, deps)
+		if content is None:
+			raise FileNotFoundError(
+				f"{deps} of {org}/{name}@{branch} isn't available offline, fetch the app"
+				" once with network access or add it to the git cache"
+			)
+		return content
+
+	try:
+		content = fetch_required_deps(org, name, branch, deps)
+	except Exception as e:
+		if not cached:
+			raise
+		click.secho(f"Couldn't fetch {deps} of {org}/{name}@{branch}, using cached copy: {e}", fg="yellow")
+		return cached["content"]
+
+	os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+	tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+	with open(tmp_path, "w") as f:
+		json.dump({"fetched_at": time.time(), "content": content}, f)
+	os.replace(tmp_path, cache_path)
+
+	return content
+
+
+def fetch_required_deps(org, name, branch, deps="hooks.py"):
 	import requests
 	import base64
 
 	git_api_url = f"https://api.github.com/repos/{org}/{name}/contents/{name}/{deps}"
-	params = {"branch": branch or "develop"}
-	res = requests.get(url=git_api_url, params=params).json()
+	res = requests.get(url=git_api_url, params={"ref": branch}).json()
 
 	if "message" in res:
-		git_url = f"https://raw.githubusercontent.com/{org}/{name}/{params['branch']}/{deps}"
-		return requests.get(git_url).text
+		git_url = f"https://raw.githubusercontent.com/{org}/{name}/{branch}/{name}/{deps}"
+		res = requests.get(git_url)
+		res.raise_for_status()
+		return res.text
 
 	return base64.decodebytes(res["content"].encode()).decode()
 
 
+def get_deps_cache_path(org, name, branch, deps="hooks.py"):
+	from urllib.parse import quote
+	from chair.utils import get_chair_cache_dir
+
+	# branches may contain slashes
+	return get_chair_cache_dir("deps", org, name, quote(branch, safe=""), f"{deps}.json")
+
+
+def get_deps_from_git_cache(org, name, branch, deps="hooks.py"):
+	from chair.utils.git_cache import get_git_cache_path
+
+	mirror = get_git_cache_path(f"https://github.com/{org}/{name}.git")
+
+	if not os.path.exists(mirror):
+		return None
+
+	try:
+		return subprocess.check_output(
+			["git", "--git-dir", mirror, "show", f"{branch}:{name}/{deps}"], stderr=subprocess.DEVNULL
+		).decode()
+	except subprocess.CalledProcessError:
+		return None
+
+
 def required_apps_from_hooks(required_deps, local=False):
 	if local:
 		with open(required_deps) as f:
 			required_deps = f.read()
 	lines = [x for x in required_deps.split("\n") if x.strip().startswith("required_apps")]
+	if not lines:
+		return []
 	required_apps = eval(lines[0].strip("required_apps").strip().lstrip("=").strip())
 	return required_apps
 
@@ -210,7 +290,24 @@ def get_remote(app, chair_path="."):
 		return contents.splitlines()[0].split()[0]
 
 
+def get_remote_url(app, chair_path="."):
+	"""Returns the url of the app's upstream remote, None if it doesn't have one"""
+	try:
+		remote = get_remote(app, chair_path=chair_path)
+		if not remote:
+			return None
+		return subprocess.check_output(
+			["git", "remote", "get-url", remote],
+			cwd=get_repo_dir(app, chair_path=chair_path),
+			stderr=subprocess.DEVNULL,
+		).decode("utf-8").strip()
+	except (subprocess.CalledProcessError, FileNotFoundError, NotADirectoryError):
+		return None
+
+
 def get_app_name(chair_path, repo_name):
+	from setuptools.config import read_configuration
+
 	app_name = None
 	apps_path = os.path.join(os.path.abspath(chair_path), "apps")
 	config_path = os.path.join(apps_path, repo_name, "setup.cfg")
@@ -237,6 +334,8 @@ def check_existing_dir(chair_path, repo_name):
 
 
 def get_current_version(app, chair_path="."):
+	from setuptools.config import read_configuration
+
 	current_version = None
 	repo_dir = get_repo_dir(app, chair_path=chair_path)
 	config_path = os.path.join(repo_dir, "setup.cfg")
@@ -0,0 +1,430 @@
+# imports - standard imports
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import typing
+from functools import lru_cache
+from hashlib import sha256
+from typing import Dict, List, Tuple, Union
+
+# imports - module imports
+from chair import PROJECT_NAME
+
+if typing.TYPE_CHECKING:
+	from chair.chair import Chair
+
+
+logger = logging.getLogger(PROJECT_NAME)
+# directories under an app's public folder that are written by builds, not read by them
+BUILD_OUTPUT_DIRS = ("dist", "node_modules", "__pycache__")
+# files at the root of an app's repo that configure its build
+BUILD_CONFIG_FILES = ("package.json", "yarn.lock")
+# directories at the root of the framework's repo that hold the build tooling
+BUILD_TOOLING_DIRS = ("esbuild", "rollup")
+# files in sites/assets mapping bundle names to the built files of all apps
+ASSETS_JSON_FILES = ("assets.json", "assets-rtl.json")
+# fingerprinted built files, served precompressed by nginx (gzip_static) from their
+# .gz siblings. A new build gives them new names, so a build that isn't followed by
+# compress_assets, like the framework's `chair build`, can't leave stale siblings.
+FINGERPRINTED_FILE_PATTERN = re.compile(r"\.[0-9A-Z]{8}\.(js|css)(\.map)?$")
+# gzip_min_length of nginx.conf, smaller files aren't worth compressing
+MIN_COMPRESS_SIZE = 256
+
+
+def get_assets_manifest_path(chair_path=".") -> str:
+	return os.path.join(chair_path, "sites", "chair_assets.json")
+
+
+def read_assets_manifest(chair_path=".") -> Dict:
+	"""The manifest has the content hashes of every app's build inputs as of its last
+	build ("builds") & a stat cache of the hashed files ("files"), so unchanged files
+	aren't read again"""
+	try:
+		with open(get_assets_manifest_path(chair_path)) as f:
+			manifest = json.load(f)
+	except (FileNotFoundError, ValueError):
+		manifest = {}
+
+	manifest.setdefault("builds", {})
+	manifest.setdefault("files", {})
+	return manifest
+
+
+def write_assets_manifest(manifest: Dict, chair_path="."):
+	manifest_path = get_assets_manifest_path(chair_path)
+	tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+
+	with open(tmp_path, "w") as f:
+		json.dump(manifest, f)
+	os.replace(tmp_path, manifest_path)
+
+
+def get_asset_inputs(app: str, chair_path=".") -> List[str]:
+	"""Returns paths, relative to the app's repo, of the files its assets are built from"""
+	app_path = os.path.join(chair_path, "apps", app)
+	inputs = [
+		filename
+		for filename in BUILD_CONFIG_FILES + (os.path.join(app, "hooks.py"),)
+		if os.path.isfile(os.path.join(app_path, filename))
+	]
+
+	for directory in (os.path.join(app, "public"),) + BUILD_TOOLING_DIRS:
+		for root, dirs, files in os.walk(os.path.join(app_path, directory)):
+			dirs[:] = [d for d in dirs if d not in BUILD_OUTPUT_DIRS]
+			inputs.extend(os.path.relpath(os.path.join(root, f), app_path) for f in files)
+
+	return sorted(inputs)
+
+
+def get_asset_inputs_hash(app: str, chair_path=".", files_cache: Dict = None) -> str:
+	"""Returns a hash of the contents of the app's build inputs. files_cache maps
+	paths to their [size, mtime, hash] & is updated in place, files whose size &
+	mtime didn't change aren't read again."""
+	app_path = os.path.join(chair_path, "apps", app)
+	files_cache = {} if files_cache is None else files_cache
+	inputs_hash = sha256()
+	seen = set()
+
+	for path in get_asset_inputs(app, chair_path):
+		file_path = os.path.join(app_path, path)
+		try:
+			stat = os.stat(file_path)
+		except FileNotFoundError:
+			# eg: broken symlinks
+			continue
+
+		cached = files_cache.get(path)
+		if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+			file_hash = cached[2]
+		else:
+			with open(file_path, "rb") as f:
+				file_hash = sha256(f.read()).hexdigest()
+			files_cache[path] = [stat.st_size, stat.st_mtime_ns, file_hash]
+
+		inputs_hash.update(f"{path}\0{file_hash}\0".encode())
+		seen.add(path)
+
+	for path in set(files_cache) - seen:
+		del files_cache[path]
+
+	return inputs_hash.hexdigest()
+
+
+def get_asset_dependencies(chair: "Chair", app: str) -> List[str]:
+	"""Apps whose sources go into the app's bundles, ie the framework & the apps it
+	requires"""
+	required = chair.apps.states.get(app, {}).get("required", [])
+	return [dep for dep in ["vmraid", *required] if dep != app]
+
+
+def plan_asset_build(
+	chair: "Chair", apps: List = None, force=False
+) -> Tuple[Union[List, None], List, Dict]:
+	"""Decides which of the apps (all by default) need their assets built, ie apps
+	whose build inputs or whose dependencies' inputs changed since their last build.
+
+	Returns the apps to build (None if everything needs a full build since the
+	framework changed), the apps skipped & the build records to pass to
+	`record_asset_build` once built.
+	"""
+	manifest = read_assets_manifest(chair.name)
+	hashes = {}
+
+	def get_hash(app):
+		if app not in hashes:
+			files_cache = manifest["files"].setdefault(app, {})
+			hashes[app] = get_asset_inputs_hash(app, chair.name, files_cache)
+		return hashes[app]
+
+	def get_record(app):
+		return {
+			"hash": get_hash(app),
+			"deps": {dep: get_hash(dep) for dep in get_asset_dependencies(chair, app)},
+		}
+
+	def is_built(app):
+		return manifest["builds"].get(app) == get_record(app) and os.path.exists(
+			os.path.join(chair.name, "sites", "assets", app)
+		)
+
+	candidates = list(apps or chair.apps)
+	to_build = [app for app in candidates if force or not is_built(app)]
+	skipped = [app for app in candidates if app not in to_build]
+
+	# the framework's bundles are shared by all apps
+	if "vmraid" in to_build:
+		to_build, skipped = None, []
+
+	built = chair.apps if to_build is None else to_build
+	records = {app: get_record(app) for app in built}
+
+	for app in set(manifest["files"]) - set(chair.apps) - set(hashes):
+		del manifest["files"][app]
+	write_assets_manifest(manifest, chair.name)
+
+	return to_build, skipped, records
+
+
+def record_asset_build(chair: "Chair", records: Dict):
+	manifest = read_assets_manifest(chair.name)
+	manifest["builds"].update(records)
+	write_assets_manifest(manifest, chair.name)
+
+
+def get_assets_cache_dir(chair: "Chair") -> Union[str, None]:
+	"""Returns the directory built assets are cached in, set by assets_cache in
+	common_site_config.json. Chairs running the same commits, eg on other nodes
+	sharing the directory, restore assets from it instead of building them."""
+	assets_cache = chair.conf.get("assets_cache")
+	return os.path.abspath(os.path.expanduser(assets_cache)) if assets_cache else None
+
+
+@lru_cache(maxsize=None)
+def get_node_version() -> str:
+	try:
+		return subprocess.check_output(["node", "--version"]).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return ""
+
+
+def get_assets_cache_key(chair: "Chair", app: str, revisions: Dict = None) -> Union[str, None]:
+	"""Returns the key of the app's built assets, derived from the commits of the app
+	& its dependencies (the framework being the build tool) & the node version. None
+	if any of them has uncommitted changes, since commits don't describe those."""
+	cache_key = sha256(get_node_version().encode())
+
+	for _app in [app, *get_asset_dependencies(chair, app)]:
+		commit = get_app_revision(chair, _app, revisions)
+
+		if not commit:
+			return None
+
+		cache_key.update(f"{_app}\0{commit}\0".encode())
+
+	return cache_key.hexdigest()
+
+
+def get_app_revision(chair: "Chair", app: str, revisions: Dict = None) -> Union[str, None]:
+	"""Returns the app's checked out commit, None if it has uncommitted changes or
+	isn't a git repo. revisions maps apps to their revision for the duration of a
+	build, since every app's key includes the framework's."""
+	from chair.app import get_dirty_files
+
+	revisions = {} if revisions is None else revisions
+
+	if app not in revisions:
+		app_path = os.path.join(chair.name, "apps", app)
+		try:
+			commit = subprocess.check_output(
+				["git", "rev-parse", "HEAD"], cwd=app_path, stderr=subprocess.DEVNULL
+			).decode().strip()
+		except (OSError, subprocess.CalledProcessError):
+			commit = None
+
+		if commit and get_dirty_files(app, chair_path=chair.name):
+			commit = None
+
+		revisions[app] = commit
+
+	return revisions[app]
+
+
+def get_assets_cache_path(chair: "Chair", app: str, revisions: Dict = None) -> Union[str, None]:
+	cache_dir = get_assets_cache_dir(chair)
+	cache_key = cache_dir and get_assets_cache_key(chair, app, revisions)
+	return os.path.join(cache_dir, app, f"{cache_key}.tar.gz") if cache_key else None
+
+
+def get_app_dist_path(chair: "Chair", app: str) -> str:
+	return os.path.join(chair.name, "apps", app, app, "public", "dist")
+
+
+def cache_built_assets(chair: "Chair", apps: List, revisions: Dict = None):
+	"""Stores the built dist folder & assets.json entries of the apps in the assets
+	cache, if there's one. Apps built into shared folders by older build tools
+	aren't cached. revisions is shared with restore_cached_assets, see
+	get_app_revision."""
+	for app in apps:
+		dist_path = get_app_dist_path(chair, app)
+		cache_path = os.path.isdir(dist_path) and get_assets_cache_path(chair, app, revisions)
+
+		if not cache_path or os.path.exists(cache_path):
+			continue
+
+		entries = {
+			assets_json: {
+				bundle: path
+				for bundle, path in read_assets_json(chair, assets_json).items()
+				if path.startswith(f"/assets/{app}/")
+			}
+			for assets_json in ASSETS_JSON_FILES
+		}
+
+		tmp_path = None
+
+		try:
+			os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+			# written aside & moved in, so readers on other nodes never see partial archives
+			fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+			with os.fdopen(fd, "wb") as f, tarfile.open(fileobj=f, mode="w:gz") as archive:
+				archive.add(dist_path, arcname="dist")
+				entries_json = json.dumps(entries).encode()
+				entries_info = tarfile.TarInfo("entries.json")
+				entries_info.size = len(entries_json)
+				archive.addfile(entries_info, io.BytesIO(entries_json))
+			os.replace(tmp_path, cache_path)
+		except OSError as e:
+			logger.warning(f"Couldn't cache assets of {app}: {e}")
+			if tmp_path and os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+
+def restore_cached_assets(
+	chair: "Chair", apps: Union[List, None], revisions: Dict = None
+) -> Union[List, None]:
+	"""Restores assets of the apps (all if None) from the assets cache, if there's
+	one. Returns the apps left to build, None if a full build is still needed."""
+	if not get_assets_cache_dir(chair):
+		return apps
+
+	candidates = list(chair.apps) if apps is None else apps
+	restored = [app for app in candidates if restore_assets(chair, app, revisions)]
+
+	if restored:
+		print(f"Restored assets of {', '.join(restored)} from the assets cache")
+
+	left = [app for app in candidates if app not in restored]
+
+	# the framework's bundles are shared by all apps
+	if apps is None and "vmraid" in left:
+		return None
+
+	return left
+
+
+def restore_assets(chair: "Chair", app: str, revisions: Dict = None) -> bool:
+	cache_path = get_assets_cache_path(chair, app, revisions)
+
+	if not (cache_path and os.path.exists(cache_path)):
+		return False
+
+	dist_path = get_app_dist_path(chair, app)
+	os.makedirs(os.path.dirname(dist_path), exist_ok=True)
+	extract_dir = tempfile.mkdtemp(prefix=".dist-", dir=os.path.dirname(dist_path))
+
+	try:
+		with tarfile.open(cache_path) as archive:
+			# only extract regular members within extract_dir where supported
+			kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+			archive.extractall(extract_dir, **kwargs)
+		with open(os.path.join(extract_dir, "entries.json")) as f:
+			entries = json.load(f)
+	except (OSError, ValueError, tarfile.TarError) as e:
+		logger.warning(f"Couldn't restore assets of {app} from {cache_path}: {e}")
+		shutil.rmtree(extract_dir, ignore_errors=True)
+		return False
+
+	old_dist_path = f"{extract_dir}.old"
+	if os.path.exists(dist_path):
+		os.rename(dist_path, old_dist_path)
+	os.rename(os.path.join(extract_dir, "dist"), dist_path)
+	shutil.rmtree(old_dist_path, ignore_errors=True)
+	shutil.rmtree(extract_dir, ignore_errors=True)
+
+	for assets_json, app_entries in entries.items():
+		assets = {
+			bundle: path
+			for bundle, path in read_assets_json(chair, assets_json).items()
+			if not path.startswith(f"/assets/{app}/")
+		}
+		assets.update(app_entries)
+		write_assets_json(chair, assets_json, assets)
+
+	return True
+
+
+def read_assets_json(chair: "Chair", assets_json: str) -> Dict:
+	try:
+		with open(os.path.join(chair.name, "sites", "assets", assets_json)) as f:
+			return json.load(f)
+	except (FileNotFoundError, ValueError):
+		return {}
+
+
+def write_assets_json(chair: "Chair", assets_json: str, assets: Dict):
+	assets_json_path = os.path.join(chair.name, "sites", "assets", assets_json)
+	tmp_path = f"{assets_json_path}.{os.getpid()}.tmp"
+	os.makedirs(os.path.dirname(assets_json_path), exist_ok=True)
+
+	with open(tmp_path, "w") as f:
+		json.dump(assets, f, indent=4)
+	os.replace(tmp_path, assets_json_path)
+
+
+def compress_assets(chair: "Chair", apps: List):
+	"""Writes gzip (& brotli, if the brotli package is installed) compressed siblings
+	of the apps' fingerprinted built files, so that nginx serves them without
+	compressing every response. Files whose siblings are up to date are skipped."""
+	from chair.utils import run_in_parallel
+
+	files = []
+
+	for app in apps:
+		for root, _, filenames in os.walk(get_app_dist_path(chair, app)):
+			files.extend(
+				os.path.join(root, filename)
+				for filename in filenames
+				if FINGERPRINTED_FILE_PATTERN.search(filename)
+			)
+
+	# zlib & brotli release the GIL while compressing
+	for path, error in run_in_parallel(compress_file, files, jobs=os.cpu_count()):
+		if error:
+			logger.warning(f"Couldn't compress {path}: {error}")
+
+
+def compress_file(path: str) -> Union[str, None]:
+	"""Returns the error if the file couldn't be compressed"""
+	import gzip
+
+	try:
+		import brotli
+	except ImportError:
+		brotli = None
+
+	compressors = [(".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+	if brotli:
+		compressors.append((".br", lambda data: brotli.compress(data)))
+
+	try:
+		stat = os.stat(path)
+		if stat.st_size < MIN_COMPRESS_SIZE:
+			return None
+
+		data = None
+
+		for extension, compress in compressors:
+			compressed_path = f"{path}{extension}"
+			if os.path.exists(compressed_path) and os.stat(compressed_path).st_mtime_ns == stat.st_mtime_ns:
+				continue
+
+			if data is None:
+				with open(path, "rb") as f:
+					data = f.read()
+
+			# written aside & moved in since nginx may be serving the file
+			tmp_path = f"{compressed_path}.{os.getpid()}.tmp"
+			with open(tmp_path, "wb") as f:
+				f.write(compress(data))
+			os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+			os.replace(tmp_path, compressed_path)
+	except OSError as e:
+		return str(e)
+
+	return None
@@ -20,7 +20,7 @@ from chair.utils import (
 	get_chair_name,
 	get_cmd_output,
 )
-from chair.exceptions import PatchError, ValidationError
+from chair.exceptions import CommandFailedError, PatchError, ValidationError
 
 
 if typing.TYPE_CHECKING:
@@ -33,6 +33,55 @@ def get_env_cmd(cmd, chair_path="."):
 	return os.path.abspath(os.path.join(chair_path, "env", "bin", cmd))
 
 
+# {site-packages path: (mtime, installed packages)}
+_installed_packages_cache = {}
+
+
+def normalize_package_name(name: str) -> str:
+	"""Normalizes distribution names as per PEP 503"""
+	return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_env_site_packages(chair_path=".") -> typing.List[str]:
+	from glob import glob
+
+	return glob(os.path.join(chair_path, "env", "lib*", "python*", "site-packages"))
+
+
+def get_installed_packages(chair_path=".") -> typing.Set[str]:
+	"""Returns normalized names of the distributions installed in the chair's env.
+
+	Reads dist-info, egg-info & egg-link metadata in site-packages directly instead of
+	spawning `pip freeze`. Results are cached per site-packages directory and
+	invalidated when its mtime changes, ie when a package is installed or removed.
+	"""
+	installed_packages = set()
+
+	for site_packages in get_env_site_packages(chair_path):
+		site_packages = os.path.realpath(site_packages)
+		mtime = os.stat(site_packages).st_mtime_ns
+		cached = _installed_packages_cache.get(site_packages)
+
+		if cached and cached[0] == mtime:
+			installed_packages.update(cached[1])
+			continue
+
+		packages = set()
+
+		with os.scandir(site_packages) as entries:
+			for entry in entries:
+				if entry.name.endswith((".dist-info", ".egg-info")):
+					packages.add(entry.name.rsplit(".", 1)[0].split("-")[0])
+				elif entry.name.endswith(".egg-link"):
+					packages.add(entry.name[: -len(".egg-link")])
+
+		packages = {normalize_package_name(package) for package in packages}
+		_installed_packages_cache[site_packages] = (mtime, packages)
+		installed_packages.update(packages)
+
+	return installed_packages
+
+
 def get_venv_path():
 	venv = which("virtualenv")
 
@@ -48,7 +97,7 @@ def get_venv_path():
 	return venv or log("virtualenv cannot be found", level=2)
 
 
-def update_node_packages(chair_path=".", apps=None):
+def update_node_packages(chair_path=".", apps=None, force=False):
 	print("Updating node packages...")
 	from chair.utils.app import get_develop_version
 	from distutils.version import LooseVersion
@@ -60,7 +109,7 @@ def update_node_packages(chair_path=".", apps=None):
 	if v < LooseVersion("11.x.x-develop"):
 		update_npm_packages(chair_path, apps=apps)
 	else:
-		update_yarn_packages(chair_path, apps=apps)
+		update_yarn_packages(chair_path, apps=apps, force=force)
 
 
 def install_python_dev_dependencies(chair_path=".", apps=None, verbose=False):
@@ -77,17 +126,61 @@ def install_python_dev_dependencies(chair_path=".", apps=None, verbose=False):
 	elif not apps:
 		apps = chair.get_installed_apps()
 
-	for app in apps:
-		app_path = os.path.join(chair_path, "apps", app)
+	dev_requirements = [
+		os.path.join(chair_path, "apps", app, "dev-requirements.txt") for app in apps
+	]
+	dev_requirements = [path for path in dev_requirements if os.path.exists(path)]
+
+	if dev_requirements:
+		from chair.utils.wheels import build_wheels, get_wheelhouse_flags
+
+		build_wheels(
+			chair.python,
+			[arg for path in dev_requirements for arg in ("-r", path)],
+			chair_path=chair_path,
+			verbose=verbose,
+		)
+		wheelhouse_flags = get_wheelhouse_flags(chair_path)
+		# a single pip run resolves all apps' dev requirements together
+		requirements_flags = " ".join(f"-r {path}" for path in dev_requirements)
+		chair.run(
+			f"{chair.python} -m pip install {quiet_flag} --upgrade {wheelhouse_flags} {requirements_flags}"
+		)
+
+
+# files that define an app's python & node requirements
+requirements_files = ("setup.py", "setup.cfg", "pyproject.toml", "requirements.txt")
+node_requirements_files = ("package.json", "yarn.lock")
+
 
-		dev_requirements_path = os.path.join(app_path, "dev-requirements.txt")
+def get_requirements_hash(app_path: str, dev: bool = False, node: bool = False) -> str:
+	"""Returns a hash of the app's python (or node) requirements, changes when they do"""
+	from hashlib import sha256
+
+	if node:
+		files = node_requirements_files
+	else:
+		files = requirements_files + (("dev-requirements.txt",) if dev else ())
+
+	requirements_hash = sha256()
+
+	for filename in files:
+		try:
+			with open(os.path.join(app_path, filename), "rb") as f:
+				contents = f.read()
+		except FileNotFoundError:
+			continue
+		requirements_hash.update(filename.encode() + b"\0" + contents + b"\0")
 
-		if os.path.exists(dev_requirements_path):
-			chair.run(f"{chair.python} -m pip install {quiet_flag} --upgrade -r {dev_requirements_path}")
+	return requirements_hash.hexdigest()
 
 
-def update_yarn_packages(chair_path=".", apps=None):
+def update_yarn_packages(chair_path=".", apps=None, force=False):
+	"""Runs yarn install concurrently in apps whose package.json or yarn.lock changed
+	since their last successful install, with a yarn cache shared by all chairs"""
+	from chair.app import DEFAULT_NODE_JOBS
 	from chair.chair import Chair
+	from chair.utils import exec_cmds, get_chair_cache_dir, run_in_parallel
 
 	chair = Chair(chair_path)
 
@@ -102,11 +195,55 @@ def update_yarn_packages(chair_path=".", apps=None):
 		print("`npm install -g yarn`")
 		return
 
+	requirements_hashes = {}
+
 	for app in apps:
 		app_path = os.path.join(apps_dir, app)
-		if os.path.exists(os.path.join(app_path, "package.json")):
-			click.secho(f"\nInstalling node dependencies for {app}", fg="yellow")
-			chair.run("yarn install", cwd=app_path)
+		if not os.path.exists(os.path.join(app_path, "package.json")):
+			continue
+
+		requirements_hash = get_requirements_hash(app_path, node=True)
+		if (
+			not force
+			and os.path.isdir(os.path.join(app_path, "node_modules"))
+			and chair.index.get_requirements_hash(app, node=True) == requirements_hash
+		):
+			continue
+
+		requirements_hashes[app] = requirements_hash
+
+	if not requirements_hashes:
+		click.secho("Node dependencies of all apps are up to date", fg="yellow")
+		return
+
+	# yarn isn't safe with concurrent writers to a cache, its mutex serializes
+	# installs of this chair's apps & of other chairs sharing the cache
+	yarn_cache = get_chair_cache_dir("yarn")
+	os.makedirs(yarn_cache, exist_ok=True)
+	yarn_cmd = (
+		f"yarn install --prefer-offline --cache-folder {yarn_cache}"
+		f" --mutex file:{os.path.join(yarn_cache, '.yarn-mutex')}"
+	)
+	jobs = chair.conf.get("node_jobs") or DEFAULT_NODE_JOBS
+	failed = []
+
+	for app, (results, failed_cmd) in run_in_parallel(
+		lambda app: exec_cmds([yarn_cmd], cwd=os.path.join(apps_dir, app)),
+		list(requirements_hashes),
+		jobs=jobs,
+	):
+		click.secho(f"\nInstalling node dependencies for {app}", fg="yellow")
+		for cmd, output in results:
+			click.secho(f"$ {cmd}", fg="bright_black")
+			click.echo(output, nl=False)
+		if failed_cmd:
+			failed.append(app)
+			del requirements_hashes[app]
+
+	chair.index.set_requirements_hashes(requirements_hashes, node=True)
+
+	if failed:
+		raise CommandFailedError(f"Failed to install node dependencies for {', '.join(failed)}")
 
 
 def update_npm_packages(chair_path=".", apps=None):
@@ -144,61 +281,167 @@ def update_npm_packages(chair_path=".", apps=None):
 	exec_cmd("npm install", cwd=chair_path)
 
 
-def migrate_env(python, backup=False):
+def migrate_env(python, backup=False, chair_path="."):
+	"""Builds a new env with the given python next to the live one (env.next) &
+	swaps it in once all apps are installed & importable, so processes are only
+	down for the swap. The previous env is kept as env.prev for rolling back,
+	unless backup is off.
+	"""
 	import shutil
-	from urllib.parse import urlparse
 	from chair.chair import Chair
+	from chair.utils.wheels import build_wheels, get_wheelhouse_flags
 
-	chair = Chair(".")
-	nvenv = "env"
-	path = os.getcwd()
+	chair = Chair(chair_path)
+	path = os.path.abspath(chair_path)
+	env_path = os.path.join(path, "env")
+	next_env_path = os.path.join(path, "env.next")
 	python = which(python)
 	virtualenv = which("virtualenv")
-	pvenv = os.path.join(path, nvenv)
 
-	# Clear Cache before Chair Dies.
+	if not python:
+		raise ValidationError("Python executable not found")
+
+	if os.path.exists(next_env_path):
+		# left behind by a migration that didn't complete
+		shutil.rmtree(next_env_path)
+
+	env_python = os.path.join(next_env_path, "bin", "python")
+	apps = list(chair.apps)
+	app_paths = [os.path.join(path, "apps", app) for app in apps]
+
 	try:
-		config = chair.conf
-		rredis = urlparse(config["redis_cache"])
-		redis = f"{which('redis-cli')} -p {rredis.port}"
+		logger.log(f"Setting up a New Virtual {python} Environment in {next_env_path}")
+		exec_cmd(f"{virtualenv} --python {python} {next_env_path}")
+
+		# envs on other python versions need wheels built for it, once per host
+		build_wheels(env_python, app_paths, chair_path=chair_path)
+		packages = " ".join(f"-e {app_path}" for app_path in app_paths)
+		exec_cmd(
+			f"{env_python} -m pip install --upgrade {get_wheelhouse_flags(chair_path)} {packages}"
+		)
 
-		logger.log("Clearing Redis Cache...")
-		exec_cmd(f"{redis} FLUSHALL")
-		logger.log("Clearing Redis DataBase...")
-		exec_cmd(f"{redis} FLUSHDB")
-	except Exception:
-		logger.warning("Please ensure Redis Connections are running or Daemonized.")
+		logger.log("Checking if apps can be imported in the New Environment")
+		exec_cmd(f"{env_python} -c 'import {', '.join(apps)}'", cwd=os.path.join(path, "sites"))
+	except CommandFailedError:
+		logger.warning(f"Migration to {python} failed, the current environment is untouched")
+		shutil.rmtree(next_env_path, ignore_errors=True)
+		raise
+
+	# scripts like gunicorn refer to the env by its absolute path
+	relocate_env(next_env_path, env_path)
+	clear_redis_cache(chair)
+
+	logger.log("Switching to the New Virtual Environment")
+	swap_paths(next_env_path, env_path)
+	archive_env(next_env_path, backup=backup, chair_path=chair_path)
+	chair.reload()
+
+	logger.log(f"Migration Successful to {python}")
 
-	# Backup venv: restore using `virtualenv --relocatable` if needed
-	if backup:
-		from datetime import datetime
 
-		parch = os.path.join(path, "archived", "envs")
-		os.makedirs(parch, exist_ok=True)
+def rollback_env(chair_path="."):
+	"""Swaps the env & the one it replaced in the last `chair migrate-env`"""
+	from chair.chair import Chair
+
+	path = os.path.abspath(chair_path)
+	env_path = os.path.join(path, "env")
+	prev_env_path = os.path.join(path, "env.prev")
+
+	if not os.path.isdir(prev_env_path):
+		raise ValidationError(f"No previous environment found at {prev_env_path}")
+
+	chair = Chair(chair_path)
+	clear_redis_cache(chair)
+	swap_paths(prev_env_path, env_path)
+	chair.reload()
+
+	logger.log(f"Rolled back to the previous Virtual Environment, {prev_env_path} is the one replaced")
+
+
+def archive_env(old_env_path, backup=False, chair_path="."):
+	"""Keeps the env that was swapped out as env.prev, archiving the one it replaces"""
+	import shutil
+	from datetime import datetime
+
+	path = os.path.abspath(chair_path)
+	prev_env_path = os.path.join(path, "env.prev")
 
-		source = os.path.join(path, "env")
-		target = parch
+	if not backup:
+		shutil.rmtree(old_env_path)
+		return
 
-		logger.log("Backing up Virtual Environment")
+	if os.path.exists(prev_env_path):
+		archived_envs = os.path.join(path, "archived", "envs")
+		os.makedirs(archived_envs, exist_ok=True)
 		stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-		dest = os.path.join(path, str(stamp))
+		logger.log(f"Archiving {prev_env_path}")
+		shutil.move(prev_env_path, os.path.join(archived_envs, stamp))
+
+	os.rename(old_env_path, prev_env_path)
+
+
+def relocate_env(env_path, target_path):
+	"""Rewrites the env's absolute path in its scripts (shebangs, activate scripts)
+	& pyvenv.cfg to target_path, so it keeps working once renamed to it"""
+	old_path, new_path = os.fsencode(env_path), os.fsencode(target_path)
+	bin_dir = os.path.join(env_path, "bin")
+	files = [os.path.join(bin_dir, filename) for filename in os.listdir(bin_dir)]
+	files.append(os.path.join(env_path, "pyvenv.cfg"))
+
+	for file_path in files:
+		if os.path.islink(file_path) or not os.path.isfile(file_path):
+			continue
+
+		with open(file_path, "rb") as f:
+			contents = f.read()
+
+		# skip binaries
+		if old_path not in contents or b"\0" in contents:
+			continue
+
+		with open(file_path, "wb") as f:
+			f.write(contents.replace(old_path, new_path))
+
+
+def swap_paths(path, other_path):
+	"""Exchanges two paths atomically via renameat2 where the platform supports it,
+	falling back to consecutive renames"""
+	import ctypes
 
-		os.rename(source, dest)
-		shutil.move(dest, target)
+	AT_FDCWD, RENAME_EXCHANGE = -100, 2
 
-	# Create virtualenv using specified python
-	venv_creation, packages_setup = 1, 1
 	try:
-		logger.log(f"Setting up a New Virtual {python} Environment")
-		venv_creation = exec_cmd(f"{virtualenv} --python {python} {pvenv}")
+		renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+		renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+	except (OSError, AttributeError):
+		renameat2 = None
 
-		apps = " ".join([f"-e {os.path.join('apps', app)}" for app in chair.apps])
-		packages_setup = exec_cmd(f"{pvenv} -m pip install --upgrade {apps}")
+	if renameat2 and os.path.exists(other_path):
+		if not renameat2(AT_FDCWD, os.fsencode(path), AT_FDCWD, os.fsencode(other_path), RENAME_EXCHANGE):
+			return
 
-		logger.log(f"Migration Successful to {python}")
+	swap_path = f"{path}.swap"
+	if os.path.exists(other_path):
+		os.rename(other_path, swap_path)
+	os.rename(path, other_path)
+	if os.path.exists(swap_path):
+		os.rename(swap_path, path)
+
+
+def clear_redis_cache(chair: "Chair"):
+	from urllib.parse import urlparse
+
+	try:
+		config = chair.conf
+		rredis = urlparse(config["redis_cache"])
+		redis = f"{which('redis-cli')} -p {rredis.port}"
+
+		logger.log("Clearing Redis Cache...")
+		exec_cmd(f"{redis} FLUSHALL")
+		logger.log("Clearing Redis DataBase...")
+		exec_cmd(f"{redis} FLUSHDB")
 	except Exception:
-		if venv_creation or packages_setup:
-			logger.warning("Migration Error")
+		logger.warning("Please ensure Redis Connections are running or Daemonized.")
 
 
 def validate_upgrade(from_ver, to_ver, chair_path="."):
@@ -229,16 +472,15 @@ def post_upgrade(from_ver, to_ver, chair_path="."):
 
 
 def patch_sites(chair_path="."):
-	from chair.chair import Chair
-	from chair.utils.system import migrate_site
+	from chair.utils.system import migrate_sites
 
-	chair = Chair(chair_path)
+	summary = migrate_sites(chair_path=chair_path)
 
-	for site in chair.sites:
-		try:
-			migrate_site(site, chair_path=chair_path)
-		except subprocess.CalledProcessError:
-			raise PatchError
+	if summary["failed"] or summary["skipped"]:
+		message = f"Failed to migrate {', '.join(summary['failed'])}"
+		if summary["skipped"]:
+			message += f", later waves weren't started: {', '.join(summary['skipped'])}"
+		raise PatchError(message)
 
 
 def restart_supervisor_processes(chair_path=".", web_workers=False):
@@ -301,11 +543,38 @@ def restart_process_manager(chair_path=".", web_workers=False):
 		exec_cmd(f"overmind restart {worker}", cwd=chair_path)
 
 
-def build_assets(chair_path=".", app=None):
-	command = "chair build"
-	if app:
-		command += f" --app {app}"
-	exec_cmd(command, cwd=chair_path, env={"CHAIR_DEVELOPER": "1"})
+def build_assets(chair_path=".", app=None, force=False):
+	from chair.chair import Chair
+	from chair.utils.assets import (
+		cache_built_assets,
+		compress_assets,
+		plan_asset_build,
+		record_asset_build,
+		restore_cached_assets,
+	)
+
+	chair = Chair(chair_path)
+	apps, skipped, records = plan_asset_build(chair, [app] if app else None, force=force)
+
+	if skipped:
+		print(f"Assets of {', '.join(skipped)} are up to date, skipping their build")
+
+	# commits & dirty states of apps are looked up once for restoring & caching
+	revisions = {}
+	apps = restore_cached_assets(chair, apps, revisions)
+
+	if apps is None:
+		commands = ["chair build"]
+	else:
+		commands = [f"chair build --app {app}" for app in apps]
+
+	for command in commands:
+		exec_cmd(command, cwd=chair_path, env={"CHAIR_DEVELOPER": "1"})
+
+	built = list(chair.apps) if apps is None else apps
+	compress_assets(chair, built)
+	cache_built_assets(chair, built, revisions)
+	record_asset_build(chair, records)
 
 
 def handle_version_upgrade(version_upgrade, chair_path, force, reset, conf):
@@ -342,6 +611,27 @@ To avoid seeing this warning, set shallow_clone to false in your common_site_con
 		validate_upgrade(version_upgrade[1], version_upgrade[2], chair_path=chair_path)
 
 
+def check_for_local_changes(apps: str = None, chair_path="."):
+	"""command: chair update --check"""
+	from chair.app import get_dirty_apps, print_dirty_apps
+	from chair.chair import Chair
+
+	chair = Chair(chair_path)
+
+	if apps:
+		apps = [app.strip() for app in re.split(",| ", apps) if app]
+	else:
+		apps = [app for app in chair.apps if app not in chair.excluded_apps]
+
+	dirty_apps = get_dirty_apps(apps, chair_path=chair_path)
+
+	if dirty_apps:
+		print_dirty_apps(dirty_apps)
+		sys.exit(1)
+
+	click.secho(f"No local changes found in {len(apps)} app(s)", fg="green")
+
+
 def update(
 	pull: bool = False,
 	apps: str = None,
@@ -354,6 +644,7 @@ def update(
 	reset: bool = False,
 	restart_supervisor: bool = False,
 	restart_systemd: bool = False,
+	full: bool = False,
 ):
 	"""command: chair update"""
 	import re
@@ -364,7 +655,6 @@ def update(
 	from chair.config.common_site_config import update_config
 	from chair.exceptions import CannotUpdateReleaseChair
 
-	from chair.utils import clear_command_cache
 	from chair.utils.app import is_version_upgrade
 	from chair.utils.system import backup_all_sites
 
@@ -373,12 +663,13 @@ def update(
 	patches.run(chair_path=chair_path)
 	conf = chair.conf
 
-	clear_command_cache(chair_path=".")
-
 	if conf.get("release_chair"):
 		raise CannotUpdateReleaseChair("Release chair detected, cannot update!")
 
-	if not (pull or patch or build or requirements):
+	# a complete update may skip apps that haven't changed since they were last set up
+	complete_update = not (pull or patch or build or requirements)
+
+	if complete_update:
 		pull, patch, build, requirements = True, True, True, True
 
 	if apps and pull:
@@ -391,7 +682,9 @@ def update(
 	version_upgrade = is_version_upgrade()
 	handle_version_upgrade(version_upgrade, chair_path, force, reset, conf)
 
-	conf.update({"maintenance_mode": 1, "pause_scheduler": 1})
+	# sites are put in maintenance mode one by one while they're migrated, but
+	# background jobs shouldn't run against sites that aren't migrated yet
+	conf.update({"pause_scheduler": 1})
 	update_config(conf, chair_path=chair_path)
 
 	if backup:
@@ -401,28 +694,57 @@ def update(
 	if pull:
 		print("Updating apps source...")
 		pull_apps(apps=apps, chair_path=chair_path, reset=reset)
+		chair.index.refresh()
+		chair.apps.write_lock()
 
-	if requirements:
+	# None means all apps
+	changed_apps = None
+
+	if complete_update and not full:
+		changed_apps = chair.apps.get_changed_apps()
+		if changed_apps:
+			print(f"Apps changed since their last update: {', '.join(changed_apps)}")
+		else:
+			print("No apps changed since their last update, skipping requirements, build & compile")
+
+	if requirements and changed_apps != []:
 		print("Setting up requirements...")
-		chair.setup.requirements()
+		chair.setup.requirements(apps=changed_apps)
 
 	if patch:
 		print("Patching sites...")
-		patch_sites(chair_path=chair_path)
-
-	if build:
+		try:
+			patch_sites(chair_path=chair_path)
+		except PatchError:
+			# sites that couldn't be migrated keep maintenance mode & the scheduler
+			# paused in their site config, the rest are up to date. A failure in any
+			# other step leaves the scheduler paused for the chair.
+			conf.update({"pause_scheduler": 0})
+			update_config(conf, chair_path=chair_path)
+			raise
+
+	if build and changed_apps != []:
 		print("Building assets...")
-		chair.build()
+		chair.build(apps=changed_apps, force=full)
 
 	if version_upgrade[0] or (not version_upgrade[0] and force):
 		post_upgrade(version_upgrade[1], version_upgrade[2], chair_path=chair_path)
 
-	if pull and compile:
+	if pull and compile and changed_apps != []:
 		from compileall import compile_dir
 
 		print("Compiling Python files...")
 		apps_dir = os.path.join(chair_path, "apps")
-		compile_dir(apps_dir, quiet=1, rx=re.compile(".*node_modules.*"))
+		if changed_apps is None:
+			paths = [apps_dir]
+		else:
+			paths = [os.path.join(apps_dir, app) for app in changed_apps]
+
+		for path in paths:
+			compile_dir(path, quiet=1, rx=re.compile(".*node_modules.*"))
+
+	if complete_update:
+		chair.apps.record_commit_hashes()
 
 	chair.reload(web=False, supervisor=restart_supervisor, systemd=restart_systemd)
 
@@ -439,43 +761,102 @@ def update(
 
 
 def clone_apps_from(chair_path, clone_from, update_app=True):
-	from chair.app import install_app
+	import shutil
+	from chair.app import DEFAULT_PULL_JOBS
+	from chair.chair import Chair
+	from chair.utils import run_in_parallel
 
 	print(f"Copying apps from {clone_from}...")
-	subprocess.check_output(["cp", "-R", os.path.join(clone_from, "apps"), chair_path])
+	clone_tree(os.path.join(clone_from, "apps"), os.path.join(chair_path, "apps"))
 
 	node_modules_path = os.path.join(clone_from, "node_modules")
 	if os.path.exists(node_modules_path):
 		print(f"Copying node_modules from {clone_from}...")
-		subprocess.check_output(["cp", "-R", node_modules_path, chair_path])
+		clone_tree(node_modules_path, os.path.join(chair_path, "node_modules"))
 
 	def setup_app(app):
-		# run git reset --hard in each branch, pull latest updates and install_app
+		# run git reset --hard in each branch & pull latest updates, returns the output of a failed command
 		app_path = os.path.join(chair_path, "apps", app)
 
-		# remove .egg-ino
-		subprocess.check_output(["rm", "-rf", app + ".egg-info"], cwd=app_path)
+		# remove .egg-info
+		shutil.rmtree(os.path.join(app_path, f"{app}.egg-info"), ignore_errors=True)
 
-		if update_app and os.path.exists(os.path.join(app_path, ".git")):
-			remotes = subprocess.check_output(["git", "remote"], cwd=app_path).strip().split()
-			if "upstream" in remotes:
-				remote = "upstream"
-			else:
-				remote = remotes[0]
-			print(f"Cleaning up {app}")
+		if not (update_app and os.path.exists(os.path.join(app_path, ".git"))):
+			return None
+
+		try:
+			remotes = subprocess.check_output(["git", "remote"], cwd=app_path).decode().split()
+			remote = "upstream" if "upstream" in remotes else remotes[0]
 			branch = subprocess.check_output(
 				["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=app_path
-			).strip()
-			subprocess.check_output(["git", "reset", "--hard"], cwd=app_path)
-			subprocess.check_output(["git", "pull", "--rebase", remote, branch], cwd=app_path)
-
-		install_app(app, chair_path, restart_chair=False)
+			).decode().strip()
+			subprocess.run(["git", "reset", "--hard"], cwd=app_path, capture_output=True, check=True)
+			subprocess.run(
+				["git", "pull", "--rebase", remote, branch], cwd=app_path, capture_output=True, check=True
+			)
+		except subprocess.CalledProcessError as e:
+			return (e.stderr or e.output or b"").decode().strip()
 
 	with open(os.path.join(clone_from, "sites", "apps.txt"), "r") as f:
 		apps = f.read().splitlines()
 
-	for app in apps:
-		setup_app(app)
+	chair = Chair(chair_path)
+	jobs = chair.conf.get("pull_jobs") or DEFAULT_PULL_JOBS
+
+	for app, error in run_in_parallel(setup_app, apps, jobs=jobs):
+		print(f"Cleaning up {app}")
+		if error:
+			click.secho(error, fg="red")
+			raise CommandFailedError(f"Couldn't update {app} cloned from {clone_from}")
+
+	# installed together so that requirements are resolved once
+	chair.setup.requirements(apps=apps)
+
+
+def clone_tree(source, target):
+	"""Copies the tree sharing data with source where possible, with reflinks on
+	filesystems that support them (btrfs, xfs, apfs). Elsewhere files that are never
+	modified in place, ie git objects, are hardlinked & the rest copied."""
+	import shutil
+
+	if os.path.isdir(target) and not os.listdir(target):
+		os.rmdir(target)
+
+	reflink_cmd = ["cp", "-Rc"] if sys.platform == "darwin" else ["cp", "-R", "--reflink=always"]
+
+	try:
+		subprocess.run([*reflink_cmd, source, target], capture_output=True, check=True)
+		return
+	except (OSError, subprocess.CalledProcessError):
+		shutil.rmtree(target, ignore_errors=True)
+
+	def link_or_copy(src, dst):
+		if is_immutable_path(src):
+			try:
+				os.link(src, dst)
+				return dst
+			except OSError:
+				# eg: across filesystems
+				pass
+		return shutil.copy2(src, dst)
+
+	shutil.copytree(source, target, symlinks=True, copy_function=link_or_copy)
+
+
+def is_immutable_path(path) -> bool:
+	# node_modules isn't, yarn & postinstall scripts rewrite its files in place
+	parts = os.path.normpath(path).split(os.sep)
+
+	if ".git" in parts:
+		# loose objects & packs, not objects/info which chair appends to
+		git_path = parts[parts.index(".git") + 1:]
+		return (
+			len(git_path) == 3
+			and git_path[0] == "objects"
+			and (git_path[1] == "pack" or re.fullmatch("[0-9a-f]{2}", git_path[1]) is not None)
+		)
+
+	return False
 
 
 def remove_backups_crontab(chair_path="."):
@@ -486,12 +867,33 @@ def remove_backups_crontab(chair_path="."):
 
 	chair_dir = os.path.abspath(chair_path)
 	user = Chair(chair_dir).conf.get("vmraid_user")
-	logfile = os.path.join(chair_dir, "logs", "backup.log")
 	system_crontab = CronTab(user=user)
-	backup_command = f"cd {chair_dir} && {sys.argv[0]} --verbose --site all backup"
-	job_command = f"{backup_command} >> {logfile} 2>&1"
 
-	system_crontab.remove_all(command=job_command)
+	for job_command in get_backup_job_commands(chair_dir):
+		system_crontab.remove_all(command=job_command)
+
+	system_crontab.write()
+
+
+def get_backup_job_commands(chair_dir) -> typing.List[str]:
+	"""Returns the command of the backups cronjob, followed by the commands older
+	versions of chair set up"""
+	from chair.utils.system import BACKUP_JOB_STAGGER
+
+	logfile = os.path.join(chair_dir, "logs", "backup.log")
+	backup_commands = [
+		f"cd {chair_dir} && {sys.argv[0]} --verbose backup-all-sites --stagger {BACKUP_JOB_STAGGER}",
+		f"cd {chair_dir} && {sys.argv[0]} --verbose --site all backup",
+	]
+
+	return [f"{backup_command} >> {logfile} 2>&1" for backup_command in backup_commands]
+
+
+def get_backup_job_minute(chair_dir) -> int:
+	"""Spreads the backups cronjobs of chairs on the host over the hour"""
+	from hashlib import sha256
+
+	return int(sha256(chair_dir.encode()).hexdigest(), 16) % 60
 
 
 def set_mariadb_host(host, chair_path="."):
@@ -556,17 +958,25 @@ def check_app_installed(app, chair_path="."):
 
 
 def check_app_installed_legacy(app, chair_path="."):
+	from chair.utils import popen_vmraid_cmd
+	from chair.utils.forkserver import vmraid_forkserver
+
 	site_path = os.path.join(chair_path, "sites")
 
-	for site in os.listdir(site_path):
-		req_file = os.path.join(site_path, site, "site_config.json")
-		if os.path.exists(req_file):
-			out = subprocess.check_output(
-				["chair", "--site", site, "list-apps"], cwd=chair_path
-			).decode("utf-8")
-			if re.search(r"\b" + app + r"\b", out):
-				print(f"Cannot remove, app is installed on site: {site}")
-				sys.exit(1)
+	with vmraid_forkserver(chair_path) as server:
+		for site in os.listdir(site_path):
+			req_file = os.path.join(site_path, site, "site_config.json")
+			if os.path.exists(req_file):
+				p = popen_vmraid_cmd(
+					"--site", site, "list-apps", chair_path=chair_path, server=server, stdout=subprocess.PIPE
+				)
+				out = p.stdout.read().decode("utf-8")
+				p.stdout.close()
+				if p.wait():
+					raise subprocess.CalledProcessError(p.returncode, ["--site", site, "list-apps"])
+				if re.search(r"\b" + app + r"\b", out):
+					print(f"Cannot remove, app is installed on site: {site}")
+					sys.exit(1)
 
 
 def validate_branch():
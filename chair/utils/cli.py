@@ -14,6 +14,68 @@ def print_chair_version(ctx, param, value):
 
 
 class MultiCommandGroup(click.Group):
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		# maps command names to "module:attribute" import paths, resolved on first use
+		self.lazy_commands = {}
+		# maps names of commands the framework has too, to the option that makes chair
+		# run its own command instead
+		self.handled_options = {}
+
+	def add_lazy_command(self, import_path, name, handles_option=None):
+		"""Registers a command by its import path (`module:attribute`) without
+		importing it. The module is only imported when the command is invoked
+		or listed.
+
+		If the framework has a command of the same name, it's run instead of
+		chair's unless handles_option is given, eg: `chair migrate --sites all`.
+
+		Note: Similar to `add_command`, name may be a list of names.
+		"""
+		names = name if isinstance(name, list) else [name]
+
+		for _name in names:
+			self.lazy_commands[_name] = import_path
+			if handles_option:
+				self.handled_options[_name] = handles_option
+
+	def is_chair_handled(self, argv) -> bool:
+		"""Returns True if argv runs a command chair handles instead of the framework,
+		see add_lazy_command"""
+		# options of the group & the framework's --site may come before the command
+		value_options = {"--site"}.union(
+			*(param.opts for param in self.params if isinstance(param, click.Option) and not param.is_flag)
+		)
+		args = list(argv)
+
+		while args and args[0].startswith("-"):
+			if args.pop(0) in value_options and args:
+				args.pop(0)
+
+		option = self.handled_options.get(args[0]) if args else None
+
+		return bool(option) and any(arg.split("=")[0] == option for arg in args[1:])
+
+	def list_commands(self, ctx):
+		return sorted(set(self.commands).union(self.lazy_commands))
+
+	def get_command(self, ctx, cmd_name):
+		if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+			self.commands[cmd_name] = self._load_lazy_command(cmd_name)
+
+		return super().get_command(ctx, cmd_name)
+
+	def _load_lazy_command(self, cmd_name):
+		from importlib import import_module
+
+		module_name, attr = self.lazy_commands[cmd_name].split(":")
+		cmd = getattr(import_module(module_name), attr)
+
+		if not isinstance(cmd, click.Command):
+			raise TypeError(f"{self.lazy_commands[cmd_name]} is not a click Command")
+
+		return cmd
+
 	def add_command(self, cmd, name=None):
 		"""Registers another :class:`Command` with this group.  If the name
 		is not provided, the name of the command is used.
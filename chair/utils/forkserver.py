@@ -0,0 +1,340 @@
+"""Fork-server for running framework commands.
+
+The server is started with the chair's env python, imports the framework once and
+forks a child for every command it's asked to run, so loops running a command per
+site don't pay the framework's import cost each time. Commands may also be run in
+the server itself, so that what they load stays loaded for the commands after them,
+eg: migrating a batch of sites.
+
+Note: The server side of this module runs in the chair's virtualenv where chair
+isn't installed, so it must only depend on the standard library.
+"""
+
+# imports - standard imports
+import array
+import json
+import os
+import select
+import signal
+import socket
+import sys
+from contextlib import contextmanager
+
+
+MAX_MESSAGE_SIZE = 65536
+_servers = {}
+
+
+def send_message(sock, message, fds=()):
+	"""Sends a newline delimited JSON message, along with file descriptors if any.
+	Client & server talk in lockstep, so there's never more than one message in
+	flight in either direction."""
+	ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))] if fds else []
+	sock.sendmsg([json.dumps(message).encode() + b"\n"], ancillary)
+
+
+def recv_message(sock):
+	"""Returns the message & file descriptors received, message is None if the peer
+	has gone away"""
+	fds = array.array("i")
+	data = b""
+
+	while not data.endswith(b"\n"):
+		chunk, ancdata, _, _ = sock.recvmsg(MAX_MESSAGE_SIZE, socket.CMSG_SPACE(2 * fds.itemsize))
+
+		if not chunk:
+			return None, list(fds)
+
+		data += chunk
+
+		for level, _type, cmsg_data in ancdata:
+			if level == socket.SOL_SOCKET and _type == socket.SCM_RIGHTS:
+				fds.frombytes(cmsg_data[: len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+
+	return json.loads(data), list(fds)
+
+
+def serve(fd):
+	"""Runs in the chair's env python with sites as the working directory"""
+	sock = socket.socket(fileno=fd)
+
+	try:
+		import vmraid.utils.chair_helper  # noqa: F401
+	except Exception as e:
+		send_message(sock, {"error": repr(e)})
+		return
+
+	send_message(sock, {"ready": True})
+
+	while True:
+		try:
+			request, fds = recv_message(sock)
+		except ConnectionError:
+			break
+
+		if request is None or request.get("exit"):
+			break
+
+		if request.get("inline"):
+			send_message(sock, {"returncode": run_inline(request["args"], *fds)})
+			continue
+
+		sys.stdout.flush()
+		sys.stderr.flush()
+		pid = os.fork()
+
+		if pid == 0:
+			sock.close()
+			run_command(request["args"], *fds)
+
+		for _fd in fds:
+			os.close(_fd)
+
+		_, status = os.waitpid(pid, 0)
+
+		if os.WIFSIGNALED(status):
+			returncode = -os.WTERMSIG(status)
+		else:
+			returncode = os.WEXITSTATUS(status)
+
+		send_message(sock, {"returncode": returncode})
+
+
+def run_command(args, stdout, stderr):
+	"""Runs in the forked child, never returns"""
+	signal.signal(signal.SIGINT, signal.SIG_DFL)
+	os.dup2(stdout, 1)
+	os.dup2(stderr, 2)
+	os.close(stdout)
+	os.close(stderr)
+	os._exit(run_helper(args))
+
+
+def run_inline(args, stdout, stderr):
+	"""Runs in the server with its stdout & stderr pointed at the given fds until the
+	command is done, returns its exit code"""
+	sys.stdout.flush()
+	sys.stderr.flush()
+	saved_stdout, saved_stderr = os.dup(1), os.dup(2)
+	os.dup2(stdout, 1)
+	os.dup2(stderr, 2)
+	os.close(stdout)
+	os.close(stderr)
+
+	try:
+		return run_helper(args)
+	finally:
+		os.dup2(saved_stdout, 1)
+		os.dup2(saved_stderr, 2)
+		os.close(saved_stdout)
+		os.close(saved_stderr)
+
+
+def run_helper(args):
+	"""Runs `chair_helper vmraid *args` in this process, returns its exit code"""
+	import runpy
+
+	returncode = 0
+	sys.argv = ["chair_helper", "vmraid"] + list(args)
+	# only the helper itself is executed again, everything it imports is preloaded
+	sys.modules.pop("vmraid.utils.chair_helper", None)
+
+	try:
+		runpy.run_module("vmraid.utils.chair_helper", run_name="__main__", alter_sys=True)
+	except SystemExit as e:
+		if isinstance(e.code, int):
+			returncode = e.code
+		elif e.code is not None:
+			print(e.code, file=sys.stderr)
+			returncode = 1
+	except BaseException:
+		import traceback
+
+		traceback.print_exc()
+		returncode = 1
+	finally:
+		sys.stdout.flush()
+		sys.stderr.flush()
+
+	return returncode
+
+
+class ForkedProcess:
+	"""Popen-like handle for a command run by a ForkServer, so its output can be
+	consumed by `print_output`"""
+
+	def __init__(self, server, stdout=None, stderr=None):
+		self.server = server
+		self.sock = server.sock
+		self.stdout = stdout
+		self.stderr = stderr
+		self.returncode = None
+
+	def poll(self):
+		if self.returncode is None and select.select([self.sock], [], [], 0)[0]:
+			self._read_returncode()
+		return self.returncode
+
+	def wait(self):
+		if self.returncode is None:
+			self._read_returncode()
+		return self.returncode
+
+	def _read_returncode(self):
+		response, _ = recv_message(self.sock)
+
+		if not response:
+			# the server went away, along with the child it was waiting on or while
+			# running an inline command
+			self.server.close()
+
+		self.returncode = response["returncode"] if response else 1
+
+
+class ForkServer:
+	def __init__(self, chair_path=".", prefix=None):
+		self.chair_path = chair_path
+		# eg: nice, ionice; commands forked by the server inherit what it sets
+		self.prefix = list(prefix or [])
+		self.sock = None
+		self.process = None
+
+	def start(self):
+		"""Starts the server, returns False if the framework couldn't be loaded"""
+		import subprocess
+		from chair.utils.chair import get_env_cmd
+
+		self.sock, server_sock = socket.socketpair()
+		bootstrap = "import runpy, sys; sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name='__main__')"
+
+		try:
+			self.process = subprocess.Popen(
+				[
+					*self.prefix,
+					get_env_cmd("python", chair_path=self.chair_path),
+					"-c",
+					bootstrap,
+					os.path.abspath(__file__),
+					str(server_sock.fileno()),
+				],
+				cwd=os.path.join(self.chair_path, "sites"),
+				pass_fds=(server_sock.fileno(),),
+			)
+		except OSError:
+			self.close()
+			return False
+		finally:
+			server_sock.close()
+
+		response, _ = recv_message(self.sock)
+
+		if not (response and response.get("ready")):
+			self.close()
+			return False
+
+		return True
+
+	def run(self, args, stdout=None, stderr=None, inline=False):
+		"""Runs `chair_helper vmraid *args` in a forked child, or in the server itself
+		if inline. Similar to Popen, stdout & stderr may be subprocess.PIPE or None to
+		inherit chair's, and stderr may be subprocess.STDOUT.
+
+		A server that went away is started again first."""
+		import subprocess
+
+		if not self.process and not self.start():
+			raise OSError("Couldn't start the fork-server again")
+
+		child_fds, streams = [], []
+
+		for stream, target in ((stdout, sys.stdout), (stderr, sys.stderr)):
+			if stream == subprocess.STDOUT:
+				child_fds.append(os.dup(child_fds[0]))
+				streams.append(None)
+			elif stream == subprocess.PIPE:
+				read_fd, write_fd = os.pipe()
+				child_fds.append(write_fd)
+				streams.append(os.fdopen(read_fd, "rb"))
+			else:
+				target.flush()
+				child_fds.append(os.dup(target.fileno()))
+				streams.append(None)
+
+		try:
+			send_message(self.sock, {"args": list(args), "inline": inline}, child_fds)
+		finally:
+			for fd in child_fds:
+				os.close(fd)
+
+		return ForkedProcess(self, *streams)
+
+	def close(self):
+		if self.sock:
+			try:
+				send_message(self.sock, {"exit": True})
+			except OSError:
+				pass
+			self.sock.close()
+			self.sock = None
+
+		if self.process:
+			self.process.wait()
+			self.process = None
+
+
+def get_forkserver(chair_path="."):
+	return _servers.get(os.path.abspath(chair_path))
+
+
+@contextmanager
+def vmraid_forkserver(chair_path="."):
+	"""Makes `run_vmraid_cmd` calls for the chair within the block share a
+	fork-server. Falls back to spawning a process per command if the server can't
+	be started."""
+	key = os.path.abspath(chair_path)
+
+	if key in _servers:
+		yield _servers[key]
+		return
+
+	server = ForkServer(chair_path)
+
+	if not server.start():
+		yield None
+		return
+
+	_servers[key] = server
+
+	try:
+		yield server
+	finally:
+		del _servers[key]
+		server.close()
+
+
+@contextmanager
+def forkserver_pool(chair_path=".", count=1, prefix=None):
+	"""Yields a queue of `count` started servers to take servers from & put them
+	back into, so that up to `count` commands run at once. Yields None if the
+	framework can't be loaded in a server."""
+	from queue import Queue
+
+	servers = Queue()
+	started = []
+
+	try:
+		for _ in range(count):
+			server = ForkServer(chair_path, prefix=prefix)
+			if not server.start():
+				break
+			started.append(server)
+			servers.put(server)
+
+		yield servers if started else None
+	finally:
+		for server in started:
+			server.close()
+
+
+if __name__ == "__main__":
+	serve(int(sys.argv[1]))
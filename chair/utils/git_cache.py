@@ -0,0 +1,180 @@
+# imports - standard imports
+import fcntl
+import logging
+import os
+import re
+import shutil
+import subprocess
+from contextlib import contextmanager
+from typing import List, Union
+
+# imports - module imports
+from chair import PROJECT_NAME
+from chair.utils import get_chair_cache_dir, is_git_url
+
+
+logger = logging.getLogger(PROJECT_NAME)
+# app repos that borrow objects from a mirror, pruning keeps mirrors that are in use
+DEPENDENTS_FILE = "chair-dependents"
+
+
+def get_git_cache_dir() -> str:
+	return get_chair_cache_dir("git")
+
+
+def get_git_cache_path(url: str) -> Union[str, None]:
+	"""Returns the path of the host-level mirror for a remote, or None if the url
+	isn't a remote git url (eg: a path on disk) that's worth caching"""
+	if not is_git_url(url):
+		return None
+
+	# https://github.com/vmraid/vmraid.git & git@github.com:vmraid/vmraid.git share a mirror
+	path = re.sub(r"^(\w+://)?([^@/]+@)?", "", url.rstrip("/"))
+	path = re.sub(r"\.git$", "", path).replace(":", "/")
+	parts = [part for part in path.split("/") if part not in ("", ".", "..")]
+
+	return os.path.join(get_git_cache_dir(), *parts) + ".git"
+
+
+@contextmanager
+def lock_git_cache(mirror: str):
+	"""Serializes access to a mirror across chairs on the host"""
+	os.makedirs(os.path.dirname(mirror), exist_ok=True)
+
+	with open(f"{mirror}.lock", "w") as lock_file:
+		fcntl.flock(lock_file, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_git_cache(url: str) -> Union[str, None]:
+	"""Creates or fetches the mirror of the remote. Returns the mirror's path, or
+	None if it couldn't be updated, in which case callers go to the remote directly."""
+	mirror = get_git_cache_path(url)
+
+	if not mirror:
+		return None
+
+	with lock_git_cache(mirror):
+		if os.path.exists(mirror):
+			cmd = ["git", "--git-dir", mirror, "fetch", "--prune", "--quiet", "origin"]
+		else:
+			cmd = ["git", "clone", "--mirror", "--quiet", url, mirror]
+
+		try:
+			subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+		except subprocess.CalledProcessError as e:
+			logger.warning(f"Couldn't update git cache for {url}: {e.output.decode().strip()}")
+			if not os.path.exists(os.path.join(mirror, "objects")):
+				shutil.rmtree(mirror, ignore_errors=True)
+				return None
+			return mirror
+
+		# objects may still be borrowed by app repos after refs are pruned upstream
+		subprocess.run(["git", "--git-dir", mirror, "config", "gc.pruneExpire", "never"], check=True)
+
+	return mirror
+
+
+def add_git_cache_dependent(mirror: str, repo_dir: str):
+	"""Makes the app repo borrow objects from the mirror via alternates, so objects
+	already fetched into the mirror aren't fetched or stored again"""
+	mirror_objects = os.path.realpath(os.path.join(mirror, "objects"))
+	alternates_file = os.path.join(repo_dir, ".git", "objects", "info", "alternates")
+
+	alternates = get_alternates(repo_dir)
+	if mirror_objects not in alternates:
+		os.makedirs(os.path.dirname(alternates_file), exist_ok=True)
+		with open(alternates_file, "a") as f:
+			f.write(f"{mirror_objects}\n")
+
+	with lock_git_cache(mirror):
+		dependents = get_git_cache_dependents(mirror)
+		repo_dir = os.path.abspath(repo_dir)
+		if repo_dir not in dependents:
+			with open(os.path.join(mirror, DEPENDENTS_FILE), "a") as f:
+				f.write(f"{repo_dir}\n")
+
+
+def sync_git_cache(repo_dir: str, remote: str = "upstream") -> Union[str, None]:
+	"""Updates the mirror of the app repo's remote & links the repo to it. Called
+	before fetching in the app repo so that most of the fetch is served locally."""
+	try:
+		url = subprocess.check_output(
+			["git", "config", "--get", f"remote.{remote}.url"], cwd=repo_dir
+		).decode().strip()
+	except subprocess.CalledProcessError:
+		return None
+
+	mirror = update_git_cache(url)
+
+	if mirror:
+		add_git_cache_dependent(mirror, repo_dir)
+
+	return mirror
+
+
+def get_alternates(repo_dir: str) -> List[str]:
+	try:
+		with open(os.path.join(repo_dir, ".git", "objects", "info", "alternates")) as f:
+			return [os.path.realpath(line.strip()) for line in f if line.strip()]
+	except FileNotFoundError:
+		return []
+
+
+def get_git_cache_dependents(mirror: str) -> List[str]:
+	try:
+		with open(os.path.join(mirror, DEPENDENTS_FILE)) as f:
+			return [line.strip() for line in f if line.strip()]
+	except FileNotFoundError:
+		return []
+
+
+def get_git_cache_mirrors() -> List[str]:
+	mirrors = []
+
+	for root, dirs, _ in os.walk(get_git_cache_dir()):
+		for d in list(dirs):
+			if d.endswith(".git"):
+				mirrors.append(os.path.join(root, d))
+				dirs.remove(d)
+
+	return sorted(mirrors)
+
+
+def refresh_git_cache():
+	"""command: chair git-cache refresh"""
+	for mirror in get_git_cache_mirrors():
+		print(f"Fetching {mirror}")
+		with lock_git_cache(mirror):
+			subprocess.run(["git", "--git-dir", mirror, "fetch", "--prune", "--quiet", "origin"])
+
+
+def prune_git_cache():
+	"""command: chair git-cache prune
+
+	Forgets app repos that were removed or no longer borrow from their mirror &
+	deletes mirrors no app repo borrows from anymore. Mirrors in use are only
+	repacked, since app repos may depend on any of their objects."""
+	for mirror in get_git_cache_mirrors():
+		mirror_objects = os.path.realpath(os.path.join(mirror, "objects"))
+
+		with lock_git_cache(mirror):
+			dependents = [
+				repo_dir
+				for repo_dir in get_git_cache_dependents(mirror)
+				if mirror_objects in get_alternates(repo_dir)
+			]
+
+			if not dependents:
+				print(f"Removing unused {mirror}")
+				shutil.rmtree(mirror)
+				continue
+
+			with open(os.path.join(mirror, DEPENDENTS_FILE), "w") as f:
+				f.writelines(f"{repo_dir}\n" for repo_dir in dependents)
+
+			print(f"Repacking {mirror} used by {len(dependents)} app(s)")
+			subprocess.run(["git", "--git-dir", mirror, "gc", "--quiet", "--prune=never"])
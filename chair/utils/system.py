@@ -1,5 +1,6 @@
 # imports - standard imports
 import grp
+import json
 import os
 import pwd
 import shutil
@@ -20,6 +21,17 @@ from chair.utils.chair import build_assets, clone_apps_from
 from chair.utils.render import job
 
 
+# number of sites backed up concurrently, unless set by backup_jobs in common_site_config
+DEFAULT_BACKUP_JOBS = 2
+# seconds over which the backups cronjob spreads starts of site backups, a small
+# part of its 6 hour interval
+BACKUP_JOB_STAGGER = 15 * 60
+# number of sites migrated concurrently, unless set by migrate_jobs in common_site_config
+DEFAULT_MIGRATE_JOBS = 4
+# site config keys that take a site offline while it's being migrated
+MAINTENANCE_KEYS = ("maintenance_mode", "pause_scheduler")
+
+
 @job(title="Initializing Chair {path}", success="Chair {path} initialized")
 def init(
 	path,
@@ -35,6 +47,7 @@ def init(
 	skip_assets=False,
 	python="python3",
 	install_app=None,
+	from_lock=None,
 ):
 	"""Initialize a new chair directory
 
@@ -53,7 +66,7 @@ def init(
 	# another way => https://stackoverflow.com/a/44591228/10309266
 
 	import chair.cli
-	from chair.app import get_app, install_apps_from_path
+	from chair.app import get_app, install_apps_from_lock, install_apps_from_path
 	from chair.chair import Chair
 
 	verbose = chair.cli.verbose or verbose
@@ -72,6 +85,10 @@ def init(
 			chair_path=path, clone_from=clone_from, update_app=not clone_without_update
 		)
 
+	# apps pinned by another chair's chair.lock
+	elif from_lock:
+		install_apps_from_lock(from_lock, chair_path=path, skip_assets=True, verbose=verbose)
+
 	# remote apps
 	else:
 		vmraid_path = vmraid_path or "https://github.com/vmraid/vmraid.git"
@@ -168,15 +185,284 @@ def migrate_site(site, chair_path="."):
 	run_vmraid_cmd("--site", site, "migrate", chair_path=chair_path)
 
 
+def migrate_sites(chair_path=".", sites=None, jobs=None, wave_size=None):
+	"""Migrates sites `jobs` at a time (migrate_jobs in common_site_config), in
+	waves of `wave_size` sites (migrate_wave_size, all sites by default). Every site
+	is in maintenance mode only while it's being migrated. A site's failure doesn't
+	stop the others in its wave, but the waves after it aren't started.
+
+	Sites are migrated in `jobs` fork-servers that load the framework once & migrate
+	their share of the sites in the server itself, so that apps loaded for a site stay
+	loaded for the next. Sites are migrated in a process each if the servers can't be
+	started.
+
+	Returns a dict of the sites that were migrated, failed & weren't attempted."""
+	import click
+	import time
+	from chair.chair import Chair
+	from chair.utils import run_in_parallel
+	from chair.utils.forkserver import forkserver_pool
+
+	chair = Chair(chair_path)
+	sites = chair.sites if sites is None else sites
+	jobs = jobs or chair.conf.get("migrate_jobs") or DEFAULT_MIGRATE_JOBS
+	wave_size = wave_size or chair.conf.get("migrate_wave_size") or len(sites) or 1
+	waves = [sites[i : i + wave_size] for i in range(0, len(sites), wave_size)]
+	summary = {"migrated": [], "failed": [], "skipped": []}
+	started = time.monotonic()
+
+	with forkserver_pool(chair_path, count=min(jobs, len(sites))) as servers:
+
+		def _migrate(site):
+			server = servers.get() if servers else None
+			try:
+				return migrate_site_in_maintenance(site, chair_path=chair_path, server=server)
+			finally:
+				if server:
+					servers.put(server)
+
+		for idx, wave in enumerate(waves):
+			if summary["failed"]:
+				summary["skipped"].extend(wave)
+				continue
+
+			if len(waves) > 1:
+				click.secho(f"Migrating wave {idx + 1}/{len(waves)}: {', '.join(wave)}", fg="blue")
+
+			for site, (returncode, duration, output) in run_in_parallel(_migrate, wave, jobs=jobs):
+				click.secho(
+					f"Migrated {site} in {duration}s" if not returncode else f"Couldn't migrate {site}",
+					fg="yellow" if not returncode else "red",
+				)
+				click.echo(output, nl=False)
+				summary["failed" if returncode else "migrated"].append(site)
+
+	click.secho(
+		f"Migrated {len(summary['migrated'])}/{len(sites)} site(s) in"
+		f" {round(time.monotonic() - started, 2)}s",
+		fg="green" if not summary["failed"] else "red",
+	)
+	if summary["failed"]:
+		click.secho(
+			f"Failed: {', '.join(summary['failed'])} (left in maintenance mode)", fg="red"
+		)
+	if summary["skipped"]:
+		click.secho(f"Not migrated: {', '.join(summary['skipped'])}", fg="red")
+
+	return summary
+
+
+def migrate_site_in_maintenance(site, chair_path=".", server=None):
+	"""Migrates the site in the given ForkServer itself, or a process of its own, with
+	the site in maintenance mode. The site's previous maintenance settings are
+	restored only if the migration succeeded. Returns the migration's return code,
+	duration & output."""
+	import subprocess
+	import time
+	from chair.config.site_config import get_site_config, put_site_config, update_site_config
+	from chair.utils import popen_vmraid_cmd
+
+	previous = get_site_config(site, chair_path=chair_path)
+	update_site_config(site, {key: 1 for key in MAINTENANCE_KEYS}, chair_path=chair_path)
+
+	started_at = time.monotonic()
+	p = popen_vmraid_cmd(
+		"--site",
+		site,
+		"migrate",
+		chair_path=chair_path,
+		server=server,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.STDOUT,
+		inline=True,
+	)
+	output = p.stdout.read().decode(errors="replace")
+	p.stdout.close()
+	returncode, duration = p.wait(), round(time.monotonic() - started_at, 2)
+
+	if not returncode:
+		# the migration may have changed other keys of the site config
+		config = get_site_config(site, chair_path=chair_path)
+		for key in MAINTENANCE_KEYS:
+			if key in previous:
+				config[key] = previous[key]
+			else:
+				config.pop(key, None)
+		put_site_config(site, config, chair_path=chair_path)
+
+	return returncode, duration, output
+
+
+def run_on_sites(args, jobs, chair_path=".") -> int:
+	"""Runs the framework command for every site of the chair, `jobs` sites at a
+	time in fork-servers, or processes of their own if those can't be started. Lines of output are prefixed with their site
+	as they come. Returns 0 if the command succeeded on every site, else the
+	highest exit code."""
+	import click
+	import subprocess
+	import threading
+	import time
+	from chair.chair import Chair
+	from chair.utils import popen_vmraid_cmd, run_in_parallel
+	from chair.utils.forkserver import forkserver_pool
+
+	sites = Chair(chair_path).sites
+	width = max(map(len, sites), default=0)
+	lock = threading.Lock()
+
+	with forkserver_pool(chair_path, count=min(jobs, len(sites))) as servers:
+
+		def _run(site):
+			server = servers.get() if servers else None
+			started_at = time.monotonic()
+
+			try:
+				p = popen_vmraid_cmd(
+					"--site",
+					site,
+					*args,
+					chair_path=chair_path,
+					server=server,
+					stdout=subprocess.PIPE,
+					stderr=subprocess.STDOUT,
+				)
+
+				for line in iter(p.stdout.readline, b""):
+					with lock:
+						click.echo(f"{click.style(site.ljust(width), fg='cyan')} | {line.decode(errors='replace').rstrip()}")
+
+				p.stdout.close()
+				returncode = p.wait()
+			finally:
+				if server:
+					servers.put(server)
+
+			return returncode, round(time.monotonic() - started_at, 2)
+
+		results = list(run_in_parallel(_run, sites, jobs=jobs))
+
+	for site, (returncode, duration) in results:
+		click.secho(
+			f"{site.ljust(width)}  {duration}s" + (f"  exited with {returncode}" if returncode else ""),
+			fg="red" if returncode else "green",
+		)
+
+	failed = [returncode for _, (returncode, _) in results if returncode]
+	return max(returncode if returncode > 0 else 1 for returncode in failed) if failed else 0
+
+
 def backup_site(site, chair_path="."):
 	run_vmraid_cmd("--site", site, "backup", chair_path=chair_path)
 
 
-def backup_all_sites(chair_path="."):
+def backup_all_sites(chair_path=".", jobs=None, stagger=None):
+	"""Backs up sites `jobs` at a time (backup_jobs in common_site_config), in
+	fork-servers with low CPU & I/O priority so that the disk isn't saturated for the
+	sites' users. Start times are spread over `stagger` seconds (backup_stagger).
+	Duration & size of every site's backup are appended to logs/backups.jsonl."""
+	import click
+	import time
 	from chair.chair import Chair
-
-	for site in Chair(chair_path).sites:
-		backup_site(site, chair_path=chair_path)
+	from chair.exceptions import CommandFailedError
+	from chair.utils import run_in_parallel
+	from chair.utils.forkserver import forkserver_pool
+
+	chair = Chair(chair_path)
+	sites = chair.sites
+	jobs = jobs or chair.conf.get("backup_jobs") or DEFAULT_BACKUP_JOBS
+	stagger = chair.conf.get("backup_stagger", 0) if stagger is None else stagger
+	interval = stagger / len(sites) if sites else 0
+	started = time.monotonic()
+
+	stats_path = os.path.join(chair_path, "logs", "backups.jsonl")
+	os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+	failed = []
+
+	with forkserver_pool(
+		chair_path, count=min(jobs, len(sites)), prefix=get_low_priority_prefix()
+	) as servers:
+
+		def _backup(idx_site):
+			idx, site = idx_site
+			time.sleep(max(0, started + idx * interval - time.monotonic()))
+			server = servers.get() if servers else None
+			try:
+				return backup_site_throttled(site, chair_path=chair_path, server=server)
+			finally:
+				if server:
+					servers.put(server)
+
+		for (_, site), (stats, output) in run_in_parallel(_backup, list(enumerate(sites)), jobs=jobs):
+			click.secho(
+				f"Backed up {site} in {stats['duration']}s ({stats['size']} bytes)"
+				if not stats["returncode"]
+				else f"Couldn't back up {site}",
+				fg="yellow" if not stats["returncode"] else "red",
+			)
+			click.echo(output, nl=False)
+
+			with open(stats_path, "a") as f:
+				f.write(json.dumps(stats) + "\n")
+
+			if stats["returncode"]:
+				failed.append(site)
+
+	if failed:
+		raise CommandFailedError(f"Failed to back up {', '.join(failed)}")
+
+
+def get_low_priority_prefix():
+	"""Command prefix that runs a command with low CPU & I/O priority, where nice &
+	ionice are available"""
+	prefix = []
+
+	if which("nice"):
+		prefix += ["nice", "-n", "10"]
+	if which("ionice"):
+		# best-effort class, lowest priority
+		prefix += ["ionice", "-c", "2", "-n", "7"]
+
+	return prefix
+
+
+def backup_site_throttled(site, chair_path=".", server=None):
+	"""Backs up the site in the given ForkServer, or a process of its own with nice &
+	ionice, returns stats of the backup & its output"""
+	import subprocess
+	import time
+	from chair.utils import popen_vmraid_cmd
+
+	started_at = time.time()
+	p = popen_vmraid_cmd(
+		"--site",
+		site,
+		"backup",
+		chair_path=chair_path,
+		server=server,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.STDOUT,
+		prefix=get_low_priority_prefix(),
+	)
+	output = p.stdout.read().decode(errors="replace")
+	p.stdout.close()
+	returncode = p.wait()
+
+	backups_path = os.path.join(chair_path, "sites", site, "private", "backups")
+	size = 0
+	if os.path.isdir(backups_path):
+		for entry in os.scandir(backups_path):
+			if entry.is_file() and entry.stat().st_mtime >= int(started_at):
+				size += entry.stat().st_size
+
+	stats = {
+		"site": site,
+		"started_at": int(started_at),
+		"duration": round(time.time() - started_at, 2),
+		"size": size,
+		"returncode": returncode,
+	}
+
+	return stats, output
 
 
 def fix_prod_setup_perms(chair_path=".", vmraid_user=None):
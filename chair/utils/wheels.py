@@ -0,0 +1,248 @@
+# imports - standard imports
+import fcntl
+import json
+import logging
+import os
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, List, Set, Tuple
+
+# imports - module imports
+from chair import PROJECT_NAME
+from chair.utils import get_chair_cache_dir
+
+
+logger = logging.getLogger(PROJECT_NAME)
+# chairs that install from the wheelhouse, pruning keeps the wheels their envs use
+DEPENDENTS_FILE = "chair-dependents"
+# keys of requirements whose wheels are all in the wheelhouse, see get_requirements_key
+RESOLVED_FILE = "resolved-requirements"
+
+
+def get_wheelhouse_dir() -> str:
+	return get_chair_cache_dir("wheels")
+
+
+def use_wheelhouse(chair_path=".") -> bool:
+	"""The wheelhouse is used unless use_wheelhouse is turned off in the chair's
+	common_site_config.json"""
+	from chair.config.common_site_config import get_config
+
+	return get_config(chair_path).get("use_wheelhouse", True) is not False
+
+
+def get_wheelhouse_flags(chair_path=".") -> str:
+	"""pip install flags that make the chair's installs use wheels from the wheelhouse"""
+	if not use_wheelhouse(chair_path):
+		return ""
+
+	return f"--prefer-binary --find-links {get_wheelhouse_dir()}"
+
+
+@contextmanager
+def lock_wheelhouse():
+	wheelhouse = get_wheelhouse_dir()
+	os.makedirs(wheelhouse, exist_ok=True)
+
+	with open(os.path.join(wheelhouse, ".lock"), "w") as lock_file:
+		fcntl.flock(lock_file, fcntl.LOCK_EX)
+		try:
+			yield
+		finally:
+			fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def parse_wheel_filename(wheel: str) -> Tuple[str, str]:
+	"""Returns the normalized name & version of the distribution in the wheel"""
+	from chair.utils.chair import normalize_package_name
+
+	name, version = wheel.split("-")[:2]
+	return normalize_package_name(name), version.lower()
+
+
+def build_wheels(python: str, packages: List[str], chair_path=".", verbose=False):
+	"""Builds wheels for the packages' dependencies that would be installed from
+	sdists, so that pip installs in any chair on the host find them instead of
+	compiling. Nothing is built if every dependency already has a wheel, and the
+	dependencies aren't resolved again until the packages' requirements change.
+
+	packages are pip requirement args, ie paths to apps & `-r requirements.txt`.
+	Failures are only warned about, pip install builds whatever is missing itself.
+	"""
+	if not (packages and use_wheelhouse(chair_path)):
+		return
+
+	wheelhouse = get_wheelhouse_dir()
+	add_wheelhouse_dependent(chair_path)
+	quiet = [] if verbose else ["--quiet"]
+	requirements_key = get_requirements_key(python, packages)
+
+	if requirements_key in get_resolved_requirements():
+		return
+
+	# wheels are built aside & moved in, so concurrent builds never expose partial files
+	with tempfile.TemporaryDirectory(prefix=".build-", dir=wheelhouse) as build_dir:
+		report_path = os.path.join(build_dir, "report.json")
+		cmd = [
+			python, "-m", "pip", "install", *quiet, "--dry-run", "--report", report_path,
+			"--prefer-binary", "--find-links", wheelhouse, *packages,
+		]
+
+		try:
+			# resolves without building, to find what pip install would build from sdists
+			subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+			with open(report_path) as f:
+				sdists = get_sdist_requirements(json.load(f))
+		except (OSError, ValueError, subprocess.CalledProcessError) as e:
+			logger.warning(f"Couldn't find the wheels missing from the wheelhouse: {e}")
+			return
+
+		if not sdists:
+			add_resolved_requirements(requirements_key)
+			return
+
+		cmd = [
+			python, "-m", "pip", "wheel", *quiet, "--no-deps", "--prefer-binary",
+			"--find-links", wheelhouse, "--wheel-dir", build_dir, *sdists,
+		]
+
+		try:
+			returncode = subprocess.run(cmd).returncode
+		except OSError as e:
+			logger.warning(f"Couldn't build wheels for the wheelhouse: {e}")
+			return
+
+		if returncode:
+			# wheels built before the failure are still worth keeping
+			logger.warning("Couldn't build all wheels for the wheelhouse")
+
+		for wheel in os.listdir(build_dir):
+			target = os.path.join(wheelhouse, wheel)
+			if wheel.endswith(".whl") and not os.path.exists(target):
+				os.replace(os.path.join(build_dir, wheel), target)
+
+		if not returncode:
+			add_resolved_requirements(requirements_key)
+
+
+def get_requirements_key(python: str, packages: List[str]) -> str:
+	"""Returns a key of the interpreter & the requirements of the packages. Apps are
+	keyed by their requirements hash & requirements files by their contents, so the
+	key changes when pip could resolve the packages to other distributions."""
+	from hashlib import sha256
+	from chair.utils.chair import get_requirements_hash
+
+	requirements_key = sha256(os.path.realpath(python).encode())
+
+	for package in packages:
+		if os.path.isdir(package):
+			requirements_key.update(get_requirements_hash(package).encode())
+		elif os.path.isfile(package):
+			with open(package, "rb") as f:
+				requirements_key.update(f.read())
+		else:
+			requirements_key.update(package.encode())
+
+	return requirements_key.hexdigest()
+
+
+def get_resolved_requirements() -> Set[str]:
+	try:
+		with open(os.path.join(get_wheelhouse_dir(), RESOLVED_FILE)) as f:
+			return {line.strip() for line in f if line.strip()}
+	except FileNotFoundError:
+		return set()
+
+
+def add_resolved_requirements(requirements_key: str):
+	with lock_wheelhouse():
+		with open(os.path.join(get_wheelhouse_dir(), RESOLVED_FILE), "a") as f:
+			f.write(f"{requirements_key}\n")
+
+
+def get_sdist_requirements(report: Dict) -> List[str]:
+	"""Returns pinned requirements for the distributions in a `pip install --report`
+	that would be built from sdists. Local paths, ie apps, aren't worth keeping as
+	wheels since they change with every commit."""
+	requirements = []
+
+	for item in report.get("install", []):
+		download_info = item.get("download_info", {})
+
+		if "archive_info" not in download_info or download_info.get("url", "").endswith(".whl"):
+			continue
+
+		metadata = item["metadata"]
+		requirements.append(f"{metadata['name']}=={metadata['version']}")
+
+	return requirements
+
+
+def add_wheelhouse_dependent(chair_path="."):
+	chair_path = os.path.abspath(chair_path)
+
+	with lock_wheelhouse():
+		if chair_path not in get_wheelhouse_dependents():
+			with open(os.path.join(get_wheelhouse_dir(), DEPENDENTS_FILE), "a") as f:
+				f.write(f"{chair_path}\n")
+
+
+def get_wheelhouse_dependents() -> List[str]:
+	try:
+		with open(os.path.join(get_wheelhouse_dir(), DEPENDENTS_FILE)) as f:
+			return [line.strip() for line in f if line.strip()]
+	except FileNotFoundError:
+		return []
+
+
+def get_installed_distributions(chair_path=".") -> Set[Tuple[str, str]]:
+	"""Returns the normalized names & versions of distributions in the chair's env"""
+	from chair.utils.chair import get_env_site_packages, normalize_package_name
+
+	distributions = set()
+
+	for site_packages in get_env_site_packages(chair_path):
+		for entry in os.listdir(site_packages):
+			if entry.endswith(".dist-info"):
+				name, _, version = entry[: -len(".dist-info")].rpartition("-")
+				distributions.add((normalize_package_name(name), version.lower()))
+
+	return distributions
+
+
+def prune_wheelhouse():
+	"""command: chair wheels prune
+
+	Forgets chairs that were removed & deletes wheels that aren't installed in the
+	env of any chair using the wheelhouse anymore."""
+	wheelhouse = get_wheelhouse_dir()
+
+	if not os.path.isdir(wheelhouse):
+		return
+
+	with lock_wheelhouse():
+		chairs = [
+			chair_path
+			for chair_path in get_wheelhouse_dependents()
+			if os.path.isdir(os.path.join(chair_path, "env"))
+		]
+		in_use = set()
+		for chair_path in chairs:
+			in_use.update(get_installed_distributions(chair_path))
+
+		with open(os.path.join(wheelhouse, DEPENDENTS_FILE), "w") as f:
+			f.writelines(f"{chair_path}\n" for chair_path in chairs)
+
+		wheels = [wheel for wheel in os.listdir(wheelhouse) if wheel.endswith(".whl")]
+		unused = [wheel for wheel in wheels if parse_wheel_filename(wheel) not in in_use]
+
+		for wheel in unused:
+			os.remove(os.path.join(wheelhouse, wheel))
+
+		if unused:
+			# requirements resolved earlier may need the removed wheels
+			with open(os.path.join(wheelhouse, RESOLVED_FILE), "w"):
+				pass
+
+	print(f"Removed {len(unused)} wheel(s), kept {len(wheels) - len(unused)} used by {len(chairs)} chair(s)")